@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Benchmark OID coverage analysis on a synthetic walk and MIB set.
+
+This script times SNMPMIBAnalyzer.analyze_oid_coverage from snmp-scanner.py,
+which uses a prefix index, against the previous linear scan over every MIB
+OID. The linear scan is only timed on a sample of the walk, and its time for
+the whole walk is estimated from it.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import time
+
+
+def load_scanner():
+    """Import snmp-scanner.py, whose name is not a valid module name."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snmp-scanner.py")
+    spec = importlib.util.spec_from_file_location("snmp_scanner", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_mib_oids(count, seed=0):
+    """
+    Build a MIB set of about `count` OIDs under the enterprises subtree.
+
+    Each vendor module defines tables, each with an entry and columns, as
+    snmptranslate lists them for real MIBs.
+    """
+    rng = random.Random(seed)
+    mib_oids = {}
+    vendor = 0
+    while len(mib_oids) < count:
+        vendor += 1
+        enterprise = f"1.3.6.1.4.1.{vendor * 7}"
+        mib_name = f"VENDOR{vendor}-MIB"
+        for module in range(1, rng.randint(2, 6)):
+            for table in range(1, rng.randint(2, 10)):
+                table_oid = f"{enterprise}.{module}.1.{table}"
+                mib_oids[table_oid] = {
+                    "mibs": [mib_name],
+                    "name": f"v{vendor}m{module}Table{table}",
+                }
+                mib_oids[f"{table_oid}.1"] = {
+                    "mibs": [mib_name],
+                    "name": f"v{vendor}m{module}Entry{table}",
+                }
+                for column in range(1, rng.randint(3, 20)):
+                    mib_oids[f"{table_oid}.1.{column}"] = {
+                        "mibs": [mib_name],
+                        "name": f"v{vendor}m{module}t{table}c{column}",
+                    }
+    return mib_oids
+
+
+def make_walk(mib_oids, count, uncovered=0.1, seed=0):
+    """
+    Build a walk of `count` agent OIDs in lexicographic order.
+
+    Rows of MIB table columns are covered; a fraction of the OIDs are under
+    enterprises that no MIB describes.
+    """
+    rng = random.Random(seed)
+    columns = [oid for oid, info in mib_oids.items() if oid.count(".") == 11]
+    agent_oids = []
+    while len(agent_oids) < count:
+        if rng.random() < uncovered:
+            base = f"1.3.6.1.4.1.{rng.randint(1, 10**6) * 7 + 3}.1.1.1.1"
+        else:
+            base = rng.choice(columns)
+        for index in range(1, rng.randint(2, 50)):
+            agent_oids.append({"oid": f"{base}.{index}", "value": str(index)})
+    del agent_oids[count:]
+    agent_oids.sort(
+        key=lambda agent_oid: tuple(int(arc) for arc in agent_oid["oid"].split("."))
+    )
+    return agent_oids
+
+
+def linear_coverage(mib_oids, agent_oids):
+    """The previous analysis: an exact lookup, then a scan over every MIB OID."""
+    covered = 0
+    for agent_oid in agent_oids:
+        oid = agent_oid["oid"]
+        if oid in mib_oids:
+            covered += 1
+            continue
+        for mib_oid in mib_oids:
+            if oid.startswith(mib_oid + "."):
+                covered += 1
+                break
+    return covered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OID coverage analysis")
+    parser.add_argument(
+        "--walk", type=int, default=500000, help="OIDs in the agent walk"
+    )
+    parser.add_argument(
+        "--mib-oids", type=int, default=100000, help="OIDs in the MIB set"
+    )
+    parser.add_argument(
+        "--linear-sample",
+        type=int,
+        default=200,
+        help="Agent OIDs timed with the linear scan (0 to skip it)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    scanner = load_scanner()
+    mib_oids = make_mib_oids(args.mib_oids)
+    agent_oids = make_walk(mib_oids, args.walk)
+
+    analyzer = scanner.SNMPMIBAnalyzer(host="localhost")
+    analyzer.mib_oids = mib_oids
+    analyzer.agent_oids = agent_oids
+
+    start = time.perf_counter()
+    for oid in mib_oids:
+        analyzer.mib_index.add(oid)
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = analyzer.analyze_oid_coverage()
+    analyze_seconds = time.perf_counter() - start
+
+    result = {
+        "walk_oids": len(agent_oids),
+        "mib_oids": len(mib_oids),
+        "covered": len(results["covered"]),
+        "uncovered": len(results["uncovered"]),
+        "index_build_seconds": round(index_seconds, 4),
+        "indexed_seconds": round(analyze_seconds, 4),
+    }
+
+    if args.linear_sample:
+        # Every stride-th OID, so the sample spans covered and uncovered OIDs
+        stride = max(1, len(agent_oids) // args.linear_sample)
+        sample = agent_oids[::stride][: args.linear_sample]
+        start = time.perf_counter()
+        linear_coverage(mib_oids, sample)
+        linear_seconds = time.perf_counter() - start
+        result["linear_sample_oids"] = len(sample)
+        result["linear_sample_seconds"] = round(linear_seconds, 4)
+        result["linear_estimated_seconds"] = round(
+            linear_seconds * len(agent_oids) / len(sample), 1
+        )
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"Walk: {result['walk_oids']} OIDs, MIB set: {result['mib_oids']} OIDs")
+    print(f"Covered: {result['covered']}, uncovered: {result['uncovered']}")
+    print(f"Index build:     {result['index_build_seconds']:>10.4f} s")
+    print(f"Indexed lookup:  {result['indexed_seconds']:>10.4f} s")
+    if args.linear_sample:
+        print(
+            f"Linear scan:     {result['linear_sample_seconds']:>10.4f} s "
+            f"for {result['linear_sample_oids']} OIDs, "
+            f"about {result['linear_estimated_seconds']} s for the walk"
+        )
+
+
+if __name__ == "__main__":
+    main()
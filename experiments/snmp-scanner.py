@@ -34,6 +34,63 @@ except ImportError as e:
     IMPORT_ERROR = str(e)
     traceback.print_exc()
 
+class OidPrefixIndex:
+    """
+    Trie of MIB OIDs for longest-prefix lookups of agent OIDs.
+
+    Each node is a dict keyed by the next arc of the OID, as written in the
+    OID string, so lookups only split the agent OID and never compare it
+    against every MIB OID. OIDs can be added at any time, including while
+    MIB files are still being read.
+    """
+
+    _END = None  # Key of the MIB OID that ends at a node
+
+    def __init__(self):
+        self._root = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, oid):
+        """
+        Add a MIB OID to the index.
+
+        Args:
+            oid (str): Numeric OID, such as 1.3.6.1.2.1.1.1
+        """
+        node = self._root
+        for arc in oid.strip('.').split('.'):
+            child = node.get(arc)
+            if child is None:
+                child = node[arc] = {}
+            node = child
+        if self._END not in node:
+            node[self._END] = oid
+            self._size += 1
+
+    def longest_prefix(self, oid):
+        """
+        Find the MIB OID that is the longest prefix of an agent OID.
+
+        Args:
+            oid (str): Numeric OID returned by the agent
+
+        Returns:
+            str: The MIB OID, equal to `oid` for an exact match, or None
+        """
+        end = self._END
+        node = self._root
+        match = None
+        for arc in oid.strip('.').split('.'):
+            node = node.get(arc)
+            if node is None:
+                break
+            match = node.get(end, match)
+        return match
+
+
 class SNMPMIBAnalyzer:
     def __init__(self, host, port=161, community='public', mib_dir=None, output_format='text'):
         """
@@ -52,6 +109,7 @@ class SNMPMIBAnalyzer:
         self.mib_dir = mib_dir if mib_dir else './mibs'
         self.output_format = output_format
         self.mib_oids = {}  # {oid: {mibs: [mib1, mib2], name: "name"}}
+        self.mib_index = OidPrefixIndex()  # Prefix index of the keys of mib_oids
         self.agent_oids = []
         
     def compile_mibs(self):
@@ -106,6 +164,7 @@ class SNMPMIBAnalyzer:
                     
                     if oid not in self.mib_oids:
                         self.mib_oids[oid] = {'mibs': [mib_name], 'name': name}
+                        self.mib_index.add(oid)
                     else:
                         if mib_name not in self.mib_oids[oid]['mibs']:
                             self.mib_oids[oid]['mibs'].append(mib_name)
@@ -150,7 +209,12 @@ class SNMPMIBAnalyzer:
         print(f"Retrieved {len(self.agent_oids)} OIDs from SNMP agent")
         
     def analyze_oid_coverage(self):
-        """Analyze OID coverage by comparing agent OIDs with MIB OIDs."""
+        """
+        Analyze OID coverage by comparing agent OIDs with MIB OIDs.
+
+        An agent OID is covered by the MIB OID equal to it, or else by the
+        longest MIB OID it is a child of.
+        """
         print("Analyzing OID coverage...")
         
         results = {
@@ -158,38 +222,32 @@ class SNMPMIBAnalyzer:
             'uncovered': []
         }
         
+        # Rebuild the index if mib_oids was filled without it
+        if len(self.mib_index) != len(self.mib_oids):
+            self.mib_index = OidPrefixIndex()
+            for mib_oid in self.mib_oids:
+                self.mib_index.add(mib_oid)
+        
         for agent_oid in self.agent_oids:
             oid = agent_oid['oid']
-            is_covered = False
-            
-            # Check for exact match
-            if oid in self.mib_oids:
-                results['covered'].append({
-                    'oid': oid,
-                    'value': agent_oid['value'],
-                    'mibs': self.mib_oids[oid]['mibs'],
-                    'name': self.mib_oids[oid]['name']
-                })
-                is_covered = True
-                continue
-            
-            # Check if the OID is a child of any MIB OID
-            for mib_oid in self.mib_oids:
-                if oid.startswith(mib_oid + '.'):
-                    results['covered'].append({
-                        'oid': oid,
-                        'value': agent_oid['value'],
-                        'mibs': self.mib_oids[mib_oid]['mibs'],
-                        'name': f"{self.mib_oids[mib_oid]['name']}-instance"
-                    })
-                    is_covered = True
-                    break
+            mib_oid = self.mib_index.longest_prefix(oid)
             
-            if not is_covered:
+            if mib_oid is None:
                 results['uncovered'].append({
                     'oid': oid,
                     'value': agent_oid['value']
                 })
+                continue
+            
+            mib_info = self.mib_oids[mib_oid]
+            # Exact match, or an instance of the MIB object
+            name = mib_info['name'] if mib_oid == oid else f"{mib_info['name']}-instance"
+            results['covered'].append({
+                'oid': oid,
+                'value': agent_oid['value'],
+                'mibs': mib_info['mibs'],
+                'name': name
+            })
         
         return results
     
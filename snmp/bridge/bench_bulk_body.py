@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark building bulk request bodies on a synthetic SNMP exporter response.
+This script serializes the documents for one scrape the way the writer used
+to, as a list of action and document dicts serialized by the Elasticsearch
+client, and with BulkBodyBuilder, and reports documents and bytes per second.
+It also reports the size and cost of gzipping the body at each level.
+"""
+
+import argparse
+import json
+import time
+
+from elasticsearch.serializer import NdjsonSerializer
+
+import bulk_body
+from bench_layout import parse_scrape
+from bench_parser import make_exporter_payload
+from bulk_body import BulkBodyBuilder, compress_body
+from elasticsearch_writer import TargetMappingPlan, build_metric_documents
+from label_intern import LabelInterner
+from runtime_schema import DocumentLayout, TargetConfig
+
+
+def dict_list_body(docs, index_name):
+    """Build the bulk body as a list of dicts and serialize it like the client."""
+    bulk_data = []
+    for doc in docs:
+        bulk_data.append({"index": {"_index": index_name}})
+        bulk_data.append(doc)
+    return NdjsonSerializer().dumps(bulk_data)
+
+
+def builder_body(docs, index_name, builder):
+    """Build the bulk body with a reused BulkBodyBuilder."""
+    for doc in docs:
+        builder.add(index_name, doc)
+    return builder.take()
+
+
+def time_method(name, build, docs, rounds):
+    """Build the body several times and report the best time."""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        body = build(docs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        "method": name,
+        "seconds": round(best, 4),
+        "documents_per_second": round(len(docs) / best),
+        "mb_per_second": round(len(body) / best / 1e6, 1),
+        "bytes": len(body),
+    }
+
+
+def time_compression(body, level, rounds):
+    """Gzip the body several times and report the best time and the ratio."""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        compressed = compress_body(body, level)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        "level": level,
+        "seconds": round(best, 4),
+        "mb_per_second": round(len(body) / best / 1e6, 1),
+        "bytes": len(compressed),
+        "ratio": round(len(body) / len(compressed), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk body building")
+    parser.add_argument(
+        "--interfaces", type=int, default=2000, help="Interfaces per device"
+    )
+    parser.add_argument(
+        "--layout",
+        choices=[layout.value for layout in DocumentLayout],
+        default=DocumentLayout.SERIES.value,
+        help="Document layout",
+    )
+    parser.add_argument("--rounds", type=int, default=5, help="Runs per method")
+    parser.add_argument(
+        "--levels",
+        type=int,
+        nargs="+",
+        default=[1, 3, 6, 9],
+        help="Gzip levels to compare",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    payload = make_exporter_payload(args.interfaces)
+    target_config = TargetConfig(exporter="snmp_exporter", interval=60, metrics=[])
+    plan = TargetMappingPlan(target_config, LabelInterner())
+    batch = parse_scrape(payload, plan.labels)
+    docs = build_metric_documents(
+        batch, target_config, {}, plan, DocumentLayout(args.layout)
+    )
+    index_name = plan.index_name
+    builder = BulkBodyBuilder(max_bytes=1 << 62)
+
+    results = [
+        time_method(
+            "dict list + client serializer",
+            lambda d: dict_list_body(d, index_name),
+            docs,
+            args.rounds,
+        ),
+        time_method(
+            "BulkBodyBuilder",
+            lambda d: builder_body(d, index_name, builder),
+            docs,
+            args.rounds,
+        ),
+    ]
+    encoder = "orjson" if bulk_body.orjson is not None else "json"
+    body = builder_body(docs, index_name, builder)
+    compression = [time_compression(body, level, args.rounds) for level in args.levels]
+
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "documents": len(docs),
+                    "encoder": encoder,
+                    "results": results,
+                    "compression": compression,
+                },
+                indent=2,
+            )
+        )
+        return
+
+    print(f"{len(docs)} documents, builder encoder: {encoder}")
+    print(f"{'method':<32} {'seconds':>8} {'docs/s':>10} {'MB/s':>7} {'bytes':>10}")
+    for result in results:
+        print(
+            f"{result['method']:<32} {result['seconds']:>8.4f} "
+            f"{result['documents_per_second']:>10} "
+            f"{result['mb_per_second']:>7} {result['bytes']:>10}"
+        )
+
+    print()
+    print(f"{'gzip level':<10} {'seconds':>8} {'MB/s':>7} {'bytes':>10} {'ratio':>6}")
+    for result in compression:
+        print(
+            f"{result['level']:<10} {result['seconds']:>8.4f} "
+            f"{result['mb_per_second']:>7} {result['bytes']:>10} {result['ratio']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
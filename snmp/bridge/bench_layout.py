@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark the document layouts on a synthetic SNMP exporter response.
+This script builds and serializes the documents for one scrape in each
+layout, and reports documents per second, bytes per sample and how many
+sample values survive in the documents.
+"""
+
+import argparse
+import json
+import time
+
+from bench_parser import chunks, make_exporter_payload
+from elasticsearch_writer import TargetMappingPlan, build_metric_documents
+from label_intern import LabelInterner
+from prometheus_stream import StreamingPrometheusParser
+from runtime_schema import DocumentLayout, TargetConfig
+
+
+def count_values(value) -> int:
+    """Count the leaf values in a metrics object."""
+    if isinstance(value, dict):
+        return sum(count_values(v) for v in value.values())
+    return 1
+
+
+def parse_scrape(payload, label_interner):
+    """Parse a payload into a sample batch, as the streaming scrape does."""
+    parser = StreamingPrometheusParser(label_interner=label_interner)
+    for chunk in chunks(payload):
+        parser.feed(chunk)
+    return parser.close_batch()
+
+
+def time_layout(layout, batch, target_config, plan, rounds):
+    """Build and serialize the documents several times and report the best time."""
+    metadata = {"observer": {"name": "snmp-bridge"}}
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        docs = build_metric_documents(batch, target_config, metadata, plan, layout)
+        body = b"".join(
+            json.dumps(doc, separators=(",", ":")).encode("utf-8") + b"\n"
+            for doc in docs
+        )
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        "layout": layout.value,
+        "documents": len(docs),
+        "seconds": round(best, 4),
+        "documents_per_second": round(len(docs) / best),
+        "bytes": len(body),
+        "bytes_per_sample": round(len(body) / len(batch), 2),
+        "values_kept": sum(count_values(doc["metrics"]) for doc in docs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document layouts")
+    parser.add_argument(
+        "--interfaces", type=int, default=2000, help="Interfaces per device"
+    )
+    parser.add_argument("--rounds", type=int, default=3, help="Runs per layout")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    payload = make_exporter_payload(args.interfaces)
+    target_config = TargetConfig(exporter="snmp_exporter", interval=60, metrics=[])
+    plan = TargetMappingPlan(target_config, LabelInterner())
+    batch = parse_scrape(payload, plan.labels)
+
+    results = [
+        time_layout(layout, batch, target_config, plan, args.rounds)
+        for layout in DocumentLayout
+    ]
+
+    if args.json:
+        print(json.dumps({"samples": len(batch), "results": results}, indent=2))
+        return
+
+    print(f"Scrape of {len(batch)} samples, {args.interfaces} interfaces")
+    print(
+        f"{'layout':<8} {'docs':>6} {'seconds':>9} {'docs/s':>9} "
+        f"{'bytes/sample':>13} {'values kept':>12}"
+    )
+    for result in results:
+        print(
+            f"{result['layout']:<8} {result['documents']:>6} "
+            f"{result['seconds']:>9.4f} {result['documents_per_second']:>9} "
+            f"{result['bytes_per_sample']:>13} {result['values_kept']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Measure the peak memory used to parse and index one large scrape.
+Each variant runs in its own process so that peak RSS is not shared
+between them. The payload is written to a file and read back before parsing
+starts, so the reported growth covers parsing and building documents only.
+"""
+
+import argparse
+import json
+import resource
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench_parser import INTERFACE_FAMILIES, chunks, make_exporter_payload
+
+VARIANTS = {
+    "prometheus_client": "parse_prometheus_metrics, one dict per sample",
+    "dicts": "streaming parser, one dict per sample",
+    "batch": "streaming parser, SampleBatch columns",
+}
+
+
+def peak_rss_kib() -> int:
+    """Peak resident set size of this process in KiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_variant(variant: str, payload_path: str) -> dict:
+    """Parse a payload file and report memory use."""
+    # Imported here so the module imports are counted in the baseline
+    from elasticsearch_writer import TargetMappingPlan, build_metric_documents
+    from prometheus_stream import StreamingPrometheusParser
+    from runtime_schema import TargetConfig
+    from test_snmp_fetch import parse_prometheus_metrics
+
+    with open(payload_path) as f:
+        payload = f.read()
+    target_config = TargetConfig(exporter="snmp_exporter", interval=60, metrics=[])
+    plan = TargetMappingPlan(target_config)
+    baseline = peak_rss_kib()
+
+    if variant == "prometheus_client":
+        metrics = parse_prometheus_metrics(payload, [])
+        sample_count = sum(len(v) for v in metrics.values())
+    else:
+        parser = StreamingPrometheusParser()
+        for chunk in chunks(payload):
+            parser.feed(chunk)
+        metrics = parser.close() if variant == "dicts" else parser.close_batch()
+        sample_count = len(parser.batch)
+    parsed = peak_rss_kib()
+
+    docs = build_metric_documents(metrics, target_config, {}, plan)
+    peak = peak_rss_kib()
+
+    return {
+        "variant": variant,
+        "samples": sample_count,
+        "documents": len(docs),
+        "baseline_kib": baseline,
+        "parse_kib": parsed - baseline,
+        "total_kib": peak - baseline,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--samples", type=int, default=100000, help="Samples in the scrape"
+    )
+    parser.add_argument(
+        "--variant", choices=sorted(VARIANTS), help="Run one variant in this process"
+    )
+    parser.add_argument("--payload", help="Payload file for --variant")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.payload)))
+        return
+
+    interfaces = max(1, args.samples // len(INTERFACE_FAMILIES))
+    with tempfile.NamedTemporaryFile("w", suffix=".prom", delete=False) as f:
+        f.write(make_exporter_payload(interfaces))
+
+    results = []
+    try:
+        for variant in VARIANTS:
+            output = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, "--payload", f.name],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        os.unlink(f.name)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Scrape of {results[0]['samples']} samples, peak RSS growth in MiB")
+    print(f"{'variant':<20}{'parse':>10}{'total':>10}  description")
+    for result in results:
+        print(
+            f"{result['variant']:<20}"
+            f"{result['parse_kib'] / 1024:>10.1f}"
+            f"{result['total_kib'] / 1024:>10.1f}  {VARIANTS[result['variant']]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark the process-pool parsing stage on synthetic SNMP exporter responses.
+This script turns the responses of many large targets into bulk bodies,
+in-process and with increasing numbers of worker processes, and reports
+the throughput and speedup of each.
+"""
+
+import argparse
+import json
+import os
+import time
+
+from bench_parser import make_exporter_payload
+from parse_pool import ParsePool, parse_to_bulk_body
+from runtime_schema import DocumentLayout, MetricConfig, ParserMode, TargetConfig
+
+
+def default_worker_counts():
+    """Powers of two up to the number of CPUs."""
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    return counts
+
+
+def make_targets(count, metric_paths):
+    """Build target configurations that share one set of metrics."""
+    metrics = [MetricConfig(name=path, path=path) for path in metric_paths]
+    return {
+        f"device-{i}": TargetConfig(
+            exporter="snmp_exporter", interval=60, metrics=metrics
+        )
+        for i in range(count)
+    }
+
+
+def run_round(workers, targets, payloads, parser_mode, layout):
+    """Build the bulk bodies for every target and report the time taken."""
+    tasks = [
+        (name, target_config, payloads[i % len(payloads)], {}, parser_mode, layout)
+        for i, (name, target_config) in enumerate(targets.items())
+    ]
+
+    if workers == 0:
+        start = time.perf_counter()
+        results = [parse_to_bulk_body(*task) for task in tasks]
+        return time.perf_counter() - start, results
+
+    pool = ParsePool(workers)
+    try:
+        # Start the worker processes before timing
+        warm = [pool.submit(*task[:2], "", {}) for task in tasks[:workers]]
+        for future in warm:
+            future.result()
+
+        start = time.perf_counter()
+        futures = [pool.submit(*task) for task in tasks]
+        results = [future.result() for future in futures]
+        return time.perf_counter() - start, results
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the parse pool")
+    parser.add_argument("--targets", type=int, default=16, help="Targets per round")
+    parser.add_argument(
+        "--interfaces", type=int, default=1000, help="Interfaces per device"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Worker counts to compare (default: powers of two up to the CPU count)",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=[mode.value for mode in ParserMode],
+        default=ParserMode.STREAMING.value,
+        help="Parser mode",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=[layout.value for layout in DocumentLayout],
+        default=DocumentLayout.SERIES.value,
+        help="Document layout",
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="+",
+        default=["sysUpTime", "ifHC*", "ifOperStatus", "ifInErrors", "ifOutErrors"],
+        help="Configured metric paths",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    targets = make_targets(args.targets, args.metrics)
+    payloads = [make_exporter_payload(args.interfaces, device) for device in range(4)]
+    input_bytes = sum(len(payloads[i % len(payloads)]) for i in range(len(targets)))
+    parser_mode = ParserMode(args.parser)
+    layout = DocumentLayout(args.layout)
+
+    results = []
+    baseline = None
+    for workers in [0] + (args.workers or default_worker_counts()):
+        seconds, bodies = run_round(workers, targets, payloads, parser_mode, layout)
+        baseline = baseline or seconds
+        results.append(
+            {
+                "workers": workers,
+                "seconds": round(seconds, 3),
+                "targets_per_second": round(len(targets) / seconds, 1),
+                "input_mb_per_second": round(input_bytes / seconds / 1e6, 1),
+                "documents": sum(count for _, count in bodies),
+                "output_bytes": sum(len(body) for body, _ in bodies),
+                "speedup": round(baseline / seconds, 2),
+            }
+        )
+
+    if args.json:
+        print(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2))
+        return
+
+    print(
+        f"{len(targets)} targets x {args.interfaces} interfaces, "
+        f"{input_bytes / 1e6:.1f} MB of responses, {os.cpu_count()} CPUs"
+    )
+    print(f"{'workers':>8} {'seconds':>9} {'targets/s':>10} {'MB/s':>7} {'speedup':>8}")
+    for result in results:
+        label = result["workers"] or "inline"
+        print(
+            f"{label:>8} {result['seconds']:>9.3f} "
+            f"{result['targets_per_second']:>10} "
+            f"{result['input_mb_per_second']:>7} {result['speedup']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Prometheus parsers on a synthetic SNMP exporter response.
+This script compares parse_prometheus_metrics with the streaming parser,
+with and without an allow-list, and with label sets interned by an earlier
+scrape.
+"""
+
+import argparse
+import json
+import time
+
+from label_intern import LabelInterner
+from prometheus_stream import (
+    StreamingPrometheusParser,
+    build_allow_list,
+    parse_prometheus_stream,
+)
+from runtime_schema import MetricConfig
+from test_snmp_fetch import parse_prometheus_metrics
+
+# Per-interface families reported by the snmp_exporter if_mib module
+INTERFACE_FAMILIES = [
+    ("ifHCInOctets", "counter"),
+    ("ifHCOutOctets", "counter"),
+    ("ifHCInUcastPkts", "counter"),
+    ("ifHCOutUcastPkts", "counter"),
+    ("ifHCInMulticastPkts", "counter"),
+    ("ifHCOutMulticastPkts", "counter"),
+    ("ifHCInBroadcastPkts", "counter"),
+    ("ifHCOutBroadcastPkts", "counter"),
+    ("ifInDiscards", "counter"),
+    ("ifOutDiscards", "counter"),
+    ("ifInErrors", "counter"),
+    ("ifOutErrors", "counter"),
+    ("ifInUnknownProtos", "counter"),
+    ("ifAdminStatus", "gauge"),
+    ("ifOperStatus", "gauge"),
+    ("ifHighSpeed", "gauge"),
+    ("ifMtu", "gauge"),
+    ("ifLastChange", "gauge"),
+    ("ifPromiscuousMode", "gauge"),
+    ("ifConnectorPresent", "gauge"),
+]
+
+
+def make_exporter_payload(interfaces: int, device: int = 0) -> str:
+    """Build an snmp_exporter style response for a device with N interfaces."""
+    lines = [
+        "# HELP sysUpTime The time since the system was last re-initialized.",
+        "# TYPE sysUpTime gauge",
+        f"sysUpTime {1000000 + device}",
+    ]
+    for family, typ in INTERFACE_FAMILIES:
+        lines.append(f"# HELP {family} {family} - 1.3.6.1.2.1.31.1.1.1")
+        lines.append(f"# TYPE {family} {typ}")
+        for index in range(1, interfaces + 1):
+            lines.append(
+                f'{family}{{ifAlias="uplink-{index}",ifDescr="GigabitEthernet0/{index}",'
+                f'ifIndex="{index}",ifName="Gi0/{index}"}} {index * 1000 + device}'
+            )
+    lines.append("# HELP snmp_scrape_duration_seconds Total SNMP time scrape took.")
+    lines.append("# TYPE snmp_scrape_duration_seconds gauge")
+    lines.append('snmp_scrape_duration_seconds{module="if_mib"} 0.52')
+    return "\n".join(lines) + "\n"
+
+
+def time_parser(label, parse, rounds):
+    """Run a parser several times and report the best time."""
+    best = None
+    samples = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        metrics = parse()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        samples = sum(len(v) for v in metrics.values())
+    return {"parser": label, "seconds": round(best, 4), "samples": samples}
+
+
+def chunks(text, size=64 * 1024):
+    """Split text into chunks, as read from an HTTP response."""
+    return (text[i : i + size] for i in range(0, len(text), size))
+
+
+def parse_all_families(payload, metric_configs, label_interner=None):
+    """Parse every family with the streaming parser."""
+    parser = StreamingPrometheusParser(
+        None, (m.name for m in metric_configs), label_interner=label_interner
+    )
+    for chunk in chunks(payload):
+        parser.feed(chunk)
+    return parser.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Prometheus parsers")
+    parser.add_argument(
+        "--interfaces", type=int, default=2000, help="Interfaces per device"
+    )
+    parser.add_argument("--rounds", type=int, default=3, help="Runs per parser")
+    parser.add_argument(
+        "--metrics",
+        nargs="+",
+        default=["sysUpTime", "ifHCInOctets", "ifHCOutOctets", "ifOperStatus"],
+        help="Configured metric paths",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    payload = make_exporter_payload(args.interfaces)
+    metric_configs = [MetricConfig(name=path, path=path) for path in args.metrics]
+    allow_list = build_allow_list(metric_configs)
+
+    # Label sets interned by an earlier scrape of the same device
+    label_interner = LabelInterner()
+    parse_all_families(payload, metric_configs, label_interner)
+
+    results = [
+        time_parser(
+            "prometheus_client",
+            lambda: parse_prometheus_metrics(payload, metric_configs),
+            args.rounds,
+        ),
+        time_parser(
+            "streaming (all families)",
+            lambda: parse_all_families(payload, metric_configs),
+            args.rounds,
+        ),
+        time_parser(
+            "streaming (interned labels)",
+            lambda: parse_all_families(payload, metric_configs, label_interner),
+            args.rounds,
+        ),
+        time_parser(
+            "streaming (allow-list)",
+            lambda: parse_prometheus_stream(
+                chunks(payload), metric_configs, allow_list
+            ),
+            args.rounds,
+        ),
+    ]
+
+    if args.json:
+        print(json.dumps({"bytes": len(payload), "results": results}, indent=2))
+        return
+
+    print(f"Payload: {len(payload)} bytes, {args.interfaces} interfaces")
+    print(f"{'parser':<30} {'seconds':>9} {'samples':>9}")
+    for result in results:
+        print(
+            f"{result['parser']:<30} {result['seconds']:>9.4f} {result['samples']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Benchmark the whole scrape pipeline against local stand-ins.
+This script serves synthetic responses for N devices with M interfaces
+each from a fake SNMP exporter, scrapes them through the bridge's
+ScrapePipeline (fetch, parse, document build and bulk indexing) into a fake
+Elasticsearch, and reports throughput, scrape and flush latency and peak
+memory. Results can be saved as JSON and compared with an earlier run.
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from elasticsearch import Elasticsearch
+
+from bulk_indexer import create_bulk_indexer
+from exporter_client import ExporterClientPool
+from fake_elasticsearch import FakeElasticsearch
+from fake_exporter import FakeExporter
+from parse_pool import ParsePool
+from runtime_schema import DocumentLayout, ParserMode, RuntimeConfig
+from scrape_pipeline import ScrapePipeline
+
+# Results compared by --compare, with whether higher is better
+COMPARED = {
+    "scrapes_per_second": True,
+    "documents_per_second": True,
+    "input_mb_per_second": True,
+    "scrape_p50_ms": False,
+    "scrape_p99_ms": False,
+    "flush_p50_ms": False,
+    "flush_p99_ms": False,
+    "peak_rss_mib": False,
+}
+
+
+def make_config(args, exporter_url: str) -> RuntimeConfig:
+    """Build a runtime configuration with one target per device."""
+    return RuntimeConfig.model_validate(
+        {
+            "version": "1.0",
+            "exporters": {"snmp_exporter": {"type": "snmp", "url": exporter_url}},
+            "targets": {
+                f"device-{i}": {
+                    "exporter": "snmp_exporter",
+                    "interval": 60,
+                    "module": "if_mib",
+                    "target": f"10.0.{i // 256}.{i % 256}",
+                    "metrics": [{"name": path, "path": path} for path in args.metrics],
+                }
+                for i in range(args.devices)
+            },
+            "global": {
+                "concurrency": args.concurrency,
+                "parser": args.parser,
+                "elasticsearch": {
+                    "auth": {"username": "bench", "password": "bench"},
+                    "layout": args.layout,
+                    "compression_level": args.compression_level,
+                },
+            },
+        }
+    )
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of values, or 0 if it is empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def peak_rss_mib() -> float:
+    """Peak resident set size of this process in MiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def scrape_rounds(pipeline, target_names, rounds, concurrency):
+    """Scrape every target `rounds` times. Returns the traces."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def scrape(target_name):
+        async with semaphore:
+            return await pipeline.scrape(target_name)
+
+    traces = []
+    for _ in range(rounds):
+        traces.extend(await asyncio.gather(*(scrape(t) for t in target_names)))
+    return traces
+
+
+def run_benchmark(args) -> Dict[str, float]:
+    """Run the pipeline against the stand-ins and measure it."""
+    with (
+        FakeExporter(
+            interfaces=args.interfaces,
+            distinct_devices=args.distinct_devices,
+            delay=args.exporter_delay,
+        ) as exporter,
+        FakeElasticsearch(index_cost=args.index_cost) as fake_es,
+    ):
+        config = make_config(args, exporter.url)
+        es_client = Elasticsearch(fake_es.url)
+        bulk_indexer = create_bulk_indexer(es_client, config)
+        flush_seconds: List[float] = []
+        bulk_indexer.flush_observers.append(
+            lambda seconds, doc_count: flush_seconds.append(seconds)
+        )
+        parse_pool = ParsePool(args.parse_workers) if args.parse_workers else None
+
+        async def run():
+            exporter_pool = ExporterClientPool(limit=args.concurrency)
+            pipeline = ScrapePipeline(
+                config, exporter_pool, bulk_indexer, parse_pool=parse_pool
+            )
+            try:
+                return await scrape_rounds(
+                    pipeline, list(config.targets), args.rounds, args.concurrency
+                )
+            finally:
+                await exporter_pool.close()
+
+        bulk_indexer.start()
+        start = time.perf_counter()
+        try:
+            traces = asyncio.run(run())
+        finally:
+            # Wait for the queued documents to be indexed
+            bulk_indexer.close()
+            elapsed = time.perf_counter() - start
+            if parse_pool is not None:
+                parse_pool.close()
+            es_client.close()
+
+        scrape_ms = [trace.duration * 1000 for trace in traces]
+        flush_ms = [seconds * 1000 for seconds in flush_seconds]
+        return {
+            "seconds": round(elapsed, 3),
+            "scrapes": len(traces),
+            "scrape_errors": sum(1 for trace in traces if trace.error),
+            "documents": fake_es.stats["documents"],
+            "bulk_requests": fake_es.stats["bulk_requests"],
+            "input_bytes": exporter.stats["bytes"],
+            "scrapes_per_second": round(len(traces) / elapsed, 1),
+            "documents_per_second": round(fake_es.stats["documents"] / elapsed, 1),
+            "input_mb_per_second": round(exporter.stats["bytes"] / elapsed / 1e6, 2),
+            "scrape_p50_ms": round(percentile(scrape_ms, 0.5), 2),
+            "scrape_p99_ms": round(percentile(scrape_ms, 0.99), 2),
+            "flush_p50_ms": round(percentile(flush_ms, 0.5), 2),
+            "flush_p99_ms": round(percentile(flush_ms, 0.99), 2),
+            "peak_rss_mib": round(peak_rss_mib(), 1),
+        }
+
+
+def print_comparison(results: Dict[str, float], baseline: Dict[str, float]) -> None:
+    """Print the change of each compared result from a baseline run."""
+    print(f"{'result':<22} {'baseline':>12} {'this run':>12} {'change':>9}")
+    for key, higher_is_better in COMPARED.items():
+        before, after = baseline.get(key), results[key]
+        if not before:
+            change = "n/a"
+        else:
+            delta = (after - before) / before
+            better = delta > 0 if higher_is_better else delta < 0
+            change = f"{delta:+.1%}{'' if better or not delta else ' !'}"
+        shown = "-" if before is None else before
+        print(f"{key:<22} {shown:>12} {after:>12} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrape pipeline")
+    parser.add_argument("--devices", type=int, default=50, help="Number of devices")
+    parser.add_argument(
+        "--interfaces", type=int, default=48, help="Interfaces per device"
+    )
+    parser.add_argument("--rounds", type=int, default=3, help="Scrapes per device")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="Concurrent scrapes"
+    )
+    parser.add_argument(
+        "--distinct-devices",
+        type=int,
+        default=8,
+        help="Different responses served by the fake exporter",
+    )
+    parser.add_argument(
+        "--exporter-delay",
+        type=float,
+        default=0.0,
+        help="Seconds the fake exporter waits before answering",
+    )
+    parser.add_argument(
+        "--index-cost",
+        type=float,
+        default=0.0,
+        help="Seconds the fake Elasticsearch takes per document",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=[mode.value for mode in ParserMode],
+        default=ParserMode.STREAMING.value,
+        help="Parser mode",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=[layout.value for layout in DocumentLayout],
+        default=DocumentLayout.SERIES.value,
+        help="Document layout",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=0,
+        help="Worker processes for parsing (0 parses in the bridge process)",
+    )
+    parser.add_argument(
+        "--compression-level", type=int, default=0, help="Bulk gzip level"
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="+",
+        default=["sysUpTime", "ifHC*", "ifOperStatus", "ifInErrors", "ifOutErrors"],
+        help="Configured metric paths",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--output", help="Write the parameters and results to a file")
+    parser.add_argument("--compare", help="Compare with the results of an earlier run")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "parameters": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("json", "output", "compare")
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+
+    if args.json:
+        print(json.dumps(run, indent=2))
+    else:
+        print(
+            f"{args.devices} devices x {args.interfaces} interfaces, "
+            f"{args.rounds} rounds, {args.parser} parser, {args.layout} layout"
+        )
+        for key, value in results.items():
+            print(f"{key:<22} {value:>12}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with the run of {baseline.get('timestamp', 'unknown')}:")
+        print_comparison(results, baseline["results"])
+
+
+if __name__ == "__main__":
+    main()
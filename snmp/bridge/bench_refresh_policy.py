@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark the indexing rate of each bulk refresh policy.
+This script writes synthetic scrapes through write_metrics_to_elasticsearch
+to a local Elasticsearch stand-in, once per refresh policy.
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, UTC
+
+from elasticsearch import Elasticsearch
+
+from elasticsearch_writer import write_metrics_to_elasticsearch
+from fake_elasticsearch import FakeElasticsearch
+from runtime_schema import TargetConfig
+
+REFRESH_POLICIES = {"none": False, "wait_for": "wait_for", "true": True}
+
+
+def make_scrape(samples: int):
+    """Build parsed metrics for one scrape with the given number of samples."""
+    timestamp = datetime.now(UTC).isoformat()
+    return {
+        f"ifHCInOctets{i}": [
+            {
+                "name": f"ifHCInOctets{i}",
+                "labels": {"ifIndex": str(i)},
+                "value": float(i),
+                "timestamp": timestamp,
+                "is_configured": False,
+            }
+        ]
+        for i in range(samples)
+    }
+
+
+def run_policy(url, policy, args, target_config, metrics):
+    """Write every target's scrapes with one refresh policy. Returns docs/sec."""
+    client = Elasticsearch(url)
+    refresh = REFRESH_POLICIES[policy]
+
+    def write(_):
+        return write_metrics_to_elasticsearch(
+            client, metrics, target_config, {}, refresh
+        )
+
+    writes = args.targets * args.rounds
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        docs = sum(executor.map(write, range(writes)))
+    elapsed = time.perf_counter() - start
+    client.close()
+    return {
+        "policy": policy,
+        "documents": docs,
+        "seconds": round(elapsed, 3),
+        "docs_per_second": round(docs / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk refresh policies")
+    parser.add_argument("--targets", type=int, default=50, help="Number of targets")
+    parser.add_argument("--rounds", type=int, default=4, help="Scrapes per target")
+    parser.add_argument("--samples", type=int, default=200, help="Samples per scrape")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="Concurrent writers"
+    )
+    parser.add_argument(
+        "--refresh-cost", type=float, default=0.05, help="Seconds per forced refresh"
+    )
+    parser.add_argument(
+        "--refresh-interval", type=float, default=1.0, help="Index refresh interval"
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    target_config = TargetConfig.model_validate(
+        {"exporter": "snmp_exporter", "interval": 60, "metrics": []}
+    )
+    metrics = make_scrape(args.samples)
+
+    results = []
+    with FakeElasticsearch(
+        refresh_cost=args.refresh_cost, refresh_interval=args.refresh_interval
+    ) as fake_es:
+        for policy in REFRESH_POLICIES:
+            results.append(
+                run_policy(fake_es.url, policy, args, target_config, metrics)
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'policy':<10} {'documents':>10} {'seconds':>9} {'docs/s':>10}")
+    for result in results:
+        print(
+            f"{result['policy']:<10} {result['documents']:>10} "
+            f"{result['seconds']:>9.2f} {result['docs_per_second']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
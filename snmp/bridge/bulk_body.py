@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Bulk request bodies for the SNMP Bridge.
+This module serializes documents straight into the NDJSON body of a bulk
+request, so that the Elasticsearch client sends the bytes as they are
+instead of serializing a list of dicts again.
+"""
+
+import gzip
+import json
+import logging
+from typing import Any, Dict, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library
+    orjson = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Largest body sent in one bulk request, below Elasticsearch's default
+# http.max_content_length of 100 MB
+DEFAULT_MAX_REQUEST_BYTES = 20 * 1024 * 1024
+
+
+def encode_document(doc: Dict[str, Any]) -> bytes:
+    """
+    Serialize a document as one compact JSON line, ending in a newline.
+
+    Uses orjson when it is installed. orjson writes NaN and infinite values
+    as null; the json module writes them as NaN and Infinity, which
+    Elasticsearch rejects.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            doc, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(doc, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class BulkBodyBuilder:
+    """
+    Build bulk request bodies in a byte buffer.
+
+    Each document is written as an action line and a document line. Action
+    lines are encoded once per index and then reused. A body holds at most
+    `max_bytes` bytes; `add` returns False when a document would not fit, and
+    the caller sends the body with `take` and adds the document again. A
+    single document larger than `max_bytes` is still accepted into an empty
+    body, since it cannot be split.
+
+    The builder is meant to be kept and reused for every request.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_REQUEST_BYTES):
+        """
+        Initialize the builder.
+
+        Args:
+            max_bytes: Maximum size of a request body in bytes
+        """
+        self.max_bytes = max_bytes
+        self.doc_count = 0
+        self._buffer = bytearray()
+        self._actions: Dict[str, bytes] = {}
+
+    def __len__(self) -> int:
+        """Size of the body built so far, in bytes."""
+        return len(self._buffer)
+
+    def action_line(self, index_name: str) -> bytes:
+        """Get the encoded action line for an index."""
+        action = self._actions.get(index_name)
+        if action is None:
+            action = encode_document({"index": {"_index": index_name}})
+            self._actions[index_name] = action
+        return action
+
+    def add(self, index_name: str, doc: Dict[str, Any]) -> bool:
+        """Serialize and add a document. Returns False if it does not fit."""
+        return self.add_line(index_name, encode_document(doc))
+
+    def add_line(
+        self, index_name: Optional[str], line: bytes, doc_count: int = 1
+    ) -> bool:
+        """
+        Add a serialized document line. Returns False if it does not fit.
+
+        With `index_name` None, `line` is taken to be a complete bulk body of
+        `doc_count` documents with their own action lines, as returned by
+        `parse_pool.parse_to_bulk_body`.
+        """
+        action = b"" if index_name is None else self.action_line(index_name)
+        size = len(action) + len(line)
+        if self._buffer and len(self._buffer) + size > self.max_bytes:
+            return False
+        if size > self.max_bytes:
+            logger.warning(
+                f"Sending {doc_count} documents of {size} bytes in one bulk "
+                f"request, over the limit of {self.max_bytes} bytes"
+            )
+
+        self._buffer += action
+        self._buffer += line
+        self.doc_count += doc_count
+        return True
+
+    def take(self) -> bytes:
+        """Return the body built so far and empty the builder."""
+        body = bytes(self._buffer)
+        self._buffer.clear()
+        self.doc_count = 0
+        return body
+
+
+def compress_body(body: bytes, level: int) -> bytes:
+    """Gzip a request body at the given level (1-9)."""
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def send_bulk_body(
+    es_client, body: bytes, refresh: Union[bool, str], compressed: bool = False
+) -> Dict[str, Any]:
+    """
+    Send a bulk request body and return the response.
+
+    With `compressed`, `body` must already be gzipped by `compress_body`; it
+    is sent with a `Content-Encoding: gzip` header. The client itself should
+    not have `http_compress` set, or the body would be compressed twice.
+    """
+    if not compressed:
+        return es_client.bulk(operations=body, refresh=refresh)
+
+    # The client's NDJSON serializer appends a newline to a bytes body, which
+    # would corrupt the gzip stream. Its JSON serializer, which Elasticsearch
+    # also accepts for bulk requests, passes the bytes through unchanged.
+    if isinstance(refresh, bool):
+        refresh = "true" if refresh else "false"
+    return es_client.perform_request(
+        "PUT",
+        "/_bulk",
+        params={"refresh": refresh},
+        headers={
+            "accept": "application/json",
+            "content-type": "application/json",
+            "content-encoding": "gzip",
+        },
+        body=body,
+        endpoint_id="bulk",
+    )
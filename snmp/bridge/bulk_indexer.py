@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Buffered bulk indexer for the SNMP Bridge.
+This module queues documents from every target and indexes them in the
+background, flushing on document count, body size or elapsed time.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from bulk_body import (
+    DEFAULT_MAX_REQUEST_BYTES,
+    BulkBodyBuilder,
+    compress_body,
+    encode_document,
+    send_bulk_body,
+)
+from bulk_retry import (
+    BulkResult,
+    RetryPolicy,
+    SendRateLimiter,
+    get_retry_policy,
+    send_with_retries,
+)
+from elasticsearch_writer import get_compression_level, get_refresh_param
+from runtime_schema import BulkConfig, RuntimeConfig, SpoolConfig
+from spool import DiskSpool
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Marker put on the queue to stop the flush thread
+_STOP = object()
+
+
+class BulkIndexer:
+    """
+    Queue documents and index them with the bulk API from a background thread.
+
+    A batch is flushed when it reaches `max_documents` documents or
+    `max_bytes` bytes, or when `flush_interval` seconds have passed since the
+    last flush. The queue holds at most `max_queue_documents` entries (a
+    document, or a pre-serialized body from `add_raw`); `add` blocks when it
+    is full, which pushes back on the scrapes that produce the documents.
+
+    A batch is serialized into one body of at most `max_request_bytes`
+    bytes; a larger batch, such as one holding a big pre-serialized body, is
+    split over several bulk requests.
+
+    With a `compression_level` above 0, each request body is gzipped at that
+    level. The bytes before and after compression and the time spent
+    compressing are logged for every request and added up in `stats`.
+
+    Documents rejected with a retryable status (429, 502, 503 or 504), and
+    whole requests that fail with one or with a connection error, are sent
+    again following `retry_policy`. Throttling also slows down later
+    requests through a `SendRateLimiter`; while the flush thread waits, the
+    queue fills and the scrapes are held back in turn.
+
+    With a `spool`, documents that still cannot be sent after the retries,
+    because Elasticsearch is unreachable or keeps throttling, are written to
+    disk instead of being dropped. They are sent again from the flush thread
+    at up to `replay_bytes_per_second`, one spooled body at a time between
+    live batches, so that replay never holds up new documents for long.
+
+    `refresh` is passed to every bulk request. It defaults to False, leaving
+    refreshes to the index refresh interval.
+
+    Each of `flush_observers` is called from the flush thread with the
+    duration in seconds of each flush, including retries, and its number of
+    documents.
+
+    An unexpected error while flushing, such as a full disk under the spool,
+    drops the documents concerned and counts them in `documents_dropped`;
+    the flush thread keeps running, so `add` never blocks on a dead thread.
+    """
+
+    def __init__(
+        self,
+        es_client,
+        max_documents: int = 500,
+        max_bytes: int = 5 * 1024 * 1024,
+        flush_interval: float = 5.0,
+        max_queue_documents: int = 10000,
+        refresh: Union[bool, str] = False,
+        max_request_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        compression_level: int = 0,
+        retry_policy: Optional[RetryPolicy] = None,
+        spool: Optional[DiskSpool] = None,
+        replay_bytes_per_second: int = 1024 * 1024,
+    ):
+        self.es_client = es_client
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = SendRateLimiter()
+        self.spool = spool
+        self.replay_bytes_per_second = replay_bytes_per_second
+        self._next_replay = 0.0
+        self.refresh = refresh
+        self.compression_level = compression_level
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self._builder = BulkBodyBuilder(max_request_bytes)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_documents)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.flush_observers: List[Callable[[float, int], None]] = []
+        self.stats = {
+            "documents_indexed": 0,
+            "documents_failed": 0,
+            "flushes": 0,
+            "retries": 0,
+            "documents_spooled": 0,
+            "documents_replayed": 0,
+            "documents_dropped": 0,
+            "bytes_uncompressed": 0,
+            "bytes_sent": 0,
+            "compression_seconds": 0.0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of entries waiting in the queue; a raw body counts as one."""
+        return self._queue.qsize()
+
+    @property
+    def spool_depth(self) -> int:
+        """Number of documents waiting in the spool (0 without a spool)."""
+        return self.spool.depth_documents if self.spool is not None else 0
+
+    def start(self) -> None:
+        """Start the background flush thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="bulk-indexer", daemon=True
+        )
+        self._thread.start()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush all queued documents and stop the flush thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        if self.spool is not None:
+            self.spool.close()
+
+    def update_config(self, config: RuntimeConfig, es_client=None) -> None:
+        """
+        Apply new batching and refresh settings, and optionally a new client.
+
+        The changes take effect from the next flush. The queue size and the
+        spool location cannot be changed while running.
+        """
+        bulk_config = get_bulk_config(config)
+        self.max_documents = bulk_config.max_documents
+        self.max_bytes = bulk_config.max_bytes
+        self.flush_interval = bulk_config.flush_interval
+        self._builder.max_bytes = bulk_config.max_request_bytes
+        self.refresh = get_refresh_param(config)
+        self.compression_level = get_compression_level(config)
+        self.retry_policy = get_retry_policy(config)
+        spool_config = get_spool_config(config)
+        if spool_config is not None:
+            self.replay_bytes_per_second = spool_config.replay_bytes_per_second
+        if es_client is not None:
+            self.es_client = es_client
+
+    def add(self, index_name: str, doc: Dict[str, Any]) -> None:
+        """
+        Queue a document for indexing.
+
+        The document is serialized straight away so the flush thread only has
+        to join lines together. Blocks while the queue is full.
+        """
+        self._queue.put((index_name, encode_document(doc), 1))
+
+    def offer(self, index_name: str, doc: Dict[str, Any]) -> bool:
+        """
+        Queue a document if there is room, without blocking.
+
+        Returns False if the queue is full and the document was dropped. This
+        is for best-effort documents such as traces, and is safe to call from
+        the flush thread itself.
+        """
+        try:
+            self._queue.put_nowait((index_name, encode_document(doc), 1))
+        except queue.Full:
+            return False
+        return True
+
+    def add_raw(self, body: bytes, doc_count: int) -> None:
+        """
+        Queue a pre-serialized bulk body of `doc_count` documents.
+
+        The body must already hold an action line before each document, as
+        returned by `parse_pool.parse_to_bulk_body`. It is sent whole in one
+        bulk request and takes a single place in the queue. Blocks while the
+        queue is full.
+        """
+        if doc_count:
+            self._queue.put((None, body, doc_count))
+
+    def add_documents(self, index_name: str, docs: Iterable[Dict[str, Any]]) -> int:
+        """Queue several documents for the same index. Returns the count."""
+        count = 0
+        for doc in docs:
+            self.add(index_name, doc)
+            count += 1
+        return count
+
+    def _run(self) -> None:
+        """Collect queued documents into batches and flush them."""
+        batch: List[Tuple[Optional[str], bytes, int]] = []
+        batch_docs = 0
+        batch_bytes = 0
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            wake = deadline
+            if self.spool is not None and len(self.spool):
+                wake = min(wake, self._next_replay)
+            try:
+                item = self._queue.get(timeout=max(0.0, wake - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush_safely(batch, batch_docs)
+                return
+
+            if item is not None:
+                batch.append(item)
+                batch_docs += item[2]
+                batch_bytes += len(item[1])
+
+            full = batch_docs >= self.max_documents or batch_bytes >= self.max_bytes
+            if full or time.monotonic() >= deadline:
+                self._flush_safely(batch, batch_docs)
+                batch = []
+                batch_docs = 0
+                batch_bytes = 0
+                deadline = time.monotonic() + self.flush_interval
+
+            if self.spool is not None and time.monotonic() >= self._next_replay:
+                try:
+                    self._replay()
+                except Exception as e:
+                    # The body stays in the spool and is tried again later
+                    logger.error(f"Failed to replay spooled documents: {str(e)}")
+                    self._next_replay = (
+                        time.monotonic() + self.retry_policy.retry_interval
+                    )
+
+    def _flush_safely(
+        self, batch: List[Tuple[Optional[str], bytes, int]], doc_count: int
+    ) -> None:
+        """Flush a batch, dropping it if flushing fails unexpectedly."""
+        try:
+            self._flush(batch)
+        except Exception as e:
+            logger.error(f"Dropped a batch of {doc_count} documents: {str(e)}")
+            self._builder.take()
+            self._drop(doc_count)
+
+    def _flush(self, batch: List[Tuple[Optional[str], bytes, int]]) -> None:
+        """Send a batch of serialized documents, split by the request size."""
+        builder = self._builder
+        for index_name, data, count in batch:
+            if not builder.add_line(index_name, data, count):
+                self._send(builder.doc_count, builder.take())
+                builder.add_line(index_name, data, count)
+        if builder.doc_count:
+            self._send(builder.doc_count, builder.take())
+
+    def _send(self, doc_count: int, body: bytes) -> None:
+        """Send one bulk request body, with retries."""
+        before = self._byte_stats()
+        start = time.monotonic()
+        try:
+            result = send_with_retries(
+                self._send_body, body, doc_count, self.retry_policy, self.rate_limiter
+            )
+        except Exception as e:
+            logger.error(f"Dropped {doc_count} documents after an error: {str(e)}")
+            self._drop(doc_count)
+            return
+        spooled = dropped = 0
+        try:
+            spooled = self._spool_unsent(result)
+        except OSError as e:
+            logger.error(f"Failed to spool unsent documents: {str(e)}")
+            dropped = result.unsent_count
+            self._drop(dropped)
+        self._record(
+            result.indexed, result.not_indexed - spooled - dropped, result.retries
+        )
+
+        uncompressed, sent, compression_seconds = (
+            after - before for after, before in zip(self._byte_stats(), before)
+        )
+        size = f"{uncompressed} bytes"
+        if uncompressed != sent:
+            size += f", {sent} gzipped in {compression_seconds * 1000:.1f} ms"
+        if result.retries:
+            size += f", {result.retries} retries"
+        if spooled:
+            size += f", {spooled} spooled"
+        if dropped:
+            size += f", {dropped} dropped"
+        elapsed = time.monotonic() - start
+        for observer in self.flush_observers:
+            try:
+                observer(elapsed, doc_count)
+            except Exception as e:
+                logger.warning(f"Flush observer failed: {str(e)}")
+        logger.info(f"Flushed {doc_count} documents ({size}) in {elapsed:.2f} seconds")
+
+    def _spool_unsent(self, result: BulkResult) -> int:
+        """Write the documents that could not be sent to the spool, if any."""
+        if self.spool is None or not result.unsent_count:
+            return 0
+        self.spool.append(result.unsent, result.unsent_count)
+        with self._lock:
+            self.stats["documents_spooled"] += result.unsent_count
+        # Elasticsearch is struggling; leave the spool alone for a while
+        self._next_replay = time.monotonic() + self.retry_policy.retry_interval
+        return result.unsent_count
+
+    def _replay(self) -> None:
+        """Send the oldest spooled body, if Elasticsearch will take it."""
+        record = self.spool.peek()
+        if record is None:
+            return
+
+        body, doc_count = record
+        result = send_with_retries(
+            self._send_body, body, doc_count, RetryPolicy(retries=0), self.rate_limiter
+        )
+        if result.unsent_count == doc_count:
+            # Still unavailable; try again later
+            self._next_replay = time.monotonic() + self.retry_policy.retry_interval
+            return
+
+        self.spool.pop()
+        if result.unsent_count:
+            try:
+                self.spool.append(result.unsent, result.unsent_count)
+            except OSError as e:
+                logger.error(
+                    f"Dropped {result.unsent_count} documents that could not be "
+                    f"spooled again: {str(e)}"
+                )
+                self._drop(result.unsent_count)
+        self._record(result.indexed, result.failed, flush=False)
+        with self._lock:
+            self.stats["documents_replayed"] += result.indexed
+        self._next_replay = time.monotonic() + len(body) / self.replay_bytes_per_second
+        logger.info(
+            f"Replayed {result.indexed} spooled documents; "
+            f"{self.spool.depth_documents} left in the spool"
+        )
+
+    def _send_body(self, body: bytes) -> Dict[str, Any]:
+        """Send a bulk request body, compressing it if configured."""
+        level = self.compression_level
+        compress_start = time.monotonic()
+        data = compress_body(body, level) if level else body
+        compression_seconds = time.monotonic() - compress_start
+        with self._lock:
+            self.stats["bytes_uncompressed"] += len(body)
+            self.stats["bytes_sent"] += len(data)
+            self.stats["compression_seconds"] += compression_seconds
+
+        return send_bulk_body(
+            self.es_client, data, self.refresh, compressed=bool(level)
+        )
+
+    def _byte_stats(self) -> Tuple[int, int, float]:
+        """Get the byte and compression statistics."""
+        with self._lock:
+            return (
+                self.stats["bytes_uncompressed"],
+                self.stats["bytes_sent"],
+                self.stats["compression_seconds"],
+            )
+
+    def _drop(self, doc_count: int) -> None:
+        """Count documents dropped after an unexpected error."""
+        with self._lock:
+            self.stats["documents_dropped"] += doc_count
+
+    def _record(
+        self, indexed: int, failed: int, retries: int = 0, flush: bool = True
+    ) -> None:
+        """Update the flush statistics."""
+        with self._lock:
+            self.stats["documents_indexed"] += indexed
+            self.stats["documents_failed"] += failed
+            self.stats["flushes"] += int(flush)
+            self.stats["retries"] += retries
+
+
+def get_bulk_config(config: RuntimeConfig) -> BulkConfig:
+    """Get the batching settings from the configuration, or the defaults."""
+    bulk_config = None
+    if config.global_ and config.global_.elasticsearch:
+        bulk_config = config.global_.elasticsearch.bulk
+    return bulk_config or BulkConfig()
+
+
+def get_spool_config(config: RuntimeConfig) -> Optional[SpoolConfig]:
+    """Get the spool settings from the configuration, if a spool is configured."""
+    if config.global_ and config.global_.elasticsearch:
+        return config.global_.elasticsearch.spool
+    return None
+
+
+def create_bulk_indexer(es_client, config: RuntimeConfig) -> BulkIndexer:
+    """Create a bulk indexer using the batching settings in the configuration."""
+    bulk_config = get_bulk_config(config)
+
+    spool = None
+    replay_bytes_per_second = 1024 * 1024
+    spool_config = get_spool_config(config)
+    if spool_config is not None:
+        spool = DiskSpool(
+            spool_config.path,
+            max_bytes=spool_config.max_bytes,
+            segment_bytes=spool_config.segment_bytes,
+        )
+        replay_bytes_per_second = spool_config.replay_bytes_per_second
+
+    return BulkIndexer(
+        es_client,
+        max_documents=bulk_config.max_documents,
+        max_bytes=bulk_config.max_bytes,
+        flush_interval=bulk_config.flush_interval,
+        max_queue_documents=bulk_config.max_queue_documents,
+        refresh=get_refresh_param(config),
+        max_request_bytes=bulk_config.max_request_bytes,
+        compression_level=get_compression_level(config),
+        retry_policy=get_retry_policy(config),
+        spool=spool,
+        replay_bytes_per_second=replay_bytes_per_second,
+    )
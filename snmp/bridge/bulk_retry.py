@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Retries for bulk requests in the SNMP Bridge.
+This module resends the documents of a bulk request that failed for a
+reason worth retrying, such as a full write queue on the cluster, with
+exponential backoff and jitter. It also slows down the rate of bulk
+requests while the cluster is pushing back.
+"""
+
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from elasticsearch import ApiError, ConnectionTimeout
+from elasticsearch import ConnectionError as ESConnectionError
+
+from runtime_schema import RuntimeConfig
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Statuses that mean the cluster is busy or briefly unavailable, so the same
+# documents may succeed later. Others, such as mapping errors, never will.
+RETRYABLE_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class RetryPolicy:
+    """
+    Number of retries and the backoff between them.
+
+    The delay before retry n (from 0) is drawn uniformly between 0 and
+    `retry_interval * 2**n`, capped at `max_interval` ("full jitter"), so
+    that bridges throttled at the same time do not retry in step.
+    """
+
+    def __init__(
+        self,
+        retries: int = 3,
+        retry_interval: float = 5.0,
+        max_interval: float = 60.0,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Initialize the policy.
+
+        Args:
+            retries: Number of retries after the first attempt
+            retry_interval: Base delay in seconds
+            max_interval: Largest delay in seconds
+            rng: Random number generator for the jitter
+        """
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self.max_interval = max_interval
+        self._rng = rng or random.Random()
+
+    def delay(self, attempt: int) -> float:
+        """Get the delay in seconds before retry `attempt` (from 0)."""
+        ceiling = min(self.max_interval, self.retry_interval * (2**attempt))
+        return self._rng.uniform(0, ceiling)
+
+
+def get_retry_policy(config: RuntimeConfig) -> RetryPolicy:
+    """Get the retry policy from the global settings, or the defaults."""
+    if config.global_:
+        return RetryPolicy(config.global_.retries, config.global_.retry_interval)
+    return RetryPolicy()
+
+
+class SendRateLimiter:
+    """
+    Additive-increase, multiplicative-decrease limit on the bulk request rate.
+
+    The limiter keeps a minimum interval between requests, which starts at
+    zero (no limit). Each throttled request doubles it, up to `max_interval`,
+    and each successful request shortens it by `recovery_step` seconds, so
+    the rate drops quickly when the cluster pushes back and recovers
+    gradually once it accepts requests again.
+    """
+
+    def __init__(
+        self,
+        initial_interval: float = 0.1,
+        max_interval: float = 30.0,
+        recovery_step: float = 0.05,
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            initial_interval: Interval set by the first throttled request
+            max_interval: Largest interval between requests in seconds
+            recovery_step: Seconds taken off the interval per success
+        """
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.recovery_step = recovery_step
+        self.interval = 0.0
+        self._next_send = 0.0
+
+    def wait(self) -> None:
+        """Sleep until the next request may be sent."""
+        now = time.monotonic()
+        if now < self._next_send:
+            time.sleep(self._next_send - now)
+            now = self._next_send
+        self._next_send = now + self.interval
+
+    def throttled(self) -> None:
+        """Slow down after the cluster pushed back."""
+        self.interval = min(
+            self.max_interval, max(self.initial_interval, self.interval * 2)
+        )
+
+    def succeeded(self) -> None:
+        """Speed up after a request went through without being throttled."""
+        self.interval = max(0.0, self.interval - self.recovery_step)
+
+
+def split_bulk_body(body: bytes) -> List[bytes]:
+    """
+    Split a bulk body into one action and document line pair per document.
+
+    Only bodies of index actions, which always have a document line, can be
+    split; serialized JSON never contains a raw newline.
+    """
+    lines = body.split(b"\n")
+    return [
+        lines[i] + b"\n" + lines[i + 1] + b"\n" for i in range(0, len(lines) - 1, 2)
+    ]
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether a failed bulk request may succeed if it is sent again."""
+    if isinstance(error, (ESConnectionError, ConnectionTimeout)):
+        return True
+    return isinstance(error, ApiError) and error.meta.status in RETRYABLE_STATUSES
+
+
+class BulkResult:
+    """Outcome of sending a bulk body with retries."""
+
+    def __init__(self):
+        self.indexed = 0
+        self.failed = 0
+        self.retries = 0
+        self.unsent = b""
+        self.unsent_count = 0
+
+    @property
+    def not_indexed(self) -> int:
+        """Number of documents that were not indexed, for whatever reason."""
+        return self.failed + self.unsent_count
+
+
+def send_with_retries(
+    send: Callable[[bytes], Dict[str, Any]],
+    body: bytes,
+    doc_count: int,
+    policy: RetryPolicy,
+    limiter: Optional[SendRateLimiter] = None,
+) -> BulkResult:
+    """
+    Send a bulk body, retrying the documents that failed with a retryable
+    status and the whole body after a retryable request error.
+
+    `send` sends one body and returns the bulk response. In the result,
+    `failed` counts the documents rejected for good, such as by a mapping
+    error. Documents that could still not be sent when the retries ran out
+    are returned in `unsent`, as a bulk body of `unsent_count` documents, so
+    that the caller can keep them for later.
+    """
+    result = BulkResult()
+
+    while True:
+        if limiter:
+            limiter.wait()
+
+        try:
+            response = send(body)
+        except Exception as e:
+            retryable = is_retryable_error(e)
+            if retryable and limiter:
+                limiter.throttled()
+            if retryable and result.retries < policy.retries:
+                delay = policy.delay(result.retries)
+                logger.warning(
+                    f"Error writing {doc_count} documents to Elasticsearch: {e}; "
+                    f"retrying in {delay:.1f} seconds"
+                )
+                time.sleep(delay)
+                result.retries += 1
+                continue
+            logger.error(f"Error writing {doc_count} documents to Elasticsearch: {e}")
+            if retryable:
+                result.unsent = body
+                result.unsent_count = doc_count
+            else:
+                result.failed += doc_count
+            return result
+
+        retry_positions = []
+        error_count = 0
+        if response["errors"]:
+            for i, item in enumerate(response["items"]):
+                item_result = next(iter(item.values()))
+                if "error" not in item_result:
+                    continue
+                if item_result.get("status") in RETRYABLE_STATUSES:
+                    retry_positions.append(i)
+                    continue
+                if error_count < 5:  # Only log the first 5 errors
+                    logger.error(f"Error for document {i}: {item_result['error']}")
+                error_count += 1
+            if error_count:
+                logger.error(
+                    f"Errors occurred during bulk indexing: {error_count} documents failed"
+                )
+
+        result.indexed += doc_count - error_count - len(retry_positions)
+        result.failed += error_count
+        if not retry_positions:
+            if limiter:
+                limiter.succeeded()
+            return result
+
+        # Resend only the documents that were throttled
+        if limiter:
+            limiter.throttled()
+        docs = split_bulk_body(body)
+        body = b"".join(docs[i] for i in retry_positions)
+        doc_count = len(retry_positions)
+        if result.retries >= policy.retries:
+            logger.error(
+                f"{doc_count} documents were still throttled after "
+                f"{result.retries} retries"
+            )
+            result.unsent = body
+            result.unsent_count = doc_count
+            return result
+
+        delay = policy.delay(result.retries)
+        logger.warning(
+            f"{doc_count} documents were throttled; retrying in {delay:.1f} seconds"
+        )
+        time.sleep(delay)
+        result.retries += 1
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Runtime configuration change detection for the SNMP Bridge.
+This module polls the runtime configuration index cheaply, and only fetches
+and parses the configuration when the latest document has changed. It also
+compares two configurations so that a reload can be applied as a diff.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional, Set, Tuple
+
+from elasticsearch.exceptions import NotFoundError
+
+from runtime_schema import RuntimeConfig
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_INDEX = ".hedgehog-snmp-runtime-config"
+
+# Sort used to find the latest configuration document
+LATEST_CONFIG_SORT = [{"@timestamp": {"order": "desc"}}]
+
+
+def hash_config_data(config_data: Dict[str, Any]) -> str:
+    """Hash the contents of a configuration, ignoring key order."""
+    encoded = json.dumps(config_data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class RuntimeConfigWatcher:
+    """
+    Detect changes to the runtime configuration stored in Elasticsearch.
+
+    Each poll asks only for the id, sequence number and primary term of the
+    latest configuration document, without its source. The document is
+    fetched and parsed only when that version has changed, and the parsed
+    configuration is only returned when its contents differ from the last
+    one, so re-uploading an identical configuration is not a change.
+
+    Whether the index exists is checked once and then remembered until a
+    search reports it missing.
+    """
+
+    def __init__(self, es_client, index_name: str = DEFAULT_CONFIG_INDEX):
+        """
+        Initialize the watcher.
+
+        Args:
+            es_client: Elasticsearch client for the configuration index
+            index_name: Name of the runtime configuration index
+        """
+        self.es_client = es_client
+        self.index_name = index_name
+        self.version: Optional[Tuple[str, int, int]] = None
+        self.content_hash: Optional[str] = None
+        self._index_exists = False
+        self.stats = {"polls": 0, "fetches": 0, "changes": 0}
+
+    def poll(self) -> Optional[RuntimeConfig]:
+        """
+        Check for a new runtime configuration.
+
+        Returns the new configuration if it has changed since the last poll,
+        otherwise None. Errors are logged and also return None.
+        """
+        self.stats["polls"] += 1
+        try:
+            if not self._index_exists:
+                if not self.es_client.indices.exists(index=self.index_name):
+                    logger.error(
+                        f"Runtime configuration index {self.index_name} does not exist"
+                    )
+                    return None
+                self._index_exists = True
+
+            hit = self._latest_hit()
+            if hit is None:
+                logger.error("No runtime configuration found in Elasticsearch")
+                return None
+
+            version = (hit["_id"], hit["_seq_no"], hit["_primary_term"])
+            if version == self.version:
+                return None
+
+            # The latest document changed; fetch it by id so it is the same one
+            self.stats["fetches"] += 1
+            document = self.es_client.get(index=self.index_name, id=hit["_id"])
+            return self._load(version, document["_source"])
+
+        except NotFoundError:
+            self._index_exists = False
+            logger.error(f"Runtime configuration index {self.index_name} not found")
+            return None
+        except Exception as e:
+            logger.error(f"Error loading runtime configuration from Elasticsearch: {e}")
+            return None
+
+    def _latest_hit(self) -> Optional[Dict[str, Any]]:
+        """Find the version of the latest configuration document."""
+        response = self.es_client.search(
+            index=self.index_name,
+            size=1,
+            sort=LATEST_CONFIG_SORT,
+            source=False,
+            seq_no_primary_term=True,
+        )
+        hits = response["hits"]["hits"]
+        return hits[0] if hits else None
+
+    def _load(
+        self, version: Tuple[str, int, int], config_doc: Dict[str, Any]
+    ) -> Optional[RuntimeConfig]:
+        """Parse a configuration document if its contents have changed."""
+        if "config" not in config_doc:
+            logger.error(
+                "Invalid runtime configuration document: missing 'config' field"
+            )
+            return None
+
+        content_hash = hash_config_data(config_doc["config"])
+        if content_hash == self.content_hash:
+            logger.debug(
+                "Runtime configuration document changed but its contents did not"
+            )
+            self.version = version
+            return None
+
+        config = RuntimeConfig.model_validate(config_doc["config"])
+        self.version = version
+        self.content_hash = content_hash
+        self.stats["changes"] += 1
+        logger.info(
+            f"Loaded runtime configuration version {config.version} from Elasticsearch"
+        )
+        return config
+
+
+class ConfigDiff:
+    """Differences between two runtime configurations."""
+
+    def __init__(
+        self,
+        added_targets: Set[str],
+        removed_targets: Set[str],
+        changed_targets: Set[str],
+        unchanged_targets: Set[str],
+        changed_exporters: Set[str],
+        removed_exporters: Set[str],
+        global_changed: bool,
+        elasticsearch_changed: bool,
+        sharding_changed: bool = False,
+    ):
+        self.added_targets = added_targets
+        self.removed_targets = removed_targets
+        self.changed_targets = changed_targets
+        self.unchanged_targets = unchanged_targets
+        self.changed_exporters = changed_exporters
+        self.removed_exporters = removed_exporters
+        self.global_changed = global_changed
+        self.elasticsearch_changed = elasticsearch_changed
+        self.sharding_changed = sharding_changed
+
+    @property
+    def empty(self) -> bool:
+        """Whether the configurations are equivalent."""
+        return not (
+            self.added_targets
+            or self.removed_targets
+            or self.changed_targets
+            or self.changed_exporters
+            or self.removed_exporters
+            or self.global_changed
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.added_targets)} added, {len(self.removed_targets)} removed, "
+            f"{len(self.changed_targets)} changed, "
+            f"{len(self.unchanged_targets)} unchanged targets; "
+            f"{len(self.changed_exporters) + len(self.removed_exporters)} exporters "
+            f"changed; global settings {'changed' if self.global_changed else 'unchanged'}"
+        )
+
+
+def diff_runtime_config(old: RuntimeConfig, new: RuntimeConfig) -> ConfigDiff:
+    """Compare two runtime configurations target by target."""
+    old_names = set(old.targets)
+    new_names = set(new.targets)
+    common = old_names & new_names
+    changed = {name for name in common if old.targets[name] != new.targets[name]}
+
+    old_es = old.global_.elasticsearch if old.global_ else None
+    new_es = new.global_.elasticsearch if new.global_ else None
+    old_sharding = old.global_.sharding if old.global_ else None
+    new_sharding = new.global_.sharding if new.global_ else None
+
+    return ConfigDiff(
+        added_targets=new_names - old_names,
+        removed_targets=old_names - new_names,
+        changed_targets=changed,
+        unchanged_targets=common - changed,
+        changed_exporters={
+            name
+            for name in set(old.exporters) & set(new.exporters)
+            if old.exporters[name] != new.exporters[name]
+        }
+        | (set(new.exporters) - set(old.exporters)),
+        removed_exporters=set(old.exporters) - set(new.exporters),
+        global_changed=old.global_ != new.global_,
+        elasticsearch_changed=old_es != new_es,
+        sharding_changed=old_sharding != new_sharding,
+    )
+
+
+def carry_over_unchanged(
+    old: RuntimeConfig, new: RuntimeConfig, diff: ConfigDiff
+) -> RuntimeConfig:
+    """
+    Reuse the target and exporter objects of the old configuration where
+    they have not changed.
+
+    Caches keyed on those objects, such as compiled mapping plans and
+    exporter sessions, then see the same object and skip their comparisons.
+    """
+    for name in diff.unchanged_targets:
+        new.targets[name] = old.targets[name]
+    for name in set(old.exporters) & set(new.exporters):
+        if name not in diff.changed_exporters:
+            new.exporters[name] = old.exporters[name]
+    return new
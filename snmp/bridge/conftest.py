@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Shared test helpers for the SNMP Bridge tests.
+"""
+
+import pytest
+
+
+class FakeClock:
+    """Clock that only moves when told to."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fake_clock(request):
+    """
+    A clock for components that take a `clock` argument.
+
+    unittest test cases cannot take fixtures as arguments, so the clock is
+    also set as their `clock` attribute, before `setUp` runs.
+    """
+    clock = FakeClock()
+    if request.instance is not None:
+        request.instance.clock = clock
+    return clock
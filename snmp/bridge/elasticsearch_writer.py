@@ -5,12 +5,17 @@ This module provides functionality to write metrics to Elasticsearch.
 """
 
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union
 
 from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import ApiError
 
-from runtime_schema import RuntimeConfig, ECSFieldType
+from bulk_body import BulkBodyBuilder, compress_body, send_bulk_body
+from bulk_retry import RetryPolicy, send_with_retries
+from label_intern import LabelInterner, merge_label_sets
+from prometheus_stream import build_allow_list
+from runtime_schema import RuntimeConfig, ECSFieldType, RefreshPolicy, DocumentLayout
+from sample_batch import SampleBatch
 
 # Configure logging
 logging.basicConfig(
@@ -84,6 +89,40 @@ def create_elasticsearch_client(config: RuntimeConfig) -> Optional[Elasticsearch
         return None
 
 
+def get_refresh_param(config: RuntimeConfig) -> Union[bool, str]:
+    """
+    Get the bulk API refresh parameter for the configured refresh policy.
+
+    Defaults to no refresh, which leaves it to the index refresh interval and
+    is the cheapest option under steady ingest.
+    """
+    policy = RefreshPolicy.NONE
+    if config.global_ and config.global_.elasticsearch:
+        policy = config.global_.elasticsearch.refresh
+
+    if policy == RefreshPolicy.TRUE:
+        return True
+    if policy == RefreshPolicy.WAIT_FOR:
+        return "wait_for"
+    return False
+
+
+def get_compression_level(config: RuntimeConfig) -> int:
+    """Get the gzip level for bulk request bodies (0 for no compression)."""
+    if config.global_ and config.global_.elasticsearch:
+        return config.global_.elasticsearch.compression_level
+    return 0
+
+
+def get_document_layout(config: RuntimeConfig, target_config: Any) -> DocumentLayout:
+    """Get the document layout for a target, falling back to the global setting."""
+    if getattr(target_config, "layout", None):
+        return target_config.layout
+    if config.global_ and config.global_.elasticsearch:
+        return config.global_.elasticsearch.layout
+    return DocumentLayout.MERGED
+
+
 def get_ecs_value(metric_data: Dict[str, Any], ecs_mapping: Dict[str, Any]) -> Any:
     """
     Extract the appropriate value for ECS mapping based on the metric type.
@@ -233,166 +272,468 @@ def create_ecs_document(
     return doc
 
 
-def write_metrics_to_elasticsearch(
-    es_client,
-    metrics: Dict[str, List[Dict[str, Any]]],
-    target_config: Any,
-    global_metadata: Dict[str, Any],
-) -> int:
+def get_target_index(target_config: Any) -> str:
+    """Get the index name from the target config or use the default."""
+    return target_config.index or "hedgehog-snmp-metrics"
+
+
+def coerce_metric_value(value: Any) -> Any:
     """
-    Write metrics to Elasticsearch.
+    Convert a metric value to the type it should be indexed as.
 
-    This function will group all metrics by collection time and target,
-    creating a single document with multiple metrics inside it.
+    Strings holding booleans or numbers are converted; everything else is
+    returned unchanged.
+    """
+    if isinstance(value, str):
+        # Try to convert string to appropriate type
+        if value.lower() in ["true", "false"]:
+            return value.lower() == "true"
+        try:
+            # Try to convert to int or float
+            if "." in value:
+                return float(value)
+            return int(value)
+        except ValueError:
+            # Keep as string if conversion fails
+            return value
+    return value
 
-    Returns the number of documents successfully indexed.
+
+# Fields for the extra samples of summaries and histograms in the series layout
+SAMPLE_SUFFIX_FIELDS = {"_count": "count", "_sum": "sum", "_bucket": "bucket"}
+
+# Field for the quantile samples of summaries in the series layout
+QUANTILE_FIELD = "value"
+
+
+class MetricPlan:
+    """Compiled mapping of one metric to its field in the document."""
+
+    __slots__ = ("name", "field", "parents", "leaf", "coerce")
+
+    def __init__(self, name: str, field: str):
+        self.name = name
+        self.field = field
+        path = tuple(field.split("."))
+        self.parents = path[:-1]
+        self.leaf = path[-1]
+        self.coerce = coerce_metric_value
+
+
+class TargetMappingPlan:
     """
-    if not metrics:
-        logger.warning("No metrics to write to Elasticsearch")
-        return 0
+    Compiled metric mapping for a target.
 
-    # Get target metadata
-    target_metadata = target_config.metadata or {}
+    Field paths are resolved once when the plan is built, so building a
+    document only needs dict lookups. The plan also holds the allow-list used
+    by the streaming parser, and the label interner shared by the parser and
+    the writer. Metrics that are not configured are mapped automatically and
+    added to the plan the first time they are seen.
+    """
 
-    # Get index name from target config or use default
-    index_name = target_config.index or "hedgehog-snmp-metrics"
+    def __init__(self, target_config: Any, labels: Optional[LabelInterner] = None):
+        self.target_config = target_config
+        self.labels = labels if labels is not None else LabelInterner()
+        self.index_name = get_target_index(target_config)
+        self.allow_list = build_allow_list(target_config.metrics)
+        self.configured_names = frozenset(m.name for m in target_config.metrics or [])
+        self.metrics: Dict[str, MetricPlan] = {}
+        self.samples: Dict[str, MetricPlan] = {}
+        self.quantiles: Dict[str, MetricPlan] = {}
+
+        for metric_config in target_config.metrics or []:
+            if getattr(metric_config, "ecs_mapping", None):
+                field_name = metric_config.ecs_mapping.field
+            else:
+                field_name = get_ecs_field_from_metric_name(metric_config.name)
+            self.metrics[metric_config.name] = MetricPlan(
+                metric_config.name, field_name
+            )
+
+    def get(self, metric_name: str) -> MetricPlan:
+        """Get the plan for a metric, compiling an automatic mapping if needed."""
+        plan = self.metrics.get(metric_name)
+        if plan is None:
+            plan = MetricPlan(metric_name, get_ecs_field_from_metric_name(metric_name))
+            self.metrics[metric_name] = plan
+        return plan
+
+    def get_sample(self, metric_name: str, sample_name: str) -> MetricPlan:
+        """
+        Get the plan for a sample name within a metric family.
+
+        `_count`, `_sum` and `_bucket` samples map to a sub-field of the
+        metric's field, so they do not overwrite each other. Other samples,
+        such as counters with a `_total` suffix, use the metric's field.
+        """
+        plan = self.samples.get(sample_name)
+        if plan is None:
+            metric_plan = self.get(metric_name)
+            suffix = sample_name[len(metric_name) :]
+            sub_field = SAMPLE_SUFFIX_FIELDS.get(suffix)
+            if sub_field and sample_name.startswith(metric_name):
+                plan = MetricPlan(sample_name, f"{metric_plan.field}.{sub_field}")
+            else:
+                plan = metric_plan
+            self.samples[sample_name] = plan
+        return plan
+
+    def get_quantile(self, metric_name: str) -> MetricPlan:
+        """
+        Get the plan for the quantile samples of a summary.
+
+        Quantiles are named like the summary itself, but its `_sum` and
+        `_count` samples make the metric's field an object, so quantiles map
+        to a `value` sub-field next to them and keep their `quantile` label.
+        """
+        plan = self.quantiles.get(metric_name)
+        if plan is None:
+            field = self.get(metric_name).field
+            plan = MetricPlan(metric_name, f"{field}.{QUANTILE_FIELD}")
+            self.quantiles[metric_name] = plan
+        return plan
+
+
+class MappingPlanCache:
+    """
+    Compiled mapping plans for every target, keyed by target name.
+
+    Plans are kept across scrapes and only rebuilt when the target's
+    configuration changes. A rebuilt plan keeps the target's label interner.
+    """
+
+    def __init__(self, label_cache_size: int = 10000):
+        self.label_cache_size = label_cache_size
+        self._plans: Dict[str, TargetMappingPlan] = {}
+
+    def update(self, config: RuntimeConfig) -> None:
+        """Rebuild plans for changed targets and drop plans for removed ones."""
+        if config.global_:
+            self.label_cache_size = config.global_.label_cache_size
+        for plan in self._plans.values():
+            if plan.labels.max_label_sets != self.label_cache_size:
+                plan.labels.resize(self.label_cache_size)
+
+        for target_name in list(self._plans):
+            if target_name not in config.targets:
+                del self._plans[target_name]
+        for target_name, target_config in config.targets.items():
+            self.get(target_name, target_config)
+
+    def get(self, target_name: str, target_config: Any) -> TargetMappingPlan:
+        """Get the plan for a target, rebuilding it if the target has changed."""
+        plan = self._plans.get(target_name)
+        if plan is not None:
+            if plan.target_config is target_config:
+                return plan
+            if plan.target_config == target_config:
+                # Same settings from a reloaded configuration
+                plan.target_config = target_config
+                return plan
+            logger.info(f"Rebuilding mapping plan for changed target {target_name}")
+            labels = plan.labels
+        else:
+            labels = LabelInterner(self.label_cache_size)
 
-    # Create a mapping of configured metrics for quick lookup
-    metric_configs_map = (
-        {m.name: m for m in target_config.metrics} if target_config.metrics else {}
-    )
+        plan = TargetMappingPlan(target_config, labels)
+        self._plans[target_name] = plan
+        return plan
 
+
+def _group_metric_samples(
+    metrics: Dict[str, List[Dict[str, Any]]], plan: TargetMappingPlan
+) -> Dict:
+    """
+    Group per-sample dicts by timestamp.
+
+    Returns a (metric entries, label sets) pair for each timestamp.
+    """
     # Group metrics by timestamp (they should all have the same timestamp in a single scrape)
     # but we'll group just in case
     metrics_by_timestamp = {}
 
     # Process all metrics
     for metric_name, metric_data_list in metrics.items():
+        metric_plan = plan.get(metric_name)
+        coerce = metric_plan.coerce
         for metric_data in metric_data_list:
             timestamp = metric_data["timestamp"]
-            if timestamp not in metrics_by_timestamp:
-                metrics_by_timestamp[timestamp] = []
-
-            # Check if this metric is explicitly configured
-            if metric_name in metric_configs_map:
-                metric_config = metric_configs_map[metric_name]
-                field_name = (
-                    metric_config.ecs_mapping.field
-                    if hasattr(metric_config, "ecs_mapping")
-                    and metric_config.ecs_mapping
-                    else get_ecs_field_from_metric_name(metric_name)
-                )
+            group = metrics_by_timestamp.get(timestamp)
+            if group is None:
+                group = metrics_by_timestamp[timestamp] = ([], [])
+
+            group[0].append((metric_plan, coerce(metric_data["value"])))
+            group[1].append(metric_data.get("labels", {}))
+
+    return metrics_by_timestamp
+
+
+def _group_batch_samples(batch: SampleBatch, plan: TargetMappingPlan) -> Dict:
+    """Group the samples of a batch, which all share the batch timestamp."""
+    # Resolve the metric plan once per sample name rather than per sample
+    name_plans = [
+        plan.get(batch.families[family_id]) for family_id in batch.name_families
+    ]
+    entries = list(zip(map(name_plans.__getitem__, batch.name_ids), batch.values))
+
+    # Each label set only needs merging the first time it is used
+    return {batch.timestamp: (entries, batch.used_label_sets())}
+
+
+def _group_metric_series(
+    metrics: Dict[str, List[Dict[str, Any]]], plan: TargetMappingPlan
+) -> Dict:
+    """
+    Group per-sample dicts by timestamp and label set.
+
+    Returns a list of (labels, metrics object) pairs for each timestamp.
+    """
+    series_by_timestamp = {}
+    for metric_name, metric_data_list in metrics.items():
+        for metric_data in metric_data_list:
+            sample_name = metric_data["name"]
+            labels = metric_data.get("labels", {})
+            if sample_name == metric_name and "quantile" in labels:
+                metric_plan = plan.get_quantile(metric_name)
             else:
-                # Use automatic mapping for metrics not in the configuration
-                field_name = get_ecs_field_from_metric_name(metric_name)
-
-            # Get the value and convert if necessary
-            value = metric_data["value"]
-
-            # Detect the type and convert if necessary
-            if isinstance(value, str):
-                # Try to convert string to appropriate type
-                if value.lower() in ["true", "false"]:
-                    value = value.lower() == "true"
-                else:
-                    try:
-                        # Try to convert to int or float
-                        if "." in value:
-                            value = float(value)
-                        else:
-                            value = int(value)
-                    except ValueError:
-                        # Keep as string if conversion fails
-                        pass
-
-            # Add to the metrics for this timestamp
-            metrics_by_timestamp[timestamp].append(
-                {
-                    "name": metric_name,
-                    "field": field_name,
-                    "value": value,
-                    "labels": metric_data.get("labels", {}),
-                }
+                metric_plan = plan.get_sample(metric_name, sample_name)
+
+            series = series_by_timestamp.get(metric_data["timestamp"])
+            if series is None:
+                series = series_by_timestamp[metric_data["timestamp"]] = {}
+            key = tuple(labels.items())
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = (labels, {})
+
+            _set_metric_value(
+                entry[1], metric_plan, metric_plan.coerce(metric_data["value"])
             )
 
-    # Prepare documents for bulk indexing
-    bulk_data = []
-    doc_count = 0
+    return {
+        timestamp: list(series.values())
+        for timestamp, series in series_by_timestamp.items()
+    }
+
+
+def _group_batch_series(batch: SampleBatch, plan: TargetMappingPlan) -> Dict:
+    """Group the samples of a batch by label set."""
+    families = batch.families
+    sample_plans = [
+        plan.get_sample(families[family_id], name)
+        for name, family_id in zip(batch.names, batch.name_families)
+    ]
+    # Summary quantiles are named like their family and have a quantile label
+    quantile_plans = [
+        plan.get_quantile(name) if name == families[family_id] else None
+        for name, family_id in zip(batch.names, batch.name_families)
+    ]
+    label_sets = batch.label_sets
+    quantile_sets = ["quantile" in labels for labels in label_sets]
+
+    # Label set ids are small integers, so they index the series directly
+    series: List[Optional[Dict[str, Any]]] = [None] * len(label_sets)
+    for name_id, label_set_id, value in zip(
+        batch.name_ids, batch.label_set_ids, batch.values
+    ):
+        metrics_doc = series[label_set_id]
+        if metrics_doc is None:
+            metrics_doc = series[label_set_id] = {}
+        if quantile_sets[label_set_id] and quantile_plans[name_id] is not None:
+            _set_metric_value(metrics_doc, quantile_plans[name_id], value)
+        else:
+            _set_metric_value(metrics_doc, sample_plans[name_id], value)
+
+    return {
+        batch.timestamp: [
+            (label_sets[label_set_id], series[label_set_id])
+            for label_set_id in dict.fromkeys(batch.label_set_ids)
+        ]
+    }
+
+
+def _set_metric_value(
+    metrics_doc: Dict[str, Any], metric_plan: MetricPlan, value: Any
+) -> None:
+    """Set a metric value, walking the pre-split field path."""
+    current = metrics_doc
+    for part in metric_plan.parents:
+        child = current.get(part)
+        if child is None:
+            child = current[part] = {}
+        current = child
+    current[metric_plan.leaf] = value
+
+
+def _build_base_document(
+    timestamp: str, global_metadata: Dict[str, Any], target_metadata: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Build the fields shared by every document of a scrape."""
+    doc = {
+        "@timestamp": timestamp,
+        "event": {"dataset": "snmp", "module": "snmp", "kind": "metric"},
+        "service": {"type": "snmp"},
+        "metrics": {},  # Will contain all metrics
+        "labels": {},  # Will contain all labels
+    }
+
+    # Add global metadata
+    if global_metadata:
+        for key, value in global_metadata.items():
+            doc[key] = value
+
+    # Add target metadata
+    if target_metadata:
+        for key, value in target_metadata.items():
+            doc[key] = value
+
+    return doc
+
+
+def build_metric_documents(
+    metrics: Union[Dict[str, List[Dict[str, Any]]], SampleBatch],
+    target_config: Any,
+    global_metadata: Dict[str, Any],
+    plan: Optional[TargetMappingPlan] = None,
+    layout: DocumentLayout = DocumentLayout.MERGED,
+) -> List[Dict[str, Any]]:
+    """
+    Build the Elasticsearch documents for a scrape.
+
+    With the merged layout, all metrics are grouped by collection time,
+    creating a single document with multiple metrics inside it for each
+    timestamp. Labels keep the first value seen for each key, and samples
+    of the same metric overwrite each other.
+
+    With the series layout, one document is created for each label set at
+    each timestamp, such as one per interface, so no values are lost.
+
+    `metrics` is either the dict returned by `parse_prometheus_metrics` or a
+    `SampleBatch`. Pass a compiled `plan` to avoid resolving field names on
+    every scrape.
+    """
+    if plan is None:
+        plan = TargetMappingPlan(target_config)
+
+    # Get target metadata
+    target_metadata = target_config.metadata or {}
+
+    if layout == DocumentLayout.SERIES:
+        return _build_series_documents(metrics, plan, global_metadata, target_metadata)
+
+    if isinstance(metrics, SampleBatch):
+        metrics_by_timestamp = _group_batch_samples(metrics, plan)
+        # Label sets from the interner are the same objects scrape after scrape
+        merge_labels = plan.labels.merged_labels
+    else:
+        metrics_by_timestamp = _group_metric_samples(metrics, plan)
+        merge_labels = merge_label_sets
+
+    documents = []
 
     # Create one document per timestamp
-    for timestamp, metrics_list in metrics_by_timestamp.items():
-        # Create the base document
-        doc = {
-            "@timestamp": timestamp,
-            "event": {"dataset": "snmp", "module": "snmp", "kind": "metric"},
-            "service": {"type": "snmp"},
-            "metrics": {},  # Will contain all metrics
-            "labels": {},  # Will contain all labels
-        }
-
-        # Add global metadata
-        if global_metadata:
-            for key, value in global_metadata.items():
-                doc[key] = value
-
-        # Add target metadata
-        if target_metadata:
-            for key, value in target_metadata.items():
-                doc[key] = value
+    for timestamp, (entries, label_sets) in metrics_by_timestamp.items():
+        doc = _build_base_document(timestamp, global_metadata, target_metadata)
+        metrics_doc = doc["metrics"]
 
         # Add all metrics to the document
-        for metric in metrics_list:
-            field_name = metric["field"]
-            value = metric["value"]
-
-            # Split the field path and create nested structure
-            field_parts = field_name.split(".")
-            current = doc["metrics"]
-            for i, part in enumerate(field_parts):
-                if i == len(field_parts) - 1:
-                    current[part] = value
-                else:
-                    if part not in current:
-                        current[part] = {}
-                    current = current[part]
-
-            # Add labels to the labels object instead of directly to the document
-            for label_key, label_value in metric["labels"].items():
-                if label_key not in doc["labels"]:
-                    doc["labels"][label_key] = label_value
-
-        # Add to bulk data
-        bulk_data.append({"index": {"_index": index_name}})
-        bulk_data.append(doc)
-        doc_count += 1
-
-    if not bulk_data:
-        logger.warning("No documents to index")
-        return 0
+        for metric_plan, value in entries:
+            _set_metric_value(metrics_doc, metric_plan, value)
 
-    try:
-        # Perform bulk indexing
-        response = es_client.bulk(operations=bulk_data, refresh=True)
+        # Add labels to the labels object instead of directly to the document
+        doc["labels"] = merge_labels(label_sets)
 
-        # Check for errors
-        if response["errors"]:
-            error_count = sum(
-                1 for item in response["items"] if "error" in item["index"]
-            )
-            logger.error(
-                f"Errors occurred during bulk indexing: {error_count} documents failed"
-            )
+        documents.append(doc)
 
-            # Log the first few errors
-            for i, item in enumerate(response["items"]):
-                if "error" in item["index"] and i < 5:  # Only log the first 5 errors
-                    logger.error(f"Error for document {i}: {item['index']['error']}")
+    return documents
 
-            # Return the number of successful documents
-            return doc_count - error_count
-        else:
-            logger.info(f"Successfully indexed {doc_count} documents")
-            return doc_count
-    except Exception as e:
-        logger.error(f"Error writing to Elasticsearch: {e}")
+
+def _build_series_documents(
+    metrics: Union[Dict[str, List[Dict[str, Any]]], SampleBatch],
+    plan: TargetMappingPlan,
+    global_metadata: Dict[str, Any],
+    target_metadata: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """Build one document per label set and timestamp."""
+    if isinstance(metrics, SampleBatch):
+        series_by_timestamp = _group_batch_series(metrics, plan)
+    else:
+        series_by_timestamp = _group_metric_series(metrics, plan)
+
+    documents = []
+    for timestamp, series in series_by_timestamp.items():
+        # Build the shared fields once; each document is a shallow copy, so
+        # nested objects such as event and the metadata are shared
+        base = _build_base_document(timestamp, global_metadata, target_metadata)
+        for labels, metrics_doc in series:
+            doc = base.copy()
+            doc["metrics"] = metrics_doc
+            doc["labels"] = labels
+            documents.append(doc)
+
+    return documents
+
+
+def write_metrics_to_elasticsearch(
+    es_client,
+    metrics: Union[Dict[str, List[Dict[str, Any]]], SampleBatch],
+    target_config: Any,
+    global_metadata: Dict[str, Any],
+    refresh: Union[bool, str] = False,
+    layout: DocumentLayout = DocumentLayout.MERGED,
+    compression_level: int = 0,
+    retry_policy: Optional[RetryPolicy] = None,
+) -> int:
+    """
+    Write metrics to Elasticsearch.
+
+    By default this function will group all metrics by collection time and
+    target, creating a single document with multiple metrics inside it; see
+    `build_metric_documents` for the layouts. The `refresh` argument is
+    passed to the bulk API; see `get_refresh_param`. With a
+    `compression_level` above 0, request bodies are gzipped at that level.
+    Documents throttled by Elasticsearch are retried following
+    `retry_policy` (see `get_retry_policy`), or the default policy.
+
+    Returns the number of documents successfully indexed.
+    """
+    if not metrics:
+        logger.warning("No metrics to write to Elasticsearch")
         return 0
+
+    # Get index name from target config or use default
+    index_name = get_target_index(target_config)
+
+    # Serialize documents into bulk request bodies
+    builder = BulkBodyBuilder()
+    bodies = []
+    for doc in build_metric_documents(
+        metrics, target_config, global_metadata, layout=layout
+    ):
+        if not builder.add(index_name, doc):
+            bodies.append((builder.doc_count, builder.take()))
+            builder.add(index_name, doc)
+    if builder.doc_count:
+        bodies.append((builder.doc_count, builder.take()))
+
+    if not bodies:
+        logger.warning("No documents to index")
+        return 0
+
+    def send(body: bytes) -> Dict[str, Any]:
+        if compression_level:
+            body = compress_body(body, compression_level)
+        return send_bulk_body(
+            es_client, body, refresh, compressed=bool(compression_level)
+        )
+
+    indexed = 0
+    for doc_count, body in bodies:
+        # Perform bulk indexing, retrying throttled documents
+        result = send_with_retries(send, body, doc_count, retry_policy or RetryPolicy())
+        if result.indexed == doc_count:
+            logger.info(f"Successfully indexed {doc_count} documents")
+        indexed += result.indexed
+
+    # Return the number of successful documents
+    return indexed
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Asynchronous exporter client for the SNMP Bridge.
+This module fetches metrics from Prometheus exporters using asyncio, with one
+pooled keep-alive HTTP session per exporter.
+"""
+
+import asyncio
+import base64
+import codecs
+import logging
+import ssl
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+import aiohttp
+
+from module_batching import ModuleBatch
+from response_cache import CachedResponse, ResponseCache
+from runtime_schema import ExporterConfig, RuntimeConfig
+from test_snmp_fetch import build_exporter_url
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Seconds to keep a replaced session open for requests that are still running
+SESSION_RETIRE_DELAY = 120.0
+
+# Bytes read from a response at a time when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Fraction of the interval a batched response is reused for, so that
+# targets of a batch that wait for a concurrency slot still share it
+BATCH_REUSE_FRACTION = 0.5
+
+
+class ExporterRequest:
+    """Everything needed to send one scrape request to an exporter."""
+
+    def __init__(
+        self,
+        exporter_name: str,
+        url: str,
+        headers: Dict[str, str],
+        timeout: int,
+        auth: Optional[Tuple[str, str]] = None,
+    ):
+        self.exporter_name = exporter_name
+        self.url = url
+        self.headers = headers
+        self.timeout = timeout
+        self.auth = auth
+
+    @property
+    def cache_key(self) -> Hashable:
+        """Identity of the request for sharing its response."""
+        return (self.url, tuple(sorted(self.headers.items())), self.auth)
+
+
+def get_target_timeout(config: RuntimeConfig, target_config) -> float:
+    """Get the configured timeout of a target: its own, its exporter's or the global one."""
+    exporter_config = config.exporters.get(target_config.exporter)
+    exporter_timeout = exporter_config.timeout if exporter_config else None
+    global_timeout = config.global_.timeout if config.global_ else 30
+    return target_config.timeout or exporter_timeout or global_timeout
+
+
+def prepare_exporter_request(
+    config: RuntimeConfig,
+    target_name: str,
+    secondary: bool = False,
+    module: Optional[str] = None,
+) -> ExporterRequest:
+    """
+    Resolve the URL, headers, timeout and authentication for a target.
+
+    This follows the same rules as `fetch_metrics`, and raises ValueError for
+    unknown targets or exporters. With `secondary`, the request is for the
+    target's `secondary_exporter_url`, with the same exporter settings.
+    `module` replaces the target's module, such as with a batch of modules.
+    """
+    if target_name not in config.targets:
+        raise ValueError(f"Target '{target_name}' not found in configuration")
+
+    target_config = config.targets[target_name]
+    exporter_name = target_config.exporter
+
+    if exporter_name not in config.exporters:
+        raise ValueError(f"Exporter '{exporter_name}' not found in configuration")
+
+    exporter_config = config.exporters[exporter_name]
+
+    # Use target-specific exporter_url if available, otherwise use the exporter's default URL
+    if secondary:
+        if not target_config.secondary_exporter_url:
+            raise ValueError(f"Target '{target_name}' has no secondary exporter URL")
+        exporter_url = str(target_config.secondary_exporter_url).rstrip("/")
+    elif target_config.exporter_url:
+        exporter_url = str(target_config.exporter_url).rstrip("/")
+    else:
+        exporter_url = str(exporter_config.url).rstrip("/")
+
+    if module is not None:
+        target_config = target_config.model_copy(update={"module": module})
+    url = build_exporter_url(exporter_url, target_config)
+
+    # Copy the headers so that authentication does not leak into the configuration
+    headers = dict(exporter_config.headers or {})
+    timeout = get_target_timeout(config, target_config)
+
+    auth = None
+    if exporter_config.auth:
+        auth_config = exporter_config.auth
+        if hasattr(auth_config, "username") and hasattr(auth_config, "password"):
+            auth = (auth_config.username, auth_config.password)
+        elif hasattr(auth_config, "bearer_token"):
+            headers["Authorization"] = f"Bearer {auth_config.bearer_token}"
+        elif hasattr(auth_config, "api_key"):
+            headers["Authorization"] = f"ApiKey {auth_config.api_key}"
+
+    return ExporterRequest(exporter_name, url, headers, timeout, auth)
+
+
+def create_ssl_context(exporter_config: ExporterConfig) -> Union[ssl.SSLContext, bool]:
+    """
+    Create the TLS settings for an exporter session.
+
+    Returns False when certificate verification is disabled, otherwise an
+    SSL context with the configured CA and client certificates.
+    """
+    tls = exporter_config.tls
+    if not tls:
+        return ssl.create_default_context()
+
+    if not tls.verify:
+        return False
+
+    context = ssl.create_default_context(cafile=tls.ca_cert)
+    if tls.client_cert and tls.client_key:
+        context.load_cert_chain(tls.client_cert, tls.client_key)
+    return context
+
+
+class FetchOutcome:
+    """
+    How a fetch got its response.
+
+    `round_trip` is True if this fetch sent a request to the exporter, and
+    False if it reused a cached response or waited for another target's
+    fetch. Only round trips measure the exporter's latency.
+    """
+
+    __slots__ = ("round_trip",)
+
+    def __init__(self):
+        self.round_trip = False
+
+
+class ExporterClientPool:
+    """
+    Pool of HTTP sessions, one per exporter.
+
+    Each session keeps its connections alive between scrapes, so repeated
+    scrapes of the same exporter reuse TCP and TLS connections. A session is
+    replaced when the configuration of its exporter changes.
+
+    With `cache_ttl` above 0, targets sending the same request share one
+    response through a `ResponseCache`.
+
+    Targets with a `secondary_exporter_url` get a hedged request: the same
+    request is sent to the secondary exporter when the primary has not
+    answered in time or has failed, and the first response is used.
+    `hedge_stats` counts how often that happens.
+    """
+
+    def __init__(
+        self,
+        limit: int = 10,
+        keepalive_timeout: float = 120.0,
+        cache_ttl: float = 0.0,
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            limit: Maximum number of open connections per exporter
+            keepalive_timeout: Seconds to keep an idle connection open
+            cache_ttl: Seconds to reuse a response; 0 disables the cache
+        """
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.response_cache = ResponseCache(cache_ttl)
+        self.hedge_stats = {"hedged": 0, "failed_over": 0, "secondary_won": 0}
+        self._sessions: Dict[str, Tuple[ExporterConfig, aiohttp.ClientSession]] = {}
+        self._retired: Set[asyncio.Task] = set()
+
+    def get_session(
+        self, exporter_name: str, exporter_config: ExporterConfig
+    ) -> aiohttp.ClientSession:
+        """Get the session for an exporter, creating it if needed."""
+        entry = self._sessions.get(exporter_name)
+        if entry is not None:
+            cached_config, session = entry
+            same_config = (
+                cached_config is exporter_config or cached_config == exporter_config
+            )
+            if same_config and not session.closed:
+                return session
+            logger.info(f"Exporter {exporter_name} configuration changed, new session")
+            self._retire(exporter_name)
+
+        ssl_setting = create_ssl_context(exporter_config)
+        if ssl_setting is False:
+            logger.warning(
+                f"TLS certificate verification is disabled for exporter {exporter_name}"
+            )
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            keepalive_timeout=self.keepalive_timeout,
+            ssl=ssl_setting,
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        self._sessions[exporter_name] = (exporter_config, session)
+        return session
+
+    async def fetch(
+        self,
+        config: RuntimeConfig,
+        target_name: str,
+        timeout: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+        outcome: Optional[FetchOutcome] = None,
+    ) -> str:
+        """
+        Fetch the raw metrics text for a target.
+
+        `timeout` overrides the configured timeout in seconds. For targets with
+        a secondary exporter, `hedge_after` is the number of seconds after which
+        the secondary is asked as well; if None, it is only asked when the
+        primary fails. If given, `outcome` records whether the exporter was
+        asked. Raises aiohttp.ClientError on connection or HTTP errors,
+        and asyncio.TimeoutError if the exporter does not respond in time.
+        """
+        requests = self._prepare_requests(config, target_name, timeout)
+        return await self._fetch_text(config, requests, hedge_after, outcome)
+
+    async def fetch_batch(
+        self,
+        config: RuntimeConfig,
+        batch: ModuleBatch,
+        timeout: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+        outcome: Optional[FetchOutcome] = None,
+    ) -> str:
+        """
+        Fetch the metrics of every module in a batch with one request.
+
+        The targets of the batch share the request through the response
+        cache, and reuse its response for half their interval, or the cache
+        TTL if that is longer. Takes and raises the same as `fetch`.
+        """
+        target_name = batch.target_names[0]
+        requests = self._prepare_requests(config, target_name, timeout, batch.module)
+        interval = config.targets[target_name].interval
+        ttl = max(self.response_cache.ttl, interval * BATCH_REUSE_FRACTION)
+        return await self._fetch_cached(config, requests, hedge_after, ttl, outcome)
+
+    def _prepare_requests(
+        self,
+        config: RuntimeConfig,
+        target_name: str,
+        timeout: Optional[float],
+        module: Optional[str] = None,
+    ) -> List[ExporterRequest]:
+        """Prepare the request for a target, and for its secondary exporter."""
+        requests = [prepare_exporter_request(config, target_name, module=module)]
+        if config.targets[target_name].secondary_exporter_url:
+            requests.append(prepare_exporter_request(config, target_name, True, module))
+        if timeout is not None:
+            for request in requests:
+                request.timeout = timeout
+        return requests
+
+    async def _fetch_text(
+        self,
+        config: RuntimeConfig,
+        requests: List[ExporterRequest],
+        hedge_after: Optional[float],
+        outcome: Optional[FetchOutcome] = None,
+    ) -> str:
+        """Fetch the text of the first of `requests`, hedged with the second."""
+        if self.response_cache.enabled:
+            return await self._fetch_cached(
+                config, requests, hedge_after, outcome=outcome
+            )
+        if outcome is not None:
+            outcome.round_trip = True
+
+        async def fetch_text(request: ExporterRequest) -> str:
+            async with self._request(config, request) as response:
+                response.raise_for_status()
+                return await response.text()
+
+        return await self._hedge(
+            [lambda request=request: fetch_text(request) for request in requests],
+            hedge_after,
+        )
+
+    async def _fetch_cached(
+        self,
+        config: RuntimeConfig,
+        requests: List[ExporterRequest],
+        hedge_after: Optional[float],
+        ttl: Optional[float] = None,
+        outcome: Optional[FetchOutcome] = None,
+    ) -> str:
+        """Fetch the text of `requests` through the response cache."""
+
+        def fetch(validators: Dict[str, str]):
+            # Only called when this request goes to the exporter, not for
+            # cache hits or requests waiting for another one
+            if outcome is not None:
+                outcome.round_trip = True
+            return self._hedge(
+                [
+                    lambda request=request: self._fetch_response(
+                        config, request, validators
+                    )
+                    for request in requests
+                ],
+                hedge_after,
+            )
+
+        return await self.response_cache.get(requests[0].cache_key, fetch, ttl)
+
+    async def _hedge(
+        self,
+        attempts: List[Callable[[], Awaitable]],
+        delay: Optional[float],
+    ):
+        """
+        Run the first attempt, adding the second if it is slow or fails.
+
+        The second attempt starts after `delay` seconds, or as soon as the
+        first fails. The first result wins and the other attempt is
+        cancelled. If both fail, the error of the first is raised.
+        """
+        primary = asyncio.ensure_future(attempts[0]())
+        if len(attempts) == 1:
+            return await primary
+
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if primary in done and primary.exception() is None:
+                return primary.result()
+            self.hedge_stats["hedged" if pending else "failed_over"] += 1
+            secondary = asyncio.ensure_future(attempts[1]())
+            pending.add(secondary)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            self.hedge_stats["secondary_won"] += 1
+                        return task.result()
+            raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _fetch_response(
+        self,
+        config: RuntimeConfig,
+        request: ExporterRequest,
+        validators: Dict[str, str],
+    ) -> Optional[CachedResponse]:
+        """Fetch a response for the cache, or None if it was not modified."""
+        async with self._request(config, request, validators) as response:
+            if response.status == 304 and validators:
+                return None
+            response.raise_for_status()
+            return CachedResponse(
+                await response.text(),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+
+    async def fetch_into(
+        self,
+        config: RuntimeConfig,
+        target_name: str,
+        parser,
+        timeout: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+        outcome: Optional[FetchOutcome] = None,
+    ) -> int:
+        """
+        Fetch the metrics for a target, feeding the body to a parser as it arrives.
+
+        The parser must have a `feed(text)` method, such as
+        `StreamingPrometheusParser`. Returns the size of the body, and takes
+        and raises the same as `fetch`.
+
+        With the response cache enabled, or a secondary exporter, the body is
+        fetched whole, since a shared or hedged response cannot be streamed to
+        the parser before it is chosen.
+        """
+        requests = self._prepare_requests(config, target_name, timeout)
+        if self.response_cache.enabled or len(requests) > 1:
+            text = await self._fetch_text(config, requests, hedge_after, outcome)
+            parser.feed(text)
+            return len(text)
+
+        if outcome is not None:
+            outcome.round_trip = True
+        async with self._request(config, requests[0]) as response:
+            response.raise_for_status()
+            decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(
+                errors="replace"
+            )
+            received = 0
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                received += len(chunk)
+                parser.feed(decoder.decode(chunk))
+            parser.feed(decoder.decode(b"", final=True))
+            return received
+
+    def _request(
+        self,
+        config: RuntimeConfig,
+        request: ExporterRequest,
+        extra_headers: Optional[Dict[str, str]] = None,
+    ):
+        """Start a scrape request on its exporter's session."""
+        exporter_config = config.exporters[request.exporter_name]
+        session = self.get_session(request.exporter_name, exporter_config)
+
+        headers = dict(request.headers)
+        if extra_headers:
+            headers.update(extra_headers)
+        if request.auth:
+            credentials = ":".join(request.auth).encode("utf-8")
+            headers["Authorization"] = f"Basic {base64.b64encode(credentials).decode()}"
+        logger.debug(f"Fetching metrics from {request.url}")
+
+        return session.get(
+            request.url,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=request.timeout),
+        )
+
+    def set_cache_ttl(self, ttl: float) -> None:
+        """Change how long responses are reused, dropping them if disabled."""
+        self.response_cache.ttl = ttl
+        if ttl <= 0:
+            self.response_cache.clear()
+
+    def retain(self, exporter_names) -> None:
+        """Retire the sessions of exporters that are no longer configured."""
+        for exporter_name in set(self._sessions) - set(exporter_names):
+            logger.info(f"Exporter {exporter_name} removed, closing its session")
+            self._retire(exporter_name)
+
+    def _retire(self, exporter_name: str) -> None:
+        """Remove a session from the pool and close it later."""
+        _, session = self._sessions.pop(exporter_name)
+        # Give in-flight requests on the old session time to finish
+        task = asyncio.create_task(self._close_later(session))
+        self._retired.add(task)
+        task.add_done_callback(self._retired.discard)
+
+    async def _close_later(self, session: aiohttp.ClientSession) -> None:
+        """Close a replaced session once in-flight requests have had time to finish."""
+        try:
+            await asyncio.sleep(SESSION_RETIRE_DELAY)
+        finally:
+            await session.close()
+
+    async def close(self) -> None:
+        """Close all sessions and their connections."""
+        sessions = [session for _, session in self._sessions.values()]
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+        retired = list(self._retired)
+        self._retired.clear()
+        for task in retired:
+            task.cancel()
+        await asyncio.gather(*retired, return_exceptions=True)
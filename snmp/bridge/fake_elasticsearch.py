@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Elasticsearch, used by benchmarks and tests.
+This module serves just enough of the Elasticsearch HTTP API for the bridge
+to write metrics: cluster info and the bulk API.
+
+Refreshes are simulated so that refresh policies can be compared. A forced
+refresh (refresh=true) takes `refresh_cost` seconds and blocks other
+refreshes, as it does on a real shard. A `wait_for` request is held until
+the next periodic refresh, every `refresh_interval` seconds.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+class FakeElasticsearch:
+    """
+    In-process HTTP server that behaves like a single-node Elasticsearch.
+
+    Use it as a context manager, or call `start` and `stop`:
+
+        with FakeElasticsearch() as fake_es:
+            client = Elasticsearch(fake_es.url)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        refresh_cost: float = 0.05,
+        refresh_interval: float = 1.0,
+        index_cost: float = 0.0,
+        keep_documents: bool = False,
+    ):
+        """
+        Initialize the fake server.
+
+        Args:
+            host: Address to listen on
+            port: Port to listen on (0 picks a free port)
+            refresh_cost: Seconds taken by a forced refresh
+            refresh_interval: Seconds between periodic refreshes
+            index_cost: Seconds taken to index each document
+            keep_documents: Keep indexed documents in `documents`
+        """
+        self.refresh_cost = refresh_cost
+        self.refresh_interval = refresh_interval
+        self.index_cost = index_cost
+        self.keep_documents = keep_documents
+        self.documents: List[Dict[str, Any]] = []
+        self.stats = {
+            "bulk_requests": 0,
+            "documents": 0,
+            "bytes": 0,
+            "forced_refreshes": 0,
+        }
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._started = time.monotonic()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeElasticsearch":
+        """Start serving requests in a background thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-elasticsearch", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeElasticsearch":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def handle_bulk(self, body: bytes, refresh: str) -> Dict[str, Any]:
+        """Index a bulk request body and apply the refresh policy."""
+        lines = [line for line in body.split(b"\n") if line.strip()]
+        items = []
+        docs = []
+        for i in range(0, len(lines) - 1, 2):
+            action = json.loads(lines[i])
+            op_type, meta = next(iter(action.items()))
+            docs.append(json.loads(lines[i + 1]))
+            items.append(
+                {
+                    op_type: {
+                        "_index": meta.get("_index"),
+                        "status": 201,
+                        "result": "created",
+                    }
+                }
+            )
+
+        if self.index_cost:
+            time.sleep(self.index_cost * len(docs))
+
+        with self._lock:
+            self.stats["bulk_requests"] += 1
+            self.stats["documents"] += len(docs)
+            self.stats["bytes"] += len(body)
+            if self.keep_documents:
+                self.documents.extend(docs)
+
+        if refresh in ("", "true"):
+            # A forced refresh writes a new segment and holds the shard
+            with self._refresh_lock:
+                time.sleep(self.refresh_cost)
+                with self._lock:
+                    self.stats["forced_refreshes"] += 1
+        elif refresh == "wait_for":
+            # Wait for the next periodic refresh
+            elapsed = time.monotonic() - self._started
+            time.sleep(self.refresh_interval - (elapsed % self.refresh_interval))
+
+        return {"took": 1, "errors": False, "items": items}
+
+    def _make_handler(self):
+        """Create the request handler class bound to this server."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _read_body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                return body
+
+            def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == "/":
+                    self._send_json(
+                        200,
+                        {
+                            "name": "fake-node",
+                            "cluster_name": "fake-cluster",
+                            "version": {"number": "9.0.0"},
+                            "tagline": "You Know, for Search",
+                        },
+                    )
+                else:
+                    self._send_json(404, {"error": "not found", "status": 404})
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.end_headers()
+
+            def do_POST(self):
+                parsed = urlparse(self.path)
+                body = self._read_body()
+                if parsed.path.endswith("/_bulk"):
+                    query = parse_qs(parsed.query, keep_blank_values=True)
+                    refresh = query.get("refresh", ["false"])[0]
+                    self._send_json(200, fake.handle_bulk(body, refresh))
+                else:
+                    self._send_json(404, {"error": "not found", "status": 404})
+
+            do_PUT = do_POST
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Elasticsearch stand-in")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=9200, help="Port to listen on")
+    parser.add_argument(
+        "--refresh-cost", type=float, default=0.05, help="Seconds per forced refresh"
+    )
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(args.host, args.port, refresh_cost=args.refresh_cost)
+    logger.info(f"Serving fake Elasticsearch on {fake_es.url}")
+    try:
+        fake_es._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
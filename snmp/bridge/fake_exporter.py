@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an SNMP exporter, used by benchmarks and tests.
+This module serves synthetic snmp_exporter responses on /snmp: each target
+is a device with a configurable number of interfaces, so the bridge can be
+driven at the scale of a real network without any SNMP devices.
+"""
+
+import argparse
+import logging
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from bench_parser import make_exporter_payload
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+class FakeExporter:
+    """
+    In-process HTTP server that answers like snmp_exporter.
+
+    Every target gets the response of a device with `interfaces` interfaces.
+    Only `distinct_devices` responses are built, and targets share them by
+    a hash of their name, so large fleets cost little memory to serve. Use
+    it as a context manager, or call `start` and `stop`:
+
+        with FakeExporter(interfaces=48) as exporter:
+            url = exporter.url
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        interfaces: int = 48,
+        distinct_devices: int = 8,
+        delay: float = 0.0,
+    ):
+        """
+        Initialize the fake exporter.
+
+        Args:
+            host: Address to listen on
+            port: Port to listen on (0 picks a free port)
+            interfaces: Interfaces per device
+            distinct_devices: Number of different responses to serve
+            delay: Seconds to wait before answering, like an SNMP walk
+        """
+        self.interfaces = interfaces
+        self.distinct_devices = max(1, distinct_devices)
+        self.delay = delay
+        self.stats = {"requests": 0, "bytes": 0}
+        self._payloads: Dict[int, bytes] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeExporter":
+        """Start serving requests in a background thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-exporter", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeExporter":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def payload(self, target: str) -> bytes:
+        """Get the response body for a target."""
+        device = zlib.crc32(target.encode("utf-8")) % self.distinct_devices
+        with self._lock:
+            body = self._payloads.get(device)
+            if body is None:
+                body = make_exporter_payload(self.interfaces, device).encode("utf-8")
+                self._payloads[device] = body
+        return body
+
+    def _make_handler(self):
+        """Create the request handler class bound to this server."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path != "/snmp":
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                query = parse_qs(parsed.query)
+                body = fake.payload(query.get("target", [""])[0])
+                if fake.delay:
+                    time.sleep(fake.delay)
+                with fake._lock:
+                    fake.stats["requests"] += 1
+                    fake.stats["bytes"] += len(body)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local SNMP exporter stand-in")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=9116, help="Port to listen on")
+    parser.add_argument(
+        "--interfaces", type=int, default=48, help="Interfaces per device"
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="Seconds to wait before answering"
+    )
+    args = parser.parse_args()
+
+    exporter = FakeExporter(
+        args.host, args.port, interfaces=args.interfaces, delay=args.delay
+    )
+    logger.info(f"Serving fake SNMP exporter on {exporter.url}")
+    try:
+        exporter._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Label interning for the SNMP Bridge.
+This module keeps the label sets of a target between scrapes, so that
+labels which repeat in every scrape of a device, such as ifIndex, ifDescr
+and ifName, are parsed once and then shared by the parser and the writer.
+"""
+
+import operator
+import sys
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from prometheus_stream import parse_labels
+
+LabelSet = Dict[str, str]
+
+
+def merge_label_sets(label_sets: Iterable[LabelSet]) -> LabelSet:
+    """Merge label sets into one, keeping the first value seen for each key."""
+    merged: LabelSet = {}
+    for labels in label_sets:
+        for label_key, label_value in labels.items():
+            if label_key not in merged:
+                merged[label_key] = label_value
+    return merged
+
+
+class LabelInterner:
+    """
+    Bounded table of label keys, values and label sets for one target.
+
+    Label sets are looked up by their raw text in the exposition format and
+    evicted least recently used first once there are more than
+    `max_label_sets`. Label keys are few and are interned with `sys.intern`;
+    label values are shared through a table with the same bound.
+
+    Returned label sets are shared and must not be modified.
+    """
+
+    def __init__(
+        self,
+        max_label_sets: int = 10000,
+        parse: Callable[[str], LabelSet] = parse_labels,
+    ):
+        """
+        Initialize the interner.
+
+        Args:
+            max_label_sets: Maximum number of label sets (and values) to keep
+            parse: Function that parses the text inside a `{...}` label block
+        """
+        self.max_label_sets = max_label_sets
+        self._parse = parse
+        self._label_sets: "OrderedDict[str, LabelSet]" = OrderedDict()
+        self._values: "OrderedDict[str, str]" = OrderedDict()
+        self._merged: Optional[Tuple[Tuple[LabelSet, ...], LabelSet]] = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._label_sets)
+
+    def label_set(self, text: str) -> LabelSet:
+        """Get the label set for the text of a label block, parsing it if unseen."""
+        labels = self._label_sets.get(text)
+        if labels is not None:
+            self._label_sets.move_to_end(text)
+            self.stats["hits"] += 1
+            return labels
+
+        self.stats["misses"] += 1
+        labels = {
+            sys.intern(key): self.intern_value(value)
+            for key, value in self._parse(text).items()
+        }
+        self._label_sets[text] = labels
+        if len(self._label_sets) > self.max_label_sets:
+            self._label_sets.popitem(last=False)
+            self.stats["evictions"] += 1
+        return labels
+
+    def intern_value(self, value: str) -> str:
+        """Get the shared copy of a label value."""
+        shared = self._values.get(value)
+        if shared is not None:
+            self._values.move_to_end(value)
+            return shared
+        self._values[value] = value
+        if len(self._values) > self.max_label_sets:
+            self._values.popitem(last=False)
+        return value
+
+    def merged_labels(self, label_sets: List[LabelSet]) -> LabelSet:
+        """
+        Merge label sets, keeping the first value seen for each key.
+
+        The result of the previous call is reused when it was built from the
+        same label set objects, which is the usual case for consecutive
+        scrapes of a device whose interfaces have not changed.
+        """
+        key = tuple(label_sets)
+        cached = self._merged
+        if (
+            cached is not None
+            and len(cached[0]) == len(key)
+            and all(map(operator.is_, cached[0], key))
+        ):
+            return cached[1]
+
+        merged = merge_label_sets(key)
+        # Holding the key keeps its label sets alive, so identity stays meaningful
+        self._merged = (key, merged)
+        return merged
+
+    def resize(self, max_label_sets: int) -> None:
+        """Change the bound, evicting the oldest entries if needed."""
+        self.max_label_sets = max_label_sets
+        while len(self._label_sets) > max_label_sets:
+            self._label_sets.popitem(last=False)
+            self.stats["evictions"] += 1
+        while len(self._values) > max_label_sets:
+            self._values.popitem(last=False)
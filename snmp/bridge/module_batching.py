@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Module batching for the SNMP Bridge.
+This module finds targets that scrape the same device through the same
+exporter with different snmp_exporter modules, such as `system` and
+`if_mib`, so that they can share one request that asks for all of their
+modules at once (`module=if_mib,system`).
+"""
+
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from runtime_schema import RuntimeConfig
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+def get_batch_modules(config: RuntimeConfig) -> bool:
+    """Whether module batching is enabled in the configuration."""
+    return bool(config.global_ and config.global_.batch_modules)
+
+
+class ModuleBatch:
+    """Targets on one device whose modules are fetched in one request."""
+
+    def __init__(self, name: str, target_names: List[str], modules: List[str]):
+        """
+        Initialize the batch.
+
+        Args:
+            name: Name of the batch, unique to its request settings
+            target_names: Targets in the batch, sorted
+            modules: Modules to request, sorted and without duplicates
+        """
+        self.name = name
+        self.target_names = target_names
+        self.modules = modules
+
+    @property
+    def module(self) -> str:
+        """Value of the `module` parameter for the batched request."""
+        return ",".join(self.modules)
+
+    def __repr__(self) -> str:
+        return f"ModuleBatch({self.name!r}, {self.target_names!r}, {self.modules!r})"
+
+
+def _batch_key(target_config) -> Optional[Tuple]:
+    """
+    Identity of the request a target sends, apart from its module.
+
+    Targets can share a request if they scrape the same device with the
+    same exporter, URLs, SNMP authentication, interval and timeout. Targets
+    using the legacy `params`, without a module or polled directly are
+    never batched.
+    """
+    module = target_config.module
+    if not module or "," in module or target_config.params or not target_config.target:
+        return None
+    if target_config.poller is not None:
+        return None
+    return (
+        target_config.exporter,
+        str(target_config.exporter_url or ""),
+        str(target_config.secondary_exporter_url or ""),
+        target_config.target,
+        target_config.auth,
+        target_config.interval,
+        target_config.timeout,
+    )
+
+
+def _batch_name(key: Tuple) -> str:
+    """
+    Name a batch after its whole key.
+
+    Targets on one device with different intervals or authentication are
+    separate batches, so the exporter and address alone are not unique. The
+    name is used for scheduling and sharding, so the hash must be the same
+    in every process, unlike `hash()`.
+    """
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:8]
+    return f"{key[0]}/{key[3]}/{digest}"
+
+
+def plan_module_batches(config: RuntimeConfig) -> Dict[str, ModuleBatch]:
+    """
+    Group the targets that can share a request.
+
+    Returns the batch of every target in a batch with at least two
+    modules. Other targets are not in the result and are scraped alone.
+    """
+    groups: Dict[Tuple, List[str]] = {}
+    for target_name, target_config in config.targets.items():
+        key = _batch_key(target_config)
+        if key is not None:
+            groups.setdefault(key, []).append(target_name)
+
+    batches: Dict[str, ModuleBatch] = {}
+    for key, target_names in groups.items():
+        modules = sorted({config.targets[name].module for name in target_names})
+        if len(modules) < 2:
+            continue
+        batch = ModuleBatch(_batch_name(key), sorted(target_names), modules)
+        for target_name in target_names:
+            batches[target_name] = batch
+
+    if batches:
+        batch_count = len({id(batch) for batch in batches.values()})
+        logger.info(
+            f"Batching {len(batches)} targets into {batch_count} exporter requests"
+        )
+    return batches
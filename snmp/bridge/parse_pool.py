@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Process-pool parsing stage for the SNMP Bridge.
+This module parses exporter responses and builds their documents in worker
+processes, so that large targets are not limited to the one core the event
+loop runs on. Workers return a ready-to-send bulk request body, leaving only
+I/O to the main process.
+"""
+
+import logging
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from bulk_body import BulkBodyBuilder, encode_document
+from elasticsearch_writer import MappingPlanCache, build_metric_documents
+from prometheus_stream import StreamingPrometheusParser
+from runtime_schema import DocumentLayout, ParserMode, RuntimeConfig
+from test_snmp_fetch import parse_prometheus_metrics
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Mapping plans compiled in this worker process, kept between tasks; sized
+# from the configuration by `_init_worker`
+_worker_plans = MappingPlanCache()
+
+# Body builder of this worker process; the bulk indexer splits large bodies
+_worker_builder = BulkBodyBuilder(max_bytes=sys.maxsize)
+
+
+def get_parse_workers(config: RuntimeConfig) -> int:
+    """Get the number of parse worker processes (0 parses in-process)."""
+    if config.global_:
+        return config.global_.parse_workers
+    return 0
+
+
+def _init_worker(label_cache_size: int) -> None:
+    """Set up a worker process with the configured label cache size."""
+    _worker_plans.label_cache_size = label_cache_size
+
+
+def parse_to_bulk_body(
+    target_name: str,
+    target_config: Any,
+    content: str,
+    global_metadata: Optional[Dict[str, Any]],
+    parser_mode: ParserMode = ParserMode.FULL,
+    layout: DocumentLayout = DocumentLayout.MERGED,
+) -> Tuple[bytes, int]:
+    """
+    Parse an exporter response and serialize its documents for the bulk API.
+
+    Runs in a worker process. Returns the NDJSON body, with an action line
+    before each document, and the number of documents in it.
+    """
+    plan = _worker_plans.get(target_name, target_config)
+
+    if parser_mode == ParserMode.STREAMING:
+        parser = StreamingPrometheusParser(
+            plan.allow_list, plan.configured_names, label_interner=plan.labels
+        )
+        parser.feed(content)
+        metrics = parser.close_batch()
+    else:
+        metrics = parse_prometheus_metrics(content, target_config.metrics)
+
+    if not metrics:
+        return b"", 0
+
+    docs = build_metric_documents(
+        metrics, target_config, global_metadata or {}, plan, layout
+    )
+    builder = _worker_builder
+    for doc in docs:
+        builder.add_line(plan.index_name, encode_document(doc))
+    return builder.take(), len(docs)
+
+
+class ParsePool:
+    """
+    Pool of worker processes that turn exporter responses into bulk bodies.
+
+    Only the response text and the target configuration are sent to a
+    worker, and only the serialized body comes back. Each worker keeps its
+    own compiled mapping plans between tasks.
+
+    Workers are started by a fork server rather than forked from the bridge,
+    which by the first task runs several threads; a fork could copy a lock
+    held by one of them, such as the logging lock, and deadlock the worker.
+    """
+
+    def __init__(self, workers: int, label_cache_size: int = 10000):
+        """
+        Initialize the pool.
+
+        Args:
+            workers: Number of worker processes
+            label_cache_size: Label sets kept per target in each worker
+        """
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_init_worker,
+            initargs=(label_cache_size,),
+        )
+        logger.info(f"Started {workers} parse worker processes")
+
+    def submit(
+        self,
+        target_name: str,
+        target_config: Any,
+        content: str,
+        global_metadata: Optional[Dict[str, Any]],
+        parser_mode: ParserMode = ParserMode.FULL,
+        layout: DocumentLayout = DocumentLayout.MERGED,
+    ):
+        """Parse a response in a worker. Returns a future of (body, count)."""
+        return self._executor.submit(
+            parse_to_bulk_body,
+            target_name,
+            target_config,
+            content,
+            global_metadata,
+            parser_mode,
+            layout,
+        )
+
+    def close(self) -> None:
+        """Wait for running tasks and stop the worker processes."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
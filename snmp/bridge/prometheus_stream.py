@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Streaming Prometheus text parser for the SNMP Bridge.
+This module parses the Prometheus text exposition format line by line as the
+response arrives, and drops metric families that are not in an allow-list
+before any samples are allocated for them.
+
+Samples are collected into a `SampleBatch`, which can also be converted to
+the dict layout of `parse_prometheus_metrics`. Families are named the same
+way as by `prometheus_client.parser`.
+"""
+
+import fnmatch
+import re
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional
+
+from runtime_schema import ParserMode, RuntimeConfig
+from sample_batch import SampleBatch
+
+# Sample name suffixes that belong to a family of each type
+TYPE_SUFFIXES = {
+    "counter": ("",),
+    "gauge": ("",),
+    "summary": ("_count", "_sum", ""),
+    "histogram": ("_count", "_sum", "_bucket"),
+}
+
+_ESCAPES = {"\\": "\\", '"': '"', "n": "\n"}
+
+
+class MetricAllowList:
+    """
+    Set of metric family names to keep.
+
+    Built from the `path` of each metric configuration. Paths are matched
+    exactly, or as shell-style patterns when they contain `*`, `?` or `[`.
+    """
+
+    def __init__(self, paths: Iterable[str]):
+        self.names = set()
+        patterns = []
+        for path in paths:
+            if any(char in path for char in "*?["):
+                patterns.append(fnmatch.translate(path))
+            else:
+                self.names.add(path)
+        self._pattern = re.compile("|".join(patterns)) if patterns else None
+        self._cache: Dict[str, bool] = {}
+
+    def allows(self, name: str) -> bool:
+        """Check whether a metric family should be kept."""
+        if name in self.names:
+            return True
+        if self._pattern is None:
+            return False
+        allowed = self._cache.get(name)
+        if allowed is None:
+            allowed = self._cache[name] = bool(self._pattern.match(name))
+        return allowed
+
+
+def get_parser_mode(config: RuntimeConfig, target_config: Any) -> ParserMode:
+    """Get the parser mode for a target, falling back to the global setting."""
+    if target_config.parser:
+        return target_config.parser
+    if config.global_:
+        return config.global_.parser
+    return ParserMode.FULL
+
+
+def build_allow_list(metric_configs: Optional[List]) -> MetricAllowList:
+    """Build the allow-list for a target from its metric configurations."""
+    return MetricAllowList(m.path for m in metric_configs or [])
+
+
+def parse_labels(text: str) -> Dict[str, str]:
+    """Parse the inside of a `{...}` label block."""
+    labels = {}
+    i = 0
+    length = len(text)
+    while i < length:
+        while i < length and text[i] in " ,":
+            i += 1
+        if i >= length:
+            break
+        eq = text.index("=", i)
+        key = text[i:eq].strip()
+        i = text.index('"', eq) + 1
+
+        # Fast path for values without escapes
+        end = text.index('"', i)
+        backslash = text.find("\\", i, end)
+        if backslash == -1:
+            labels[key] = text[i:end]
+            i = end + 1
+            continue
+
+        chars = []
+        while text[i] != '"':
+            char = text[i]
+            if char == "\\":
+                i += 1
+                char = _ESCAPES.get(text[i], "\\" + text[i])
+            chars.append(char)
+            i += 1
+        labels[key] = "".join(chars)
+        i += 1
+    return labels
+
+
+class _Family:
+    """A metric family being collected."""
+
+    __slots__ = ("name", "typ", "allowed_names", "keep", "name_ids")
+
+    def __init__(self, name: str, typ: str = "untyped"):
+        self.name = name
+        self.typ = typ
+        self.allowed_names = (name,)
+        self.keep: Optional[bool] = None
+        # Batch name id for each sample name seen in this family
+        self.name_ids: Dict[str, int] = {}
+
+    def set_type(self, typ: str) -> None:
+        self.typ = typ
+        suffixes = TYPE_SUFFIXES.get(typ, ("",))
+        self.allowed_names = tuple(self.name + suffix for suffix in suffixes)
+
+    @property
+    def output_name(self) -> str:
+        """Family name as reported by prometheus_client."""
+        if self.typ == "counter" and self.name.endswith("_total"):
+            return self.name[:-6]
+        return self.name
+
+    def sample_name(self, name: str) -> str:
+        """Sample name as reported by prometheus_client."""
+        if self.typ == "counter" and name == self.name and self.output_name == name:
+            # Counters without the suffix get it added
+            return name + "_total"
+        return name
+
+
+class StreamingPrometheusParser:
+    """
+    Incremental parser for the Prometheus text format.
+
+    Feed it text with `feed` as it arrives, then call `close_batch` to get
+    the parsed samples, or `close` to get them in the dict layout of
+    `parse_prometheus_metrics`. When an allow-list is given, samples of other
+    families are skipped after reading only their name.
+    """
+
+    def __init__(
+        self,
+        allow_list: Optional[MetricAllowList] = None,
+        configured_metrics: Optional[Iterable[str]] = None,
+        timestamp: Optional[str] = None,
+        label_interner: Optional[Any] = None,
+    ):
+        """
+        Initialize the parser.
+
+        Args:
+            allow_list: Families to keep, or None to keep every family
+            configured_metrics: Metric names flagged with `is_configured`
+            timestamp: Timestamp for every sample (defaults to now)
+            label_interner: `LabelInterner` kept between scrapes of the target,
+                so that label sets seen in earlier scrapes are not parsed again
+        """
+        self.allow_list = allow_list
+        self.configured_metrics = set(configured_metrics or ())
+        self.batch = SampleBatch(timestamp or datetime.now(UTC).isoformat())
+        self.skipped_samples = 0
+        self._parse_labels = parse_labels
+        if label_interner is not None:
+            self._parse_labels = label_interner.label_set
+        self._family: Optional[_Family] = None
+        self._buffer = ""
+
+    def feed(self, chunk: str) -> None:
+        """Parse a chunk of text, keeping any incomplete last line for later."""
+        data = self._buffer + chunk
+        lines = data.split("\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            self.feed_line(line)
+
+    def close_batch(self) -> SampleBatch:
+        """Parse any remaining text and return the samples."""
+        if self._buffer:
+            self.feed_line(self._buffer)
+            self._buffer = ""
+        self._family = None
+        return self.batch
+
+    def close(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Parse any remaining text and return the metrics by family name."""
+        return self.close_batch().to_metrics(self.configured_metrics)
+
+    def feed_line(self, line: str) -> None:
+        """Parse one line of the exposition format."""
+        line = line.strip()
+        if not line:
+            return
+
+        if line[0] == "#":
+            self._parse_comment(line)
+            return
+
+        # Read just the sample name to decide whether to keep the line
+        brace = line.find("{")
+        space = line.find(" ")
+        if brace != -1 and (space == -1 or brace < space):
+            name = line[:brace]
+        else:
+            name = line[:space] if space != -1 else line
+
+        family = self._family
+        if family is None or name not in family.allowed_names:
+            # A sample outside the current family is an untyped family of its own
+            family = self._family = _Family(name)
+
+        if family.keep is None:
+            family.keep = self._is_allowed(family, name)
+        if not family.keep:
+            self.skipped_samples += 1
+            return
+
+        batch = self.batch
+        name_id = family.name_ids.get(name)
+        if name_id is None:
+            name_id = family.name_ids[name] = batch.name_id(
+                family.sample_name(name), family.output_name
+            )
+
+        if brace != -1 and (space == -1 or brace < space):
+            close = line.rindex("}")
+            labels_text = line[brace + 1 : close]
+            rest = line[close + 1 :].split()
+        else:
+            labels_text = ""
+            rest = line[len(name) :].split()
+
+        # Label sets repeat across families, so only parse unseen label text
+        label_set_id = batch.find_label_set(labels_text)
+        if label_set_id is None:
+            labels = self._parse_labels(labels_text)
+            label_set_id = batch.label_set_id(labels, labels_text)
+
+        batch.append(name_id, label_set_id, float(rest[0]))
+
+    def _parse_comment(self, line: str) -> None:
+        """Handle `# HELP` and `# TYPE` lines; ignore other comments."""
+        parts = line.split(None, 3)
+        if len(parts) < 3 or parts[1] not in ("HELP", "TYPE"):
+            return
+
+        name = parts[2]
+        family = self._family
+        if family is None or family.name != name:
+            family = self._family = _Family(name)
+
+        if parts[1] == "TYPE" and len(parts) == 4:
+            family.set_type(parts[3].strip())
+
+    def _is_allowed(self, family: _Family, name: str) -> bool:
+        """
+        Check a family against the allow-list.
+
+        Counter paths may be written with or without `_total`, so the family
+        name and the sample name are checked both as exposed and as reported
+        by prometheus_client.
+        """
+        allow_list = self.allow_list
+        if allow_list is None:
+            return True
+        return any(
+            allow_list.allows(candidate)
+            for candidate in (
+                family.output_name,
+                family.name,
+                name,
+                family.sample_name(name),
+            )
+        )
+
+
+def parse_prometheus_stream(
+    chunks: Iterable[str],
+    metric_configs: Optional[List],
+    allow_list: Optional[MetricAllowList] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Parse Prometheus metrics from an iterable of text chunks, such as an open
+    file or the decoded chunks of an HTTP response.
+
+    Only families in the allow-list are returned. If no allow-list is given,
+    one is built from the `path` of each metric configuration.
+    """
+    if allow_list is None:
+        allow_list = build_allow_list(metric_configs)
+    parser = StreamingPrometheusParser(
+        allow_list, (m.name for m in metric_configs or [])
+    )
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
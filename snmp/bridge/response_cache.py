@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Exporter response cache for the SNMP Bridge.
+This module shares one exporter response between targets that send the same
+request, such as several targets scraping one device with the same module.
+Identical requests that are in flight at the same time wait for a single
+fetch, and a response is reused for a short time after it arrived.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from runtime_schema import RuntimeConfig
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+def get_response_cache_ttl(config: RuntimeConfig) -> float:
+    """Get the seconds an exporter response is reused (0 disables the cache)."""
+    if config.global_:
+        return config.global_.response_cache_ttl
+    return 0.0
+
+
+class CachedResponse:
+    """Body of an exporter response and the validators sent with it."""
+
+    __slots__ = ("text", "etag", "last_modified", "fetched_at")
+
+    def __init__(
+        self,
+        text: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = 0.0
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers that revalidate this response."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+# Fetches a response given the conditional headers to send, returning None
+# when the exporter answered 304 Not Modified
+FetchFunction = Callable[[Dict[str, str]], Awaitable[Optional[CachedResponse]]]
+
+
+class ResponseCache:
+    """
+    Cache of exporter responses with request coalescing.
+
+    A response is reused for `ttl` seconds. The first request for a key after
+    that fetches it again, while identical requests arriving meanwhile wait
+    for that fetch instead of sending their own. If the exporter sent an
+    `ETag` or `Last-Modified` header, the expired response is kept and the
+    new request is made conditional, so a 304 answer reuses the cached body.
+
+    Errors are passed to every waiting request and are not cached.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 0.0,
+        max_entries: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds a response is reused; 0 disables the cache
+            max_entries: Maximum number of responses kept
+            clock: Monotonic clock in seconds
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: Dict[Hashable, CachedResponse] = {}
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {"hits": 0, "coalesced": 0, "misses": 0, "revalidated": 0}
+
+    @property
+    def enabled(self) -> bool:
+        """Whether responses are shared at all."""
+        return self.ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Drop all cached responses. Fetches in flight are not affected."""
+        self._entries.clear()
+
+    async def get(
+        self, key: Hashable, fetch: FetchFunction, ttl: Optional[float] = None
+    ) -> str:
+        """
+        Get the response body for a request, fetching it if needed.
+
+        Args:
+            key: Identity of the request, such as its URL and headers
+            fetch: Sends the request with the given conditional headers
+            ttl: Seconds to reuse the response of this request; `ttl` if None
+
+        Returns:
+            The response body
+        """
+        if ttl is None:
+            ttl = self.ttl
+        entry = self._entries.get(key)
+        if entry is not None and self._clock() - entry.fetched_at < ttl:
+            self.stats["hits"] += 1
+            return entry.text
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            # A cancelled waiter must not cancel the fetch the others wait for
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self.stats["misses"] += 1
+        try:
+            response = await fetch(entry.validators if entry is not None else {})
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the error as retrieved in case no other request waited
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+        if response is None:
+            # Not modified, so the cached body is still current
+            self.stats["revalidated"] += 1
+            response = entry
+        self._store(key, response)
+        future.set_result(response.text)
+        return response.text
+
+    def _store(self, key: Hashable, response: CachedResponse) -> None:
+        """Keep a response, dropping the oldest ones over `max_entries`."""
+        response.fetched_at = self._clock()
+        self._entries.pop(key, None)
+        self._entries[key] = response
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
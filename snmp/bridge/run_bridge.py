@@ -4,17 +4,31 @@ Continuous runner for the SNMP Bridge
 This script fetches metrics from SNMP exporters and writes them to Elasticsearch
 """
 
-import time
+import asyncio
 import logging
 import sys
 import json
 import os
 from datetime import datetime
 
-from test_snmp_fetch import fetch_metrics
 from elasticsearch import Elasticsearch
-from elasticsearch_writer import write_metrics_to_elasticsearch
+from bulk_indexer import create_bulk_indexer
 from runtime_schema import RuntimeConfig
+from scheduler import ScrapeScheduler, get_concurrency
+from exporter_client import ExporterClientPool
+from response_cache import get_response_cache_ttl
+from parse_pool import ParsePool, get_parse_workers
+from sharding import create_sharder
+from target_health import HealthTracker, get_health_config
+from scrape_pipeline import ScrapePipeline
+from snmp_poller import SnmpPoller
+from self_metrics import BridgeMetrics, get_metrics_address
+from tracing import SignalProfiler, create_tracer, get_tracing_config
+from config_watcher import (
+    RuntimeConfigWatcher,
+    carry_over_unchanged,
+    diff_runtime_config,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -35,40 +49,34 @@ def load_runtime_config_from_elasticsearch(
     Returns:
         RuntimeConfig: The runtime configuration
     """
-    try:
-        # Check if the index exists
-        if not es_client.indices.exists(index=index_name):
-            logger.error(f"Runtime configuration index {index_name} does not exist")
-            return None
-
-        # Get the latest configuration
-        response = es_client.search(
-            index=index_name,
-            body={"size": 1, "sort": [{"@timestamp": {"order": "desc"}}]},
-        )
-
-        if not response["hits"]["hits"]:
-            logger.error("No runtime configuration found in Elasticsearch")
-            return None
+    return RuntimeConfigWatcher(es_client, index_name).poll()
 
-        config_doc = response["hits"]["hits"][0]["_source"]
 
-        if "config" not in config_doc:
-            logger.error(
-                "Invalid runtime configuration document: missing 'config' field"
-            )
-            return None
+def create_runtime_es_client(config, es_host, bootstrap_es_client):
+    """
+    Create the Elasticsearch client for writing metrics.
 
-        # Parse the configuration
-        config = RuntimeConfig.parse_obj(config_doc["config"])
-        logger.info(
-            f"Loaded runtime configuration version {config.version} from Elasticsearch"
+    Uses the credentials from the runtime configuration with the bootstrap
+    host, or the bootstrap client if the configuration has none.
+    """
+    if config.global_ and config.global_.elasticsearch:
+        return Elasticsearch(
+            es_host,  # Use the bootstrap host
+            basic_auth=(
+                config.global_.elasticsearch.auth.username,
+                config.global_.elasticsearch.auth.password,
+            ),
+            verify_certs=config.global_.elasticsearch.tls.verify
+            if hasattr(config.global_.elasticsearch, "tls")
+            else False,
+            ssl_show_warn=False,
         )
-        return config
 
-    except Exception as e:
-        logger.error(f"Error loading runtime configuration from Elasticsearch: {e}")
-        return None
+    # Use the bootstrap client if no configuration is available
+    logger.warning(
+        "No Elasticsearch configuration in runtime config, using bootstrap client"
+    )
+    return bootstrap_es_client
 
 
 def main():
@@ -100,8 +108,9 @@ def main():
         logger.error(f"Failed to connect to Elasticsearch: {str(e)}")
         sys.exit(1)
 
-    # Load runtime configuration from Elasticsearch
-    config = load_runtime_config_from_elasticsearch(bootstrap_es_client)
+    # Load runtime configuration from Elasticsearch, then watch it for changes
+    config_watcher = RuntimeConfigWatcher(bootstrap_es_client)
+    config = config_watcher.poll()
 
     # Fall back to local configuration if needed
     if config is None:
@@ -121,102 +130,205 @@ def main():
             sys.exit(1)
 
     # Create Elasticsearch client using the runtime configuration
-    if config.global_ and config.global_.elasticsearch:
-        es_client = Elasticsearch(
-            bootstrap_es_host,  # Use the bootstrap host
-            basic_auth=(
-                config.global_.elasticsearch.auth.username,
-                config.global_.elasticsearch.auth.password,
-            ),
-            verify_certs=config.global_.elasticsearch.tls.verify
-            if hasattr(config.global_.elasticsearch, "tls")
-            else False,
-            ssl_show_warn=False,
-        )
-    else:
-        # Use the bootstrap client if no configuration is available
-        logger.warning(
-            "No Elasticsearch configuration in runtime config, using bootstrap client"
+    es_client = create_runtime_es_client(config, bootstrap_es_host, bootstrap_es_client)
+
+    # Index documents from every target through one buffered bulk indexer
+    bulk_indexer = create_bulk_indexer(es_client, config)
+    bulk_indexer.start()
+
+    # Record self-monitoring metrics, served if BRIDGE_METRICS_PORT is set
+    metrics_registry = BridgeMetrics()
+    metrics_registry.watch_bulk_indexer(bulk_indexer)
+    metrics_address, metrics_port = get_metrics_address()
+    if metrics_port:
+        metrics_registry.start_server(metrics_address, metrics_port)
+
+    # Time the stages of scrapes and flushes, exporting a sample of them
+    tracing_config = get_tracing_config(config)
+    tracer = create_tracer(tracing_config, bulk_indexer)
+    bulk_indexer.flush_observers.append(
+        lambda seconds, doc_count: tracer.record(
+            "bulk_flush", seconds, documents=doc_count
         )
-        es_client = bootstrap_es_client
-
-    # Get global metadata
-    global_metadata = (
-        config.global_.metadata if hasattr(config.global_, "metadata") else {}
+    )
+    SignalProfiler(
+        tracing_config.profile_dir,
+        tracing_config.profiler,
+        tracing_config.profile_seconds,
+    ).install()
+
+    # Optionally parse in worker processes to use more than one core
+    parse_workers = get_parse_workers(config)
+    parse_pool = None
+    if parse_workers:
+        parse_pool = ParsePool(parse_workers, config.global_.label_cache_size)
+
+    # Fetch, parse, build and queue each scrape over pooled exporter sessions
+    exporter_pool = ExporterClientPool(
+        limit=get_concurrency(config),
+        cache_ttl=get_response_cache_ttl(config),
+    )
+    metrics_registry.watch_response_cache(exporter_pool.response_cache)
+    metrics_registry.watch_exporter_pool(exporter_pool)
+
+    # Adapt timeouts to each target's latency and only probe dead targets
+    health = HealthTracker(get_health_config(config))
+    metrics_registry.watch_target_health(health)
+
+    # Targets with a poller section are polled over SNMP without the exporter
+    snmp_poller = SnmpPoller()
+    pipeline = ScrapePipeline(
+        config,
+        exporter_pool,
+        bulk_indexer,
+        metrics=metrics_registry,
+        tracer=tracer,
+        parse_pool=parse_pool,
+        health=health,
+        snmp_poller=snmp_poller,
     )
 
-    # Run continuously
-    try:
-        while True:
-            start_time = time.time()
-            logger.info(
-                f"Starting metrics collection cycle at {datetime.now().isoformat()}"
-            )
+    # Split the targets with other bridge instances if sharding is enabled
+    sharder = None
+    lease_task = None
+
+    def start_sharding():
+        """Register this instance if sharding is enabled in the configuration"""
+        nonlocal sharder
+        sharder = create_sharder(es_client, config)
+        if sharder is not None:
+            try:
+                sharder.refresh()
+            except Exception as e:
+                logger.error(f"Failed to register bridge instance: {str(e)}")
 
-            # Process each target
-            for target_name in config.targets:
-                target_start = time.time()
-                logger.info(f"Processing target: {target_name}")
-
-                try:
-                    # Fetch metrics
-                    metrics = fetch_metrics(config, target_name)
-
-                    # Write metrics to Elasticsearch
-                    if metrics:
-                        target_config = config.targets[target_name]
-                        docs_indexed = write_metrics_to_elasticsearch(
-                            es_client, metrics, target_config, global_metadata
-                        )
-                        logger.info(
-                            f"Successfully wrote {docs_indexed} metrics for {target_name}"
-                        )
-                    else:
-                        logger.warning(f"No metrics fetched for {target_name}")
-
-                except Exception as e:
-                    logger.error(f"Error processing target {target_name}: {str(e)}")
-
-                target_duration = time.time() - target_start
-                logger.info(
-                    f"Completed processing target {target_name} in {target_duration:.2f} seconds"
-                )
-
-            # Calculate cycle duration and sleep if needed
-            cycle_duration = time.time() - start_time
-            logger.info(
-                f"Completed metrics collection cycle in {cycle_duration:.2f} seconds"
+    def stop_sharding():
+        """Give up this instance's lease, if it has one"""
+        nonlocal sharder
+        if sharder is not None:
+            try:
+                sharder.release()
+            except Exception as e:
+                logger.error(f"Failed to release bridge instance lease: {str(e)}")
+            sharder = None
+
+    start_sharding()
+
+    # Targets fetched in one batched request are owned and scheduled together
+    def owns(target_name):
+        if sharder is None:
+            return True
+        return sharder.owns(pipeline.batch_group(target_name))
+
+    scheduler = ScrapeScheduler(
+        config,
+        pipeline.scrape,
+        owns=owns,
+        admit=health.allow,
+        group=pipeline.batch_group,
+    )
+
+    def apply_config(new_config):
+        """Apply a changed configuration, keeping state for unchanged targets"""
+        nonlocal config, es_client, lease_task
+        diff = diff_runtime_config(config, new_config)
+        if diff.empty:
+            logger.info("Runtime configuration contents are unchanged")
+            return
+
+        # Unchanged targets and exporters keep their objects, so their
+        # mapping plans and exporter sessions are reused as they are
+        new_config = carry_over_unchanged(config, new_config, diff)
+
+        if diff.elasticsearch_changed:
+            logger.info("Elasticsearch settings changed, creating a new client")
+            es_client = create_runtime_es_client(
+                new_config, bootstrap_es_host, bootstrap_es_client
             )
+            if sharder is not None and not diff.sharding_changed:
+                sharder.registry.es_client = es_client
+        if diff.global_changed:
+            # Batching, refresh, compression, retry and replay settings
+            bulk_indexer.update_config(new_config, es_client)
+
+        config = new_config
+        if diff.sharding_changed:
+            # Leave the ring under the old settings and join it under the new
+            logger.info("Sharding settings changed, registering this instance again")
+            stop_sharding()
+            start_sharding()
+            if sharder is not None and (lease_task is None or lease_task.done()):
+                lease_task = asyncio.create_task(renew_lease())
+        pipeline.update_config(new_config)
+        scheduler.update_config(new_config)
+        exporter_pool.retain(new_config.exporters)
+        exporter_pool.set_cache_ttl(get_response_cache_ttl(new_config))
+        metrics_registry.retain(
+            (name, target.exporter) for name, target in new_config.targets.items()
+        )
+        health.update_config(get_health_config(new_config))
+        health.retain(new_config.targets)
+        logger.info(f"Applied runtime configuration change: {diff}")
 
-            # Sleep until next collection cycle (default 60 seconds)
+    async def reload_config():
+        """Reload configuration from Elasticsearch when it changes"""
+        while True:
             collection_interval = getattr(config, "collection_interval", 60)
-            sleep_time = max(0, collection_interval - cycle_duration)
-
-            if sleep_time > 0:
-                logger.info(
-                    f"Sleeping for {sleep_time:.2f} seconds until next collection cycle"
-                )
-                time.sleep(sleep_time)
-            else:
-                logger.warning(
-                    f"Collection cycle took longer than the interval ({cycle_duration:.2f} > {collection_interval})"
-                )
-
-            # Reload configuration from Elasticsearch periodically
+            await asyncio.sleep(collection_interval)
+
             try:
-                new_config = load_runtime_config_from_elasticsearch(bootstrap_es_client)
+                # Only fetches and parses the configuration if it has changed
+                new_config = await asyncio.to_thread(config_watcher.poll)
                 if new_config:
-                    config = new_config
-                    logger.info(
-                        "Successfully reloaded runtime configuration from Elasticsearch"
-                    )
+                    apply_config(new_config)
             except Exception as e:
                 logger.error(f"Failed to reload runtime configuration: {str(e)}")
 
+    async def renew_lease():
+        """Renew this instance's lease and rebalance when instances change"""
+        while sharder is not None:
+            current = sharder
+            await asyncio.sleep(current.renew_interval)
+            if current is not sharder:
+                # Sharding was reconfigured while waiting
+                continue
+            try:
+                if await asyncio.to_thread(current.refresh):
+                    scheduler.rebalance()
+            except Exception as e:
+                # Keep scraping the current share until the registry is back
+                logger.error(f"Failed to renew bridge instance lease: {str(e)}")
+
+    async def run():
+        """Run the scrape scheduler alongside the configuration reloader"""
+        logger.info(f"Starting metrics collection at {datetime.now().isoformat()}")
+        nonlocal lease_task
+        reload_task = asyncio.create_task(reload_config())
+        if sharder is not None:
+            lease_task = asyncio.create_task(renew_lease())
+        try:
+            await scheduler.run()
+        finally:
+            for task in (reload_task, lease_task):
+                if task is not None:
+                    task.cancel()
+            await exporter_pool.close()
+            snmp_poller.close()
+
+    # Run continuously
+    try:
+        asyncio.run(run())
     except KeyboardInterrupt:
         logger.info("SNMP Bridge stopped by user")
     except Exception as e:
         logger.error(f"SNMP Bridge stopped due to error: {str(e)}")
+    finally:
+        if parse_pool is not None:
+            parse_pool.close()
+        stop_sharding()
+        logger.info("Flushing queued documents")
+        bulk_indexer.close()
+        tracer.close()
 
 
 if __name__ == "__main__":
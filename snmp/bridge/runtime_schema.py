@@ -24,6 +24,28 @@ class ECSFieldType(str, Enum):
     IP = "ip"
 
 
+class RefreshPolicy(str, Enum):
+    """Refresh behaviour for bulk writes to Elasticsearch."""
+
+    NONE = "none"
+    WAIT_FOR = "wait_for"
+    TRUE = "true"
+
+
+class ParserMode(str, Enum):
+    """How exporter responses are parsed."""
+
+    FULL = "full"
+    STREAMING = "streaming"
+
+
+class DocumentLayout(str, Enum):
+    """How the samples of a scrape are arranged into documents."""
+
+    MERGED = "merged"
+    SERIES = "series"
+
+
 class TLSConfig(BaseModel):
     """TLS/SSL configuration for HTTP connections."""
 
@@ -54,6 +76,51 @@ class ApiKeyAuth(BaseModel):
     api_key: str = Field(..., description="API key for authentication")
 
 
+class BulkConfig(BaseModel):
+    """Batching settings for bulk indexing."""
+
+    max_documents: int = Field(
+        500, description="Flush a batch once it holds this many documents", ge=1
+    )
+    max_bytes: int = Field(
+        5 * 1024 * 1024,
+        description="Flush a batch once its body reaches this many bytes",
+        ge=1,
+    )
+    flush_interval: float = Field(
+        5.0, description="Flush a batch after this many seconds", gt=0
+    )
+    max_queue_documents: int = Field(
+        10000,
+        description="Maximum number of documents waiting to be indexed",
+        ge=1,
+    )
+    max_request_bytes: int = Field(
+        20 * 1024 * 1024,
+        description="Split a batch over several bulk requests above this many bytes",
+        ge=1,
+    )
+
+
+class SpoolConfig(BaseModel):
+    """Disk spool for documents that cannot be indexed while Elasticsearch is down."""
+
+    path: str = Field(..., description="Directory for the spool files")
+    max_bytes: int = Field(
+        1024 * 1024 * 1024,
+        description="Maximum size of the spool; the oldest documents are dropped above it",
+        ge=1,
+    )
+    segment_bytes: int = Field(
+        16 * 1024 * 1024, description="Size of each spool file", ge=1
+    )
+    replay_bytes_per_second: int = Field(
+        1024 * 1024,
+        description="Rate at which spooled documents are sent once Elasticsearch is back",
+        ge=1,
+    )
+
+
 class ElasticsearchConfig(BaseModel):
     """Configuration for Elasticsearch connection."""
 
@@ -61,6 +128,32 @@ class ElasticsearchConfig(BaseModel):
         ..., description="Authentication credentials for Elasticsearch"
     )
     tls: Optional[TLSConfig] = Field(None, description="TLS/SSL configuration")
+    bulk: Optional[BulkConfig] = Field(
+        None, description="Batching settings for bulk indexing"
+    )
+    spool: Optional[SpoolConfig] = Field(
+        None, description="Disk spool for documents that cannot be indexed"
+    )
+    compression_level: int = Field(
+        0,
+        description=(
+            "Gzip level for bulk request bodies, from 1 (fastest) to 9 (smallest); "
+            "0 sends them uncompressed"
+        ),
+        ge=0,
+        le=9,
+    )
+    refresh: RefreshPolicy = Field(
+        RefreshPolicy.NONE,
+        description="Refresh policy for bulk writes (none, wait_for or true)",
+    )
+    layout: DocumentLayout = Field(
+        DocumentLayout.MERGED,
+        description=(
+            "Document layout: 'merged' writes one document per scrape, 'series' "
+            "writes one document per label set"
+        ),
+    )
 
 
 class ExporterConfig(BaseModel):
@@ -101,6 +194,26 @@ class MetricConfig(BaseModel):
         None, description="Labels to include with the metric"
     )
     ecs_mapping: Optional[ECSMapping] = Field(None, description="Mapping to ECS fields")
+    oid: Optional[str] = Field(
+        None,
+        description="Numeric OID of the table column or scalar, for targets polled directly",
+    )
+    index_label: Optional[str] = Field(
+        None,
+        description="Label for the table index of samples polled directly (default: index)",
+    )
+
+
+class SnmpPollerConfig(BaseModel):
+    """Settings for polling a target directly over SNMP v2c."""
+
+    community: str = Field("public", description="SNMP v2c community")
+    max_repetitions: int = Field(
+        25, description="Rows of each table requested per GETBULK request", ge=1
+    )
+    retries: int = Field(
+        1, description="Times to resend an unanswered SNMP request", ge=0
+    )
 
 
 class TargetConfig(BaseModel):
@@ -119,6 +232,17 @@ class TargetConfig(BaseModel):
     auth: Optional[str] = Field(
         None, description="Authentication type for SNMP exporter"
     )
+    exporter_url: Optional[HttpUrl] = Field(
+        None,
+        description="URL of the exporter for this target, overrides the exporter URL",
+    )
+    secondary_exporter_url: Optional[HttpUrl] = Field(
+        None,
+        description=(
+            "URL of a second exporter for this target, sent a hedged request when "
+            "the first is slow or fails"
+        ),
+    )
     metrics: List[MetricConfig] = Field(
         ..., description="Metrics to collect from this target"
     )
@@ -133,6 +257,120 @@ class TargetConfig(BaseModel):
     index: Optional[str] = Field(
         "hedgehog-snmp-metrics", description="Elasticsearch index to write metrics to"
     )
+    parser: Optional[ParserMode] = Field(
+        None, description="Parser mode for this target, overrides the global parser"
+    )
+    layout: Optional[DocumentLayout] = Field(
+        None,
+        description="Document layout for this target, overrides the global layout",
+    )
+    poller: Optional[SnmpPollerConfig] = Field(
+        None,
+        description=(
+            "Poll the device at `target` directly over SNMP instead of through the "
+            "exporter, collecting the metrics that have an OID"
+        ),
+    )
+
+
+class ShardingConfig(BaseModel):
+    """Split the targets between bridge instances that share a configuration."""
+
+    enabled: bool = Field(
+        False, description="Scrape only the targets assigned to this instance"
+    )
+    lease_index: str = Field(
+        ".hedgehog-snmp-bridge-leases",
+        description="Elasticsearch index where instances register their leases",
+    )
+    lease_ttl: int = Field(
+        30,
+        description="Seconds an instance keeps its targets without renewing its lease",
+        ge=3,
+    )
+    virtual_nodes: int = Field(
+        100, description="Points per instance on the hash ring", ge=1
+    )
+
+
+class ProfilerKind(str, Enum):
+    """Profiler used for captures triggered by a signal."""
+
+    CPROFILE = "cprofile"
+    PYINSTRUMENT = "pyinstrument"
+
+
+class TracingConfig(BaseModel):
+    """Sampled timing traces of scrape stages and on-demand profiling."""
+
+    sample_rate: float = Field(
+        0, description="Fraction of scrapes and bulk flushes to trace", ge=0, le=1
+    )
+    path: Optional[str] = Field(
+        None, description="File to append sampled traces to as JSON lines"
+    )
+    index: Optional[str] = Field(
+        None, description="Elasticsearch index to write sampled traces to"
+    )
+    profiler: ProfilerKind = Field(
+        ProfilerKind.CPROFILE,
+        description="Profiler started and stopped with SIGUSR2",
+    )
+    profile_dir: Optional[str] = Field(
+        None,
+        description="Directory for profile captures; the temporary directory if not set",
+    )
+    profile_seconds: int = Field(
+        60, description="Seconds after which a profile capture stops by itself", ge=1
+    )
+
+
+class HealthConfig(BaseModel):
+    """Adaptive scrape timeouts and a circuit breaker for unresponsive targets."""
+
+    adaptive_timeout: bool = Field(
+        True,
+        description="Shorten each target's timeout to what its observed latency needs",
+    )
+    timeout_percentile: float = Field(
+        0.99,
+        description="Latency percentile the adaptive timeout is based on",
+        gt=0,
+        le=1,
+    )
+    timeout_multiplier: float = Field(
+        3.0, description="Multiple of the latency percentile used as timeout", ge=1
+    )
+    min_timeout: float = Field(
+        2.0, description="Shortest adaptive timeout in seconds", gt=0
+    )
+    min_samples: int = Field(
+        10,
+        description="Successful scrapes needed before the timeout adapts",
+        ge=1,
+    )
+    latency_window: int = Field(
+        100, description="Number of recent latencies kept per target", ge=1
+    )
+    failure_threshold: int = Field(
+        3,
+        description="Consecutive failed scrapes after which a target is only probed",
+        ge=1,
+    )
+    probe_interval: int = Field(
+        300,
+        description="Seconds between probes of a target whose breaker is open",
+        ge=1,
+    )
+    hedge_percentile: float = Field(
+        0.95,
+        description=(
+            "Latency percentile after which a hedged request is sent to the "
+            "target's secondary exporter"
+        ),
+        gt=0,
+        le=1,
+    )
 
 
 class GlobalConfig(BaseModel):
@@ -152,6 +390,60 @@ class GlobalConfig(BaseModel):
     elasticsearch: Optional[ElasticsearchConfig] = Field(
         None, description="Elasticsearch configuration for writing metrics"
     )
+    label_cache_size: int = Field(
+        10000,
+        description="Maximum number of label sets kept per target between scrapes",
+        ge=0,
+    )
+    parse_workers: int = Field(
+        0,
+        description=(
+            "Worker processes for parsing responses and building documents; "
+            "0 parses in the main process"
+        ),
+        ge=0,
+    )
+    parser: ParserMode = Field(
+        ParserMode.FULL,
+        description=(
+            "Parser mode: 'full' parses every metric family, 'streaming' parses the "
+            "response as it arrives and keeps only the configured metric paths"
+        ),
+    )
+    sharding: Optional[ShardingConfig] = Field(
+        None, description="Split the targets between several bridge instances"
+    )
+    tracing: Optional[TracingConfig] = Field(
+        None, description="Sampled stage traces and signal-triggered profiling"
+    )
+    health: Optional[HealthConfig] = Field(
+        None,
+        description="Adaptive timeouts and circuit breaking for unresponsive targets",
+    )
+    scrape_deadline: float = Field(
+        0,
+        description=(
+            "Fraction of its interval a scrape may take from its scheduled time, "
+            "including waiting for a concurrency slot; 0 disables deadlines"
+        ),
+        ge=0,
+        le=1,
+    )
+    batch_modules: bool = Field(
+        False,
+        description=(
+            "Fetch the modules of targets on the same device in one exporter "
+            "request and split the samples by each target's metrics"
+        ),
+    )
+    response_cache_ttl: float = Field(
+        0,
+        description=(
+            "Seconds an exporter response is shared between targets sending the "
+            "same request; 0 disables sharing"
+        ),
+        ge=0,
+    )
 
 
 class RuntimeConfig(BaseModel):
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Compact sample storage for the SNMP Bridge.
+This module stores the samples of one scrape as columns instead of one dict
+per sample. Every sample shares the scrape timestamp, and sample names and
+label sets are stored once and referred to by id.
+"""
+
+from array import array
+from datetime import datetime, UTC
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+
+class SampleBatch:
+    """
+    Samples from one scrape of a target, stored as columns.
+
+    Each sample is a sample name id, a label set id and a float value, held
+    in three parallel arrays. Sample names map to the metric family they
+    belong to, so the family of a sample is found through its name.
+
+    Label sets are shared: samples with the same labels refer to the same
+    dict, which must not be modified.
+    """
+
+    __slots__ = (
+        "timestamp",
+        "families",
+        "names",
+        "name_families",
+        "label_sets",
+        "name_ids",
+        "label_set_ids",
+        "values",
+        "_family_index",
+        "_name_index",
+        "_label_set_index",
+    )
+
+    def __init__(self, timestamp: Optional[str] = None):
+        """
+        Initialize an empty batch.
+
+        Args:
+            timestamp: Timestamp for every sample (defaults to now)
+        """
+        self.timestamp = timestamp or datetime.now(UTC).isoformat()
+        self.families: List[str] = []
+        self.names: List[str] = []
+        self.name_families: List[int] = []
+        self.label_sets: List[Dict[str, str]] = []
+        self.name_ids = array("I")
+        self.label_set_ids = array("I")
+        self.values = array("d")
+        self._family_index: Dict[str, int] = {}
+        self._name_index: Dict[str, int] = {}
+        self._label_set_index: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[Tuple[str, str, Dict[str, str], float]]:
+        """Iterate over samples as (family, name, labels, value) tuples."""
+        families = self.families
+        names = self.names
+        name_families = self.name_families
+        label_sets = self.label_sets
+        for name_id, label_set_id, value in zip(
+            self.name_ids, self.label_set_ids, self.values
+        ):
+            yield (
+                families[name_families[name_id]],
+                names[name_id],
+                label_sets[label_set_id],
+                value,
+            )
+
+    def family_id(self, family: str) -> int:
+        """Get the id of a metric family, adding it if needed."""
+        family_id = self._family_index.get(family)
+        if family_id is None:
+            family_id = self._family_index[family] = len(self.families)
+            self.families.append(family)
+        return family_id
+
+    def name_id(self, name: str, family: str) -> int:
+        """Get the id of a sample name in a family, adding it if needed."""
+        name_id = self._name_index.get(name)
+        if name_id is None:
+            name_id = self._name_index[name] = len(self.names)
+            self.names.append(name)
+            self.name_families.append(self.family_id(family))
+        return name_id
+
+    def find_label_set(self, key: Hashable) -> Optional[int]:
+        """Get the id of a label set previously added under `key`, if any."""
+        return self._label_set_index.get(key)
+
+    def label_set_id(
+        self, labels: Dict[str, str], key: Optional[Hashable] = None
+    ) -> int:
+        """
+        Get the id of a label set, adding it if needed.
+
+        `key` identifies the label set; it defaults to its items, but a
+        parser can use the raw label text to avoid parsing repeated labels.
+        """
+        if key is None:
+            key = tuple(labels.items())
+        label_set_id = self._label_set_index.get(key)
+        if label_set_id is None:
+            label_set_id = self._label_set_index[key] = len(self.label_sets)
+            self.label_sets.append(labels)
+        return label_set_id
+
+    def append(self, name_id: int, label_set_id: int, value: float) -> None:
+        """Add a sample using ids from `name_id` and `label_set_id`."""
+        self.name_ids.append(name_id)
+        self.label_set_ids.append(label_set_id)
+        self.values.append(value)
+
+    def add(self, family: str, name: str, labels: Dict[str, str], value: float) -> None:
+        """Add a sample."""
+        self.append(self.name_id(name, family), self.label_set_id(labels), value)
+
+    def used_label_sets(self) -> List[Dict[str, str]]:
+        """Label sets in the order they are first used by a sample."""
+        label_sets = self.label_sets
+        return [label_sets[i] for i in dict.fromkeys(self.label_set_ids)]
+
+    def to_metrics(
+        self, configured_metrics: Iterable[str] = ()
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Convert the batch to the dict layout of `parse_prometheus_metrics`.
+
+        Families listed in `configured_metrics` are flagged with
+        `is_configured`.
+        """
+        configured = set(configured_metrics)
+        metrics: Dict[str, List[Dict[str, Any]]] = {}
+        for family, name, labels, value in self:
+            samples = metrics.get(family)
+            if samples is None:
+                samples = metrics[family] = []
+            samples.append(
+                {
+                    "name": name,
+                    "labels": labels,
+                    "value": value,
+                    "timestamp": self.timestamp,
+                    "is_configured": family in configured,
+                }
+            )
+        return metrics
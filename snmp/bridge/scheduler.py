@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Scrape scheduler for the SNMP Bridge.
+This module runs each target on its own interval, with scrapes executed
+concurrently up to the global concurrency limit.
+"""
+
+import asyncio
+import logging
+import zlib
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from runtime_schema import RuntimeConfig
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+ScrapeFunction = Callable[..., Awaitable[object]]
+OwnershipFunction = Callable[[str], bool]
+GroupFunction = Callable[[str], str]
+
+
+def get_initial_offset(target_name: str, interval: float) -> float:
+    """
+    Get the start offset for a target within its interval.
+
+    The offset is derived from a hash of the target name so that scrapes are
+    spread across the interval, and stays the same across restarts.
+    """
+    interval_ms = max(1, int(interval * 1000))
+    return (zlib.crc32(target_name.encode("utf-8")) % interval_ms) / 1000.0
+
+
+def get_concurrency(config: RuntimeConfig) -> int:
+    """Get the maximum number of concurrent scrapes from the configuration."""
+    if config.global_:
+        return config.global_.concurrency
+    return 10
+
+
+def get_scrape_deadline(config: RuntimeConfig) -> float:
+    """Get the fraction of its interval a scrape may take, or 0 for no deadline."""
+    if config.global_:
+        return config.global_.scrape_deadline
+    return 0.0
+
+
+class ScrapeScheduler:
+    """
+    Run scrapes for every target in the runtime configuration.
+
+    Each target has its own loop that fires on the target's interval. A
+    semaphore limits how many scrapes run at the same time to
+    `GlobalConfig.concurrency`.
+
+    When several bridge instances share the configuration, `owns` selects
+    the targets this instance scrapes, and `rebalance` is called when their
+    assignment changes. `admit` is asked before each scheduled scrape, so
+    unresponsive targets can skip slots without moving the schedule of
+    others.
+
+    With `GlobalConfig.scrape_deadline` set, each scrape is also passed the
+    event loop time by which it must finish: its scheduled time plus that
+    fraction of its interval, so time spent waiting for a concurrency slot
+    counts against it.
+
+    `group` names the targets that should be scraped at the same time, such
+    as those sharing one exporter request. Targets of a group with the same
+    interval get the same start offset.
+    """
+
+    def __init__(
+        self,
+        config: RuntimeConfig,
+        scrape: ScrapeFunction,
+        owns: Optional[OwnershipFunction] = None,
+        admit: Optional[OwnershipFunction] = None,
+        group: Optional[GroupFunction] = None,
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            config: Runtime configuration with the targets to scrape
+            scrape: Coroutine function called with the target name for each
+                scrape, and its deadline if deadlines are enabled
+            owns: Whether this instance scrapes a target; all targets if None
+            admit: Whether a scheduled scrape of a target runs; all run if None
+            group: Name the start offset of a target is derived from; the
+                target name if None
+        """
+        self.config = config
+        self._scrape = scrape
+        self._owns = owns
+        self._admit = admit
+        self._group = group
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._concurrency = get_concurrency(config)
+        self._stopped: Optional[asyncio.Event] = None
+
+    @property
+    def target_names(self):
+        """Names of the targets that currently have a running schedule."""
+        return set(self._tasks)
+
+    async def run(self) -> None:
+        """Start a schedule for every target and run until stopped."""
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        self._stopped = asyncio.Event()
+
+        owned = self._owned_targets()
+        logger.info(
+            f"Starting scheduler for {len(owned)} of {len(self.config.targets)} "
+            f"targets with concurrency {self._concurrency}"
+        )
+        for target_name in owned:
+            self._start_target(target_name)
+
+        try:
+            await self._stopped.wait()
+        finally:
+            await self._cancel_all()
+
+    def stop(self) -> None:
+        """Stop the scheduler and all target schedules."""
+        if self._stopped:
+            self._stopped.set()
+
+    def update_config(self, config: RuntimeConfig) -> None:
+        """
+        Switch to a new runtime configuration.
+
+        Targets that are still present keep their schedule and pick up the new
+        settings on their next scrape. Removed targets are stopped and new
+        targets are started.
+        """
+        self.config = config
+
+        concurrency = get_concurrency(config)
+        if concurrency != self._concurrency:
+            logger.info(
+                f"Changing scrape concurrency from {self._concurrency} to {concurrency}"
+            )
+            self._concurrency = concurrency
+            self._semaphore = asyncio.Semaphore(concurrency)
+
+        self.rebalance()
+
+    def rebalance(self) -> None:
+        """Start and stop schedules so that exactly the owned targets run."""
+        old_names = set(self._tasks)
+        new_names = self._owned_targets()
+
+        for target_name in old_names - new_names:
+            if target_name in self.config.targets:
+                logger.info(f"Stopping schedule for reassigned target {target_name}")
+            else:
+                logger.info(f"Stopping schedule for removed target {target_name}")
+            self._tasks.pop(target_name).cancel()
+
+        for target_name in new_names - old_names:
+            self._start_target(target_name)
+
+    def _owned_targets(self) -> Set[str]:
+        """Names of the configured targets this instance scrapes."""
+        if self._owns is None:
+            return set(self.config.targets)
+        return {name for name in self.config.targets if self._owns(name)}
+
+    def _start_target(self, target_name: str) -> None:
+        """Create the schedule task for a target."""
+        self._tasks[target_name] = asyncio.create_task(
+            self._run_target(target_name), name=f"scrape-{target_name}"
+        )
+
+    async def _cancel_all(self) -> None:
+        """Cancel all target schedules and wait for them to finish."""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_target(self, target_name: str) -> None:
+        """Scrape a target on its interval until it is removed."""
+        loop = asyncio.get_running_loop()
+        interval = self.config.targets[target_name].interval
+        group_name = self._group(target_name) if self._group else target_name
+        offset = get_initial_offset(group_name, interval)
+        next_run = loop.time() + offset
+        logger.info(
+            f"Scheduling target {target_name} every {interval}s with offset {offset:.2f}s"
+        )
+
+        while True:
+            await asyncio.sleep(max(0.0, next_run - loop.time()))
+
+            target_config = self.config.targets.get(target_name)
+            if target_config is None:
+                return
+            interval = target_config.interval
+
+            if self._admit is None or self._admit(target_name):
+                deadline_fraction = get_scrape_deadline(self.config)
+                args = (target_name,)
+                if deadline_fraction:
+                    args += (next_run + deadline_fraction * interval,)
+                async with self._semaphore:
+                    try:
+                        await self._scrape(*args)
+                    except Exception as e:
+                        logger.error(f"Error processing target {target_name}: {str(e)}")
+
+            # Keep a fixed rate; skip any slots that were missed while scraping
+            next_run += interval
+            now = loop.time()
+            if next_run < now:
+                missed = int((now - next_run) // interval) + 1
+                logger.warning(
+                    f"Scrape of target {target_name} overran its interval "
+                    f"({interval}s), skipping {missed} slot(s)"
+                )
+                next_run += missed * interval
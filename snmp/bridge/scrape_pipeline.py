@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Scrape pipeline for the SNMP Bridge.
+This module runs one scrape of a target through its stages: fetching the
+exporter response, parsing it, building documents and queueing them for the
+bulk indexer. The bridge runs it for each scheduled scrape, and benchmarks
+drive it directly.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from elasticsearch_writer import (
+    MappingPlanCache,
+    build_metric_documents,
+    get_document_layout,
+)
+from exporter_client import ExporterClientPool, FetchOutcome, get_target_timeout
+from module_batching import ModuleBatch, get_batch_modules, plan_module_batches
+from parse_pool import ParsePool
+from prometheus_stream import StreamingPrometheusParser, get_parser_mode
+from runtime_schema import ParserMode, RuntimeConfig
+from self_metrics import BridgeMetrics, TargetMetrics, TimedParser
+from snmp_poller import SnmpPollError, SnmpPoller
+from target_health import HealthTracker
+from test_snmp_fetch import parse_prometheus_metrics
+from tracing import Trace, Tracer
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Errors that mean the exporter or device did not answer
+FETCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, SnmpPollError)
+
+
+class ScrapeLate(Exception):
+    """A scrape that missed, or would miss, its deadline."""
+
+
+def _check_queue_deadline(deadline: Optional[float]) -> None:
+    """
+    Raise ScrapeLate if a scrape's deadline passed before its documents are queued.
+
+    Called from the threads that queue documents, where the event loop's
+    clock is not at hand; the default event loop clock is `time.monotonic`.
+    """
+    if deadline is not None and time.monotonic() >= deadline:
+        raise ScrapeLate("deadline passed before its documents were queued")
+
+
+def get_global_metadata(config: RuntimeConfig) -> Dict[str, Any]:
+    """Get the metadata added to every document, or an empty dict."""
+    if config.global_ and config.global_.metadata:
+        return config.global_.metadata
+    return {}
+
+
+class ScrapePipeline:
+    """
+    Fetch, parse, build and queue the documents of one target per scrape.
+
+    The parser is chosen per target: the full prometheus_client parser, the
+    streaming parser fed as the response arrives, or a worker process from
+    `parse_pool` that returns a ready bulk body. Each scrape is timed stage
+    by stage in a trace, which also feeds the self-monitoring metrics.
+
+    The fetch latency or failure of every scrape is reported to `health`,
+    which sets the timeout of the target's next fetch and when to send a
+    hedged request to its secondary exporter. Only fetches that went to the
+    exporter count as latencies; cached and shared responses do not. A
+    scrape given a deadline is skipped if the target's median latency no
+    longer fits before it, and cancelled if it is still running when it
+    passes. Either way it is counted as late, not as failed. Documents are
+    not queued once the deadline has passed, even by a thread the
+    cancellation could not stop.
+
+    With `global.batch_modules`, targets on the same device fetch all their
+    modules with one shared request, and each keeps its configured metrics.
+
+    Targets with a `poller` section skip the exporter: `snmp_poller` walks
+    their OIDs over SNMP and the samples go straight to the build stage.
+    """
+
+    def __init__(
+        self,
+        config: RuntimeConfig,
+        exporter_pool: ExporterClientPool,
+        bulk_indexer,
+        metrics: Optional[BridgeMetrics] = None,
+        tracer: Optional[Tracer] = None,
+        parse_pool: Optional[ParsePool] = None,
+        health: Optional[HealthTracker] = None,
+        snmp_poller: Optional[SnmpPoller] = None,
+    ):
+        """
+        Initialize the pipeline.
+
+        Args:
+            config: Runtime configuration with the targets
+            exporter_pool: Client for the exporters
+            bulk_indexer: Bulk indexer the documents are queued on
+            metrics: Self-monitoring metrics; private ones if None
+            tracer: Tracer for the stage timings; one without export if None
+            parse_pool: Worker processes for parsing, or None to parse here
+            health: Target health tracker; a private one if None
+            snmp_poller: Poller for targets polled directly; a private one if None
+        """
+        self.exporter_pool = exporter_pool
+        self.bulk_indexer = bulk_indexer
+        self.metrics = metrics or BridgeMetrics()
+        self.tracer = tracer or Tracer()
+        self.parse_pool = parse_pool
+        self.health = health or HealthTracker()
+        self.snmp_poller = snmp_poller or SnmpPoller()
+        # Compile the metric mapping for each target once, not on every scrape
+        self.mapping_plans = MappingPlanCache()
+        self.update_config(config)
+
+    def update_config(self, config: RuntimeConfig) -> None:
+        """Switch to a new configuration from the next scrape."""
+        self.config = config
+        self.global_metadata = get_global_metadata(config)
+        self.mapping_plans.update(config)
+        self.batches = plan_module_batches(config) if get_batch_modules(config) else {}
+
+    def batch_group(self, target_name: str) -> str:
+        """Name shared by targets fetched together: the batch's, or the target's."""
+        batch = self.batches.get(target_name)
+        return batch.name if batch is not None else target_name
+
+    async def scrape(self, target_name: str, deadline: Optional[float] = None) -> Trace:
+        """
+        Fetch metrics for a target and queue them for Elasticsearch.
+
+        `deadline` is the event loop time by which the scrape must finish.
+        Errors are logged and counted rather than raised. Returns the trace
+        with the time taken by each stage.
+        """
+        logger.info(f"Processing target: {target_name}")
+        target_metrics = None
+        trace = self.tracer.trace("scrape", target=target_name)
+        health_recorded = False
+
+        with trace:
+            try:
+                target_config = self.config.targets[target_name]
+                trace.attributes["exporter"] = target_config.exporter
+                target_metrics = self.metrics.target(
+                    target_name, target_config.exporter
+                )
+                self._check_deadline(target_name, deadline)
+                deadline_scope = asyncio.timeout_at(deadline)
+                try:
+                    async with deadline_scope:
+                        await self._scrape_target(
+                            target_name, target_config, target_metrics, trace, deadline
+                        )
+                except TimeoutError:
+                    if deadline_scope.expired():
+                        if not trace.attributes.get("fetched"):
+                            # No response before the deadline counts as a
+                            # failure, or dead targets would never be probed
+                            self.health.record_failure(target_name)
+                            health_recorded = True
+                        raise ScrapeLate("cancelled at its deadline") from None
+                    raise
+            except ScrapeLate as e:
+                logger.warning(f"Scrape of target {target_name} is late: {e}")
+                trace.attributes["late"] = True
+                trace.error = f"ScrapeLate: {e}"
+                target_metrics.scrapes_late.inc()
+            except Exception as e:
+                logger.error(f"Error processing target {target_name}: {str(e)}")
+                trace.error = f"{type(e).__name__}: {e}"
+                if target_metrics is not None:
+                    target_metrics.scrape_errors.inc()
+                if isinstance(e, FETCH_ERRORS):
+                    self.health.record_failure(target_name)
+                    health_recorded = True
+            else:
+                # Cached and shared responses say nothing about the latency
+                latency = None
+                if trace.attributes.get("round_trip"):
+                    latency = trace.stage_seconds("fetch")
+                self.health.record_success(target_name, latency)
+                health_recorded = True
+            finally:
+                # A probe must end with an outcome, whatever stopped the scrape
+                if not health_recorded:
+                    self.health.abandon_probe(target_name)
+
+        if target_metrics is not None:
+            target_metrics.scrape_seconds.observe(trace.duration)
+        logger.info(
+            f"Completed processing target {target_name} in {trace.duration:.2f} seconds"
+        )
+        return trace
+
+    def _check_deadline(self, target_name: str, deadline: Optional[float]) -> None:
+        """Raise ScrapeLate if a scrape is not expected to finish by its deadline."""
+        if deadline is None:
+            return
+        remaining = deadline - asyncio.get_running_loop().time()
+        expected = self.health.latency(target_name, 0.5) or 0.0
+        if remaining <= expected:
+            raise ScrapeLate(
+                f"{max(0.0, remaining):.2f}s left before its deadline, "
+                f"usually takes {expected:.2f}s"
+            )
+
+    async def _scrape_target(
+        self,
+        target_name: str,
+        target_config,
+        target_metrics: TargetMetrics,
+        trace: Trace,
+        deadline: Optional[float] = None,
+    ) -> None:
+        """
+        Run the fetch, parse, build and queue stages of a scrape.
+
+        Cancelling the scrape at its deadline does not stop the parsing and
+        building already handed to a thread, so the thread checks the
+        deadline itself before queueing documents.
+        """
+        config = self.config
+        parser_mode = get_parser_mode(config, target_config)
+        module_batch = self.batches.get(target_name)
+        if module_batch is not None:
+            # The response has the families of every module in the batch;
+            # the streaming parser keeps only this target's configured ones
+            parser_mode = ParserMode.STREAMING
+        timeout = self.health.timeout(
+            target_name, get_target_timeout(config, target_config)
+        )
+        hedge_after = self.health.hedge_delay(target_name)
+        outcome = FetchOutcome()
+        if target_config.poller is not None:
+            # Poll the device directly; varbinds become samples without text
+            with trace.span("fetch"):
+                batch = await self.snmp_poller.poll(target_config, timeout)
+            trace.attributes["fetched"] = True
+            trace.attributes["round_trip"] = True
+            target_metrics.samples_parsed.inc(len(batch))
+            await asyncio.to_thread(
+                self._write, target_name, batch, target_metrics, trace, deadline
+            )
+        elif self.parse_pool is not None:
+            # Parse and serialize in a worker process; only I/O happens here
+            with trace.span("fetch"):
+                content = await self._fetch(
+                    target_name, module_batch, timeout, hedge_after, outcome
+                )
+            trace.attributes["fetched"] = True
+            trace.attributes["round_trip"] = outcome.round_trip
+            target_metrics.fetched_bytes.inc(len(content))
+            # Workers parse and build documents in one step
+            with trace.span("parse_and_build") as span:
+                body, docs_queued = await asyncio.wrap_future(
+                    self.parse_pool.submit(
+                        target_name,
+                        target_config,
+                        content,
+                        self.global_metadata,
+                        parser_mode,
+                        get_document_layout(config, target_config),
+                    )
+                )
+            target_metrics.parse_seconds.observe(span.duration)
+            with trace.span("queue"):
+                await asyncio.to_thread(self._queue_raw, body, docs_queued, deadline)
+            target_metrics.documents_queued.inc(docs_queued)
+            logger.info(f"Queued {docs_queued} documents for {target_name}")
+        elif parser_mode == ParserMode.STREAMING:
+            # Parse the response as it arrives, keeping configured families only
+            plan = self.mapping_plans.get(target_name, target_config)
+            parser = StreamingPrometheusParser(
+                plan.allow_list, plan.configured_names, label_interner=plan.labels
+            )
+            timed_parser = TimedParser(parser)
+            # The fetch span includes the parsing done as chunks arrive
+            with trace.span("fetch"):
+                if module_batch is not None:
+                    content = await self._fetch(
+                        target_name, module_batch, timeout, hedge_after, outcome
+                    )
+                    timed_parser.feed(content)
+                    received = len(content)
+                else:
+                    received = await self.exporter_pool.fetch_into(
+                        config,
+                        target_name,
+                        timed_parser,
+                        timeout,
+                        hedge_after,
+                        outcome,
+                    )
+            trace.attributes["fetched"] = True
+            trace.attributes["round_trip"] = outcome.round_trip
+            target_metrics.fetched_bytes.inc(received)
+            batch = timed_parser.close_batch()
+            trace.add_span("parse", timed_parser.seconds)
+            target_metrics.parse_seconds.observe(timed_parser.seconds)
+            target_metrics.samples_parsed.inc(len(batch))
+            await asyncio.to_thread(
+                self._write, target_name, batch, target_metrics, trace, deadline
+            )
+        else:
+            # Fetch metrics over the pooled exporter session
+            with trace.span("fetch"):
+                content = await self._fetch(
+                    target_name, module_batch, timeout, hedge_after, outcome
+                )
+            trace.attributes["fetched"] = True
+            trace.attributes["round_trip"] = outcome.round_trip
+            target_metrics.fetched_bytes.inc(len(content))
+
+            # Parsing and indexing are blocking, so run them off the event loop
+            await asyncio.to_thread(
+                self._parse_and_write,
+                target_name,
+                content,
+                target_metrics,
+                trace,
+                deadline,
+            )
+
+    async def _fetch(
+        self,
+        target_name: str,
+        module_batch: Optional[ModuleBatch],
+        timeout: float,
+        hedge_after: Optional[float],
+        outcome: FetchOutcome,
+    ) -> str:
+        """Fetch the response for a target, or the shared one of its batch."""
+        if module_batch is not None:
+            return await self.exporter_pool.fetch_batch(
+                self.config, module_batch, timeout, hedge_after, outcome
+            )
+        return await self.exporter_pool.fetch(
+            self.config, target_name, timeout, hedge_after, outcome
+        )
+
+    def _queue_raw(
+        self, body: bytes, docs_queued: int, deadline: Optional[float]
+    ) -> None:
+        """Queue a bulk body built by a parse worker, unless the scrape is late."""
+        _check_queue_deadline(deadline)
+        self.bulk_indexer.add_raw(body, docs_queued)
+
+    def _parse_and_write(
+        self,
+        target_name: str,
+        content: str,
+        target_metrics: TargetMetrics,
+        trace: Trace,
+        deadline: Optional[float] = None,
+    ) -> None:
+        """Parse a fetched response and queue its documents for indexing."""
+        target_config = self.config.targets[target_name]
+        with trace.span("parse") as span:
+            metrics = parse_prometheus_metrics(content, target_config.metrics)
+        target_metrics.parse_seconds.observe(span.duration)
+        target_metrics.samples_parsed.inc(
+            sum(len(samples) for samples in metrics.values())
+        )
+        self._write(target_name, metrics, target_metrics, trace, deadline)
+
+    def _write(
+        self,
+        target_name: str,
+        metrics,
+        target_metrics: TargetMetrics,
+        trace: Trace,
+        deadline: Optional[float] = None,
+    ) -> None:
+        """Build documents from parsed metrics and queue them for indexing."""
+        config = self.config
+        target_config = config.targets[target_name]
+
+        # Queue documents for the background bulk indexer
+        if metrics:
+            plan = self.mapping_plans.get(target_name, target_config)
+            layout = get_document_layout(config, target_config)
+            with trace.span("build") as span:
+                docs = build_metric_documents(
+                    metrics, target_config, self.global_metadata, plan, layout
+                )
+            target_metrics.build_seconds.observe(span.duration)
+            _check_queue_deadline(deadline)
+            with trace.span("queue"):
+                docs_queued = self.bulk_indexer.add_documents(plan.index_name, docs)
+            target_metrics.documents_queued.inc(docs_queued)
+            logger.info(f"Queued {docs_queued} documents for {target_name}")
+        else:
+            logger.warning(f"No metrics fetched for {target_name}")
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Self-monitoring metrics for the SNMP Bridge.
+This module records how long scrapes, parsing, document building and bulk
+flushes take, and how much data passes through the bridge, and serves them
+in the Prometheus format on an embedded HTTP endpoint.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from target_health import BreakerState
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds, from fast parses to slow SNMP walks
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+TARGET_LABELS = ("target", "exporter")
+
+
+def get_metrics_address() -> Tuple[str, int]:
+    """
+    Get the address and port of the metrics endpoint.
+
+    These come from BRIDGE_METRICS_ADDRESS (default 0.0.0.0) and
+    BRIDGE_METRICS_PORT; a port of 0, the default, disables the endpoint.
+    """
+    address = os.environ.get("BRIDGE_METRICS_ADDRESS", "0.0.0.0")
+    return address, int(os.environ.get("BRIDGE_METRICS_PORT", "0"))
+
+
+class TargetMetrics:
+    """Metrics of one target, bound to its labels once so recording is cheap."""
+
+    __slots__ = (
+        "scrape_seconds",
+        "parse_seconds",
+        "build_seconds",
+        "fetched_bytes",
+        "samples_parsed",
+        "documents_queued",
+        "scrape_errors",
+        "scrapes_late",
+    )
+
+    def __init__(self, metrics: "BridgeMetrics", labels: Tuple[str, str]):
+        self.scrape_seconds = metrics.scrape_seconds.labels(*labels)
+        self.parse_seconds = metrics.parse_seconds.labels(*labels)
+        self.build_seconds = metrics.build_seconds.labels(*labels)
+        self.fetched_bytes = metrics.fetched_bytes.labels(*labels)
+        self.samples_parsed = metrics.samples_parsed.labels(*labels)
+        self.documents_queued = metrics.documents_queued.labels(*labels)
+        self.scrape_errors = metrics.scrape_errors.labels(*labels)
+        self.scrapes_late = metrics.scrapes_late.labels(*labels)
+
+
+class TimedParser:
+    """
+    Wrap a streaming parser to add up the time spent in `feed` and `close_batch`.
+
+    The parser is fed once per received chunk, so timing each call costs
+    little next to the parsing itself.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.seconds = 0.0
+
+    def feed(self, text: str) -> None:
+        start = time.perf_counter()
+        self.parser.feed(text)
+        self.seconds += time.perf_counter() - start
+
+    def close_batch(self):
+        start = time.perf_counter()
+        batch = self.parser.close_batch()
+        self.seconds += time.perf_counter() - start
+        return batch
+
+
+class _ComponentCollector:
+    """Read the statistics of the bridge's components when scraped."""
+
+    def __init__(self):
+        self.bulk_indexer = None
+        self.response_cache = None
+        self.target_health = None
+        self.exporter_pool = None
+
+    def collect(self) -> Iterable:
+        indexer = self.bulk_indexer
+        if indexer is not None:
+            stats = dict(indexer.stats)
+            for key, help_text in (
+                ("documents_indexed", "Documents indexed in Elasticsearch"),
+                ("documents_failed", "Documents Elasticsearch rejected for good"),
+                ("documents_spooled", "Documents written to the disk spool"),
+                ("documents_replayed", "Spooled documents indexed later"),
+                ("documents_dropped", "Documents dropped after a flush error"),
+                ("retries", "Bulk requests sent again after throttling or errors"),
+                ("flushes", "Bulk flushes"),
+                ("bytes_sent", "Bulk request bytes sent, after compression"),
+            ):
+                yield CounterMetricFamily(
+                    f"snmp_bridge_bulk_{key}", help_text, value=stats[key]
+                )
+            yield GaugeMetricFamily(
+                "snmp_bridge_bulk_queue_depth",
+                "Entries waiting in the bulk indexer queue",
+                value=indexer.queue_depth,
+            )
+            yield GaugeMetricFamily(
+                "snmp_bridge_spool_depth_documents",
+                "Documents waiting in the disk spool",
+                value=indexer.spool_depth,
+            )
+
+        cache = self.response_cache
+        if cache is not None:
+            family = CounterMetricFamily(
+                "snmp_bridge_response_cache_requests",
+                "Exporter requests by how the response cache answered them",
+                labels=["result"],
+            )
+            for result, count in cache.stats.items():
+                family.add_metric([result], count)
+            yield family
+
+        pool = self.exporter_pool
+        if pool is not None:
+            family = CounterMetricFamily(
+                "snmp_bridge_hedged_requests",
+                "Requests also sent to a secondary exporter, by outcome",
+                labels=["result"],
+            )
+            for result, count in pool.hedge_stats.items():
+                family.add_metric([result], count)
+            yield family
+
+        tracker = self.target_health
+        if tracker is not None:
+            state = GaugeMetricFamily(
+                "snmp_bridge_target_breaker_state",
+                "Circuit breaker state of each target, 1 for the current state",
+                labels=["target", "state"],
+            )
+            failures = GaugeMetricFamily(
+                "snmp_bridge_target_consecutive_failures",
+                "Scrapes of each target that failed in a row",
+                labels=["target"],
+            )
+            trips = CounterMetricFamily(
+                "snmp_bridge_target_breaker_trips",
+                "Times each target's circuit breaker opened",
+                labels=["target"],
+            )
+            timeout = GaugeMetricFamily(
+                "snmp_bridge_target_timeout_seconds",
+                "Timeout of each target's last scrape",
+                labels=["target"],
+            )
+            for name, health in list(tracker.targets.items()):
+                for value in BreakerState:
+                    state.add_metric(
+                        [name, value.value], 1 if health.state == value else 0
+                    )
+                failures.add_metric([name], health.consecutive_failures)
+                trips.add_metric([name], health.trips)
+                if health.timeout is not None:
+                    timeout.add_metric([name], health.timeout)
+            yield from (state, failures, trips, timeout)
+
+
+class BridgeMetrics:
+    """
+    Metrics of the bridge, kept in their own registry.
+
+    Per-target metrics are labelled with the target and exporter name. Use
+    `target` to get them for recording; the labelled metrics are created on
+    first use and then reused. Statistics the components already keep, such
+    as the bulk indexer's counters and queue depth, are read only when the
+    endpoint is scraped and cost nothing in between.
+    """
+
+    def __init__(self, registry: Optional[CollectorRegistry] = None):
+        """
+        Create the metrics.
+
+        Args:
+            registry: Registry to add the metrics to; a new one if None
+        """
+        self.registry = registry or CollectorRegistry()
+        self.scrape_seconds = Histogram(
+            "snmp_bridge_scrape_duration_seconds",
+            "Time to scrape a target, from request to queued documents",
+            TARGET_LABELS,
+            buckets=LATENCY_BUCKETS,
+            registry=self.registry,
+        )
+        self.parse_seconds = Histogram(
+            "snmp_bridge_parse_duration_seconds",
+            "Time to parse an exporter response",
+            TARGET_LABELS,
+            buckets=LATENCY_BUCKETS,
+            registry=self.registry,
+        )
+        self.build_seconds = Histogram(
+            "snmp_bridge_document_build_duration_seconds",
+            "Time to build the documents of a scrape",
+            TARGET_LABELS,
+            buckets=LATENCY_BUCKETS,
+            registry=self.registry,
+        )
+        self.fetched_bytes = Counter(
+            "snmp_bridge_fetched_bytes",
+            "Bytes of exporter responses received",
+            TARGET_LABELS,
+            registry=self.registry,
+        )
+        self.samples_parsed = Counter(
+            "snmp_bridge_samples_parsed",
+            "Samples kept from exporter responses",
+            TARGET_LABELS,
+            registry=self.registry,
+        )
+        self.documents_queued = Counter(
+            "snmp_bridge_documents_queued",
+            "Documents queued for indexing",
+            TARGET_LABELS,
+            registry=self.registry,
+        )
+        self.scrape_errors = Counter(
+            "snmp_bridge_scrape_errors",
+            "Scrapes that failed",
+            TARGET_LABELS,
+            registry=self.registry,
+        )
+        self.scrapes_late = Counter(
+            "snmp_bridge_scrapes_late",
+            "Scrapes skipped or cancelled at their deadline",
+            TARGET_LABELS,
+            registry=self.registry,
+        )
+        self.bulk_flush_seconds = Histogram(
+            "snmp_bridge_bulk_flush_duration_seconds",
+            "Time to send a bulk request, including retries",
+            buckets=LATENCY_BUCKETS,
+            registry=self.registry,
+        )
+        self._targets: Dict[Tuple[str, str], TargetMetrics] = {}
+        self._components = _ComponentCollector()
+        self.registry.register(self._components)
+
+    def target(self, target_name: str, exporter_name: str) -> TargetMetrics:
+        """Get the metrics of a target."""
+        labels = (target_name, exporter_name)
+        metrics = self._targets.get(labels)
+        if metrics is None:
+            metrics = self._targets[labels] = TargetMetrics(self, labels)
+        return metrics
+
+    def retain(self, targets: Iterable[Tuple[str, str]]) -> None:
+        """Drop the metrics of targets that are no longer scraped."""
+        for labels in set(self._targets) - set(targets):
+            del self._targets[labels]
+            for metric in (
+                self.scrape_seconds,
+                self.parse_seconds,
+                self.build_seconds,
+                self.fetched_bytes,
+                self.samples_parsed,
+                self.documents_queued,
+                self.scrape_errors,
+                self.scrapes_late,
+            ):
+                metric.remove(*labels)
+
+    def watch_bulk_indexer(self, bulk_indexer) -> None:
+        """Expose a bulk indexer's statistics and time its flushes."""
+        self._components.bulk_indexer = bulk_indexer
+        bulk_indexer.flush_observers.append(
+            lambda seconds, doc_count: self.bulk_flush_seconds.observe(seconds)
+        )
+
+    def watch_response_cache(self, response_cache) -> None:
+        """Expose the hit and miss counts of an exporter response cache."""
+        self._components.response_cache = response_cache
+
+    def watch_exporter_pool(self, exporter_pool) -> None:
+        """Expose how often requests were hedged to secondary exporters."""
+        self._components.exporter_pool = exporter_pool
+
+    def watch_target_health(self, tracker) -> None:
+        """Expose the circuit breaker state and timeout of every target."""
+        self._components.target_health = tracker
+
+    def start_server(self, address: str, port: int) -> None:
+        """Serve the metrics on http://address:port/metrics in a background thread."""
+        start_http_server(port, addr=address, registry=self.registry)
+        logger.info(f"Serving self-monitoring metrics on {address}:{port}")
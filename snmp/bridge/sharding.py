@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Target sharding for the SNMP Bridge.
+This module splits the targets of a shared runtime configuration between
+several bridge instances. Each instance keeps a lease in Elasticsearch, and
+the targets are assigned to the live instances with consistent hashing, so
+that an instance joining or leaving moves only its own share of targets.
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from elasticsearch import BadRequestError, NotFoundError
+
+from runtime_schema import RuntimeConfig, ShardingConfig
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_INDEX = ".hedgehog-snmp-bridge-leases"
+
+# Most leases read from the lease index
+MAX_INSTANCES = 1000
+
+# Lease times are epoch milliseconds; a dynamically mapped float field would
+# round them to about two minutes at current dates
+LEASE_INDEX_MAPPINGS = {
+    "properties": {
+        "instance_id": {"type": "keyword"},
+        "renewed_at": {"type": "date", "format": "epoch_millis"},
+        "expires_at": {"type": "date", "format": "epoch_millis"},
+    }
+}
+
+
+def get_instance_id() -> str:
+    """
+    Get the identity of this bridge instance.
+
+    This is BRIDGE_INSTANCE_ID if set, otherwise the host name. It should stay
+    the same across restarts, so that a restarted instance gets its targets
+    back; instances on the same host need their own BRIDGE_INSTANCE_ID.
+    """
+    return os.environ.get("BRIDGE_INSTANCE_ID") or socket.gethostname()
+
+
+def get_sharding_config(config: RuntimeConfig) -> Optional[ShardingConfig]:
+    """Get the sharding settings, if sharding is enabled."""
+    if config.global_ and config.global_.sharding and config.global_.sharding.enabled:
+        return config.global_.sharding
+    return None
+
+
+def _ring_hash(key: str) -> int:
+    """Hash a key to a point on the ring."""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of instance identities.
+
+    Each member is placed on the ring at `virtual_nodes` points, and a key
+    belongs to the member at the first point at or after the key's hash.
+    Adding or removing a member only moves the keys next to its points,
+    about 1/n of them, and the virtual nodes spread the keys evenly.
+    """
+
+    def __init__(self, members: Iterable[str] = (), virtual_nodes: int = 100):
+        """
+        Build the ring.
+
+        Args:
+            members: Instance identities
+            virtual_nodes: Points per member on the ring
+        """
+        self.members: FrozenSet[str] = frozenset(members)
+        self.virtual_nodes = virtual_nodes
+        points = sorted(
+            (_ring_hash(f"{member}#{i}"), member)
+            for member in self.members
+            for i in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        """Get the member that owns a key, or None if the ring is empty."""
+        if not self._hashes:
+            return None
+        i = bisect.bisect_left(self._hashes, _ring_hash(key))
+        return self._owners[i % len(self._owners)]
+
+
+class InMemoryLeaseRegistry:
+    """
+    Lease registry kept in memory, for tests and single-process setups.
+
+    Several `TargetSharder` objects can share one registry to act as
+    separate instances.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._leases: Dict[str, float] = {}
+
+    def renew(self, instance_id: str, ttl: float) -> None:
+        """Register an instance, or extend its lease, for `ttl` seconds."""
+        self._leases[instance_id] = self._clock() + ttl
+
+    def live_instances(self) -> List[str]:
+        """Get the instances whose lease has not expired."""
+        now = self._clock()
+        return [
+            instance_id
+            for instance_id, expires_at in self._leases.items()
+            if expires_at > now
+        ]
+
+    def release(self, instance_id: str) -> None:
+        """Remove an instance's lease."""
+        self._leases.pop(instance_id, None)
+
+
+class ElasticsearchLeaseRegistry:
+    """
+    Lease registry kept in an Elasticsearch index, one document per instance.
+
+    Lease expiry times are written with the clock of the instance that renews
+    them and compared with the clock of the instance that reads them, so the
+    clocks of bridge hosts should be kept in sync to well within the lease
+    time. Times are stored as integer epoch milliseconds in `date` fields;
+    the index is created with that mapping on the first renewal.
+    """
+
+    def __init__(
+        self,
+        es_client,
+        index_name: str = DEFAULT_LEASE_INDEX,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            es_client: Elasticsearch client allowed to write to the lease index
+            index_name: Name of the lease index
+            clock: Wall clock in seconds since the epoch
+        """
+        self.es_client = es_client
+        self.index_name = index_name
+        self._clock = clock
+        self._index_ready = False
+
+    def _now_millis(self) -> int:
+        """Current time in epoch milliseconds."""
+        return int(self._clock() * 1000)
+
+    def _ensure_index(self) -> None:
+        """Create the lease index with its mapping if it does not exist."""
+        if self._index_ready:
+            return
+        if not self.es_client.indices.exists(index=self.index_name):
+            logger.info(f"Creating lease index {self.index_name}")
+            try:
+                self.es_client.indices.create(
+                    index=self.index_name, mappings=LEASE_INDEX_MAPPINGS
+                )
+            except BadRequestError as e:
+                # Another instance created it first
+                if e.error != "resource_already_exists_exception":
+                    raise
+        self._index_ready = True
+
+    def renew(self, instance_id: str, ttl: float) -> None:
+        """Register an instance, or extend its lease, for `ttl` seconds."""
+        self._ensure_index()
+        now = self._now_millis()
+        self.es_client.index(
+            index=self.index_name,
+            id=instance_id,
+            document={
+                "instance_id": instance_id,
+                "renewed_at": now,
+                "expires_at": now + int(ttl * 1000),
+            },
+            refresh="wait_for",
+        )
+
+    def live_instances(self) -> List[str]:
+        """Get the instances whose lease has not expired."""
+        try:
+            response = self.es_client.search(
+                index=self.index_name,
+                query={"range": {"expires_at": {"gt": self._now_millis()}}},
+                size=MAX_INSTANCES,
+                source=False,
+            )
+        except NotFoundError:
+            return []
+        return [hit["_id"] for hit in response["hits"]["hits"]]
+
+    def release(self, instance_id: str) -> None:
+        """Remove an instance's lease, so others take over its targets at once."""
+        try:
+            self.es_client.delete(
+                index=self.index_name, id=instance_id, refresh="wait_for"
+            )
+        except NotFoundError:
+            pass
+
+
+class TargetSharder:
+    """
+    Decide which targets this instance scrapes.
+
+    `refresh` renews this instance's lease and rebuilds the hash ring from
+    the instances with a live lease. It should be called well within the
+    lease time; an instance that stops renewing is dropped from the ring by
+    the others once its lease expires, and they take over its targets.
+    """
+
+    def __init__(
+        self,
+        registry,
+        instance_id: str,
+        lease_ttl: float = 30,
+        virtual_nodes: int = 100,
+    ):
+        """
+        Initialize the sharder.
+
+        Args:
+            registry: Lease registry shared by the instances
+            instance_id: Identity of this instance
+            lease_ttl: Seconds a lease lasts without renewal
+            virtual_nodes: Points per instance on the hash ring
+        """
+        self.registry = registry
+        self.instance_id = instance_id
+        self.lease_ttl = lease_ttl
+        self.virtual_nodes = virtual_nodes
+        self.ring = HashRing([instance_id], virtual_nodes)
+
+    @property
+    def renew_interval(self) -> float:
+        """Seconds between lease renewals."""
+        return self.lease_ttl / 3
+
+    def refresh(self) -> bool:
+        """
+        Renew this instance's lease and update the ring.
+
+        Returns:
+            Whether the set of live instances changed
+        """
+        self.registry.renew(self.instance_id, self.lease_ttl)
+        members = set(self.registry.live_instances())
+        members.add(self.instance_id)
+        if members == self.ring.members:
+            return False
+
+        joined = sorted(members - self.ring.members)
+        left = sorted(self.ring.members - members)
+        logger.info(
+            f"Bridge instances changed: {len(members)} live"
+            + (f", joined {', '.join(joined)}" if joined else "")
+            + (f", left {', '.join(left)}" if left else "")
+        )
+        self.ring = HashRing(members, self.virtual_nodes)
+        return True
+
+    def owns(self, target_name: str) -> bool:
+        """Whether this instance scrapes a target."""
+        return self.ring.owner(target_name) == self.instance_id
+
+    def release(self) -> None:
+        """Give up this instance's lease when it stops."""
+        self.registry.release(self.instance_id)
+
+
+def create_sharder(es_client, config: RuntimeConfig) -> Optional[TargetSharder]:
+    """Create a sharder with an Elasticsearch lease registry, if sharding is enabled."""
+    sharding = get_sharding_config(config)
+    if sharding is None:
+        return None
+
+    instance_id = get_instance_id()
+    logger.info(f"Sharding targets as bridge instance {instance_id}")
+    return TargetSharder(
+        ElasticsearchLeaseRegistry(es_client, sharding.lease_index),
+        instance_id,
+        lease_ttl=sharding.lease_ttl,
+        virtual_nodes=sharding.virtual_nodes,
+    )
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Direct SNMP polling for the SNMP Bridge.
+This module polls a device over SNMP with GETBULK requests and stores the
+values in a `SampleBatch`, the same batch the streaming parser produces from
+an exporter response. Targets polled directly skip the exporter, and with it
+formatting every sample as text and parsing it again.
+
+pysnmp is optional; it is only needed for targets with a `poller` section.
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from runtime_schema import SnmpPollerConfig
+from sample_batch import SampleBatch
+
+try:
+    from pysnmp.hlapi.v3arch.asyncio import (
+        CommunityData,
+        ContextData,
+        ObjectIdentity,
+        ObjectType,
+        SnmpEngine,
+        UdpTransportTarget,
+        bulk_cmd,
+    )
+    from pysnmp.proto.rfc1905 import EndOfMibView
+except ImportError:
+    bulk_cmd = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNMP_PORT = 161
+DEFAULT_INDEX_LABEL = "index"
+
+Oid = Tuple[int, ...]
+
+
+class SnmpPollError(Exception):
+    """The device did not answer, or answered with an SNMP error."""
+
+
+def parse_oid(oid: str) -> Oid:
+    """Parse a numeric OID such as `1.3.6.1.2.1.1.3` or `.1.3.6.1.2.1.1.3`."""
+    return tuple(int(part) for part in oid.strip(".").split("."))
+
+
+def split_address(address: str) -> Tuple[str, int]:
+    """Split an IPv4 `host[:port]` target address, defaulting to the SNMP port."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+    return address, DEFAULT_SNMP_PORT
+
+
+class PollColumn:
+    """A configured metric polled as an OID subtree: a table column or a scalar."""
+
+    __slots__ = ("name", "oid", "index_label")
+
+    def __init__(self, name: str, oid: Oid, index_label: str):
+        self.name = name
+        self.oid = oid
+        self.index_label = index_label
+
+
+def get_poll_columns(target_config) -> List[PollColumn]:
+    """Get the subtrees to walk for a target: its metrics that have an OID."""
+    return [
+        PollColumn(
+            metric_config.name,
+            parse_oid(metric_config.oid),
+            metric_config.index_label or DEFAULT_INDEX_LABEL,
+        )
+        for metric_config in target_config.metrics or []
+        if metric_config.oid
+    ]
+
+
+class SnmpPoller:
+    """
+    Poll devices directly over SNMP v2c.
+
+    All configured subtrees of a target are walked together: each GETBULK
+    request asks for the next `max_repetitions` rows of every subtree that
+    is not finished yet. Each metric becomes a family named after it.
+    Samples under `<oid>.0` are scalars without labels; other samples are
+    labelled with the rest of their OID as the table index, under the
+    metric's `index_label`. Values that are not numbers, such as strings,
+    are skipped.
+
+    One SNMP engine is shared by all targets and created on first use.
+    """
+
+    def __init__(self):
+        self._engine = None
+
+    async def poll(
+        self, target_config, timeout: float, timestamp: Optional[str] = None
+    ) -> SampleBatch:
+        """
+        Poll the configured OIDs of a target.
+
+        Args:
+            target_config: Target with a `poller` section and a `target` address
+            timeout: Seconds allowed for the whole walk
+            timestamp: Timestamp of the samples (defaults to now)
+
+        Raises:
+            SnmpPollError: If the device did not answer or returned an error
+        """
+        if bulk_cmd is None:
+            raise RuntimeError("pysnmp is not installed, cannot poll targets directly")
+        if not target_config.target:
+            raise ValueError("Directly polled targets need a target address")
+
+        poller = target_config.poller or SnmpPollerConfig()
+        batch = SampleBatch(timestamp)
+        columns = get_poll_columns(target_config)
+        if not columns:
+            return batch
+
+        if self._engine is None:
+            self._engine = SnmpEngine()
+        async with asyncio.timeout(timeout):
+            transport = await UdpTransportTarget.create(
+                split_address(target_config.target),
+                timeout=timeout / (poller.retries + 1),
+                retries=poller.retries,
+            )
+            auth = CommunityData(poller.community, mpModel=1)
+            # Each pending subtree with the last OID received from it
+            pending = [(column, column.oid) for column in columns]
+            while pending:
+                var_binds = await self._bulk(
+                    auth, transport, poller.max_repetitions, pending
+                )
+                pending = self._collect(batch, pending, var_binds)
+        return batch
+
+    async def _bulk(self, auth, transport, max_repetitions: int, pending):
+        """Send one GETBULK request for the next rows of the pending subtrees."""
+        error_indication, error_status, error_index, var_binds = await bulk_cmd(
+            self._engine,
+            auth,
+            transport,
+            ContextData(),
+            0,
+            max_repetitions,
+            *(ObjectType(ObjectIdentity(oid)) for _, oid in pending),
+            lookupMib=False,
+        )
+        if error_indication:
+            raise SnmpPollError(str(error_indication))
+        if error_status:
+            raise SnmpPollError(f"{error_status.prettyPrint()} at index {error_index}")
+        return var_binds
+
+    @staticmethod
+    def _collect(
+        batch: SampleBatch, pending: List[Tuple[PollColumn, Oid]], var_binds
+    ) -> List[Tuple[PollColumn, Oid]]:
+        """
+        Add the samples of a GETBULK response to the batch.
+
+        The response holds rows of one value per requested subtree. Returns
+        the subtrees that still have rows to fetch.
+        """
+        width = len(pending)
+        last = [oid for _, oid in pending]
+        finished = [False] * width
+
+        for position, (name, value) in enumerate(var_binds):
+            i = position % width
+            if finished[i]:
+                continue
+            column = pending[i][0]
+            oid = tuple(name)
+            prefix_length = len(column.oid)
+            # Stop at the end of the subtree, or if the agent goes backwards
+            if (
+                isinstance(value, EndOfMibView)
+                or oid[:prefix_length] != column.oid
+                or oid <= last[i]
+            ):
+                finished[i] = True
+                continue
+            last[i] = oid
+
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                continue
+            index = oid[prefix_length:]
+            key = (column.index_label, index)
+            label_set_id = batch.find_label_set(key)
+            if label_set_id is None:
+                labels: Dict[str, str] = {}
+                if index != (0,):
+                    labels[column.index_label] = ".".join(map(str, index))
+                label_set_id = batch.label_set_id(labels, key)
+            batch.append(batch.name_id(column.name, column.name), label_set_id, number)
+
+        # A subtree that got no new rows is done, even if the agent did not say so
+        return [
+            (pending[i][0], last[i])
+            for i in range(width)
+            if not finished[i] and last[i] != pending[i][1]
+        ]
+
+    def close(self) -> None:
+        """Close the SNMP engine's transports."""
+        if self._engine is not None:
+            self._engine.close_dispatcher()
+            self._engine = None
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Disk spool for the SNMP Bridge.
+This module keeps bulk request bodies that could not be sent while
+Elasticsearch was unavailable in append-only files on local disk, so that
+they can be indexed once it is back instead of being lost.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Each record is a header of body length and document count, then the body
+RECORD_HEADER = struct.Struct("<II")
+
+SEGMENT_SUFFIX = ".spool"
+
+# Replay checkpoint of a segment: the offset of its first unread record
+CHECKPOINT = struct.Struct("<Q")
+CHECKPOINT_SUFFIX = ".offset"
+
+
+class _Segment:
+    """A spool file and the records it holds from its read offset on."""
+
+    __slots__ = ("path", "start", "size", "records", "documents")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.start = 0
+        self.size = 0
+        self.records = 0
+        self.documents = 0
+
+    @property
+    def checkpoint_path(self) -> str:
+        return self.path + CHECKPOINT_SUFFIX
+
+
+class DiskSpool:
+    """
+    Append-only spool of bulk request bodies, kept in segment files.
+
+    Bodies are appended to the newest segment, and a new one is started once
+    it reaches `segment_bytes`. Bodies are read back oldest first by
+    memory-mapping a finished segment; a segment is deleted once every body
+    in it has been read with `pop`. When the spool holds more than
+    `max_bytes`, the oldest segments are deleted and their documents lost.
+
+    Segments left by an earlier run are picked up when the spool is opened.
+    The read offset of the oldest segment is saved in a checkpoint file next
+    to it each time a body is popped, so bodies already popped are not read
+    again. Only a body peeked but not popped when the bridge stops, such as
+    one being indexed, is read again on the next start.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 1024 * 1024 * 1024,
+        segment_bytes: int = 16 * 1024 * 1024,
+    ):
+        """
+        Open the spool, creating the directory if needed.
+
+        Args:
+            directory: Directory holding the segment files
+            max_bytes: Maximum size of all segments together
+            segment_bytes: Size at which a new segment is started
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = min(segment_bytes, max_bytes)
+        self._segments: List[_Segment] = []
+        self._writer = None
+        self._reader: Optional[mmap.mmap] = None
+        self._read_offset = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "documents_spooled": 0,
+            "documents_replayed": 0,
+            "documents_evicted": 0,
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_segments()
+
+    @property
+    def depth_bytes(self) -> int:
+        """Bytes waiting in the spool, including bodies being read."""
+        with self._lock:
+            return sum(segment.size for segment in self._segments)
+
+    @property
+    def depth_documents(self) -> int:
+        """Documents waiting in the spool."""
+        with self._lock:
+            return sum(segment.documents for segment in self._segments)
+
+    def __len__(self) -> int:
+        """Number of bodies waiting in the spool."""
+        with self._lock:
+            return sum(segment.records for segment in self._segments)
+
+    def append(self, body: bytes, doc_count: int) -> None:
+        """Add a bulk body of `doc_count` documents to the spool."""
+        if not body:
+            return
+        with self._lock:
+            segment = self._writable_segment()
+            self._writer.write(RECORD_HEADER.pack(len(body), doc_count))
+            self._writer.write(body)
+            self._writer.flush()
+            segment.size += RECORD_HEADER.size + len(body)
+            segment.records += 1
+            segment.documents += doc_count
+            self.stats["documents_spooled"] += doc_count
+            self._evict()
+
+    def peek(self) -> Optional[Tuple[bytes, int]]:
+        """Get the oldest body and its document count without removing it."""
+        with self._lock:
+            return self._read(advance=False)
+
+    def pop(self) -> Optional[Tuple[bytes, int]]:
+        """Remove and return the oldest body and its document count."""
+        with self._lock:
+            record = self._read(advance=True)
+            if record is not None:
+                self.stats["documents_replayed"] += record[1]
+            return record
+
+    def close(self) -> None:
+        """Close the open files. Spooled bodies stay on disk."""
+        with self._lock:
+            self._close_reader()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def _load_segments(self) -> None:
+        """Find the segments left by an earlier run and count their records."""
+        files = os.listdir(self.directory)
+        names = sorted(name for name in files if name.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            segment = _Segment(os.path.join(self.directory, name))
+            self._scan(segment)
+            if segment.records:
+                self._segments.append(segment)
+            else:
+                self._remove(segment)
+
+        # Checkpoints of segments removed, or being saved, when the bridge stopped
+        for name in files:
+            if name.endswith(".tmp") or (
+                name.endswith(CHECKPOINT_SUFFIX)
+                and name[: -len(CHECKPOINT_SUFFIX)] not in names
+            ):
+                os.remove(os.path.join(self.directory, name))
+
+        if self._segments:
+            logger.info(
+                f"Found {self.depth_documents} spooled documents "
+                f"({self.depth_bytes} bytes) in {self.directory}"
+            )
+        self._evict()
+
+    def _scan(self, segment: _Segment) -> None:
+        """
+        Count the unread records of a segment, cutting off a partly written one.
+
+        Records before the segment's checkpoint were popped by an earlier run
+        and are not counted.
+        """
+        checkpoint = self._read_checkpoint(segment)
+        size = os.path.getsize(segment.path)
+        offset = 0
+        records = []
+        with open(segment.path, "rb") as f:
+            while offset + RECORD_HEADER.size <= size:
+                f.seek(offset)
+                length, doc_count = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                end = offset + RECORD_HEADER.size + length
+                if end > size:
+                    break
+                records.append((offset, doc_count))
+                offset = end
+
+        if offset < size:
+            logger.warning(f"Truncating partly written record in {segment.path}")
+            os.truncate(segment.path, offset)
+        if checkpoint != offset and checkpoint not in (r[0] for r in records):
+            logger.warning(f"Ignoring invalid checkpoint of {segment.path}")
+            checkpoint = 0
+        unread = [doc_count for start, doc_count in records if start >= checkpoint]
+        segment.start = checkpoint
+        segment.size = offset - checkpoint
+        segment.records = len(unread)
+        segment.documents = sum(unread)
+
+    def _read_checkpoint(self, segment: _Segment) -> int:
+        """Get the saved read offset of a segment, or 0 if there is none."""
+        try:
+            with open(segment.checkpoint_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        if len(data) != CHECKPOINT.size:
+            return -1
+        return CHECKPOINT.unpack(data)[0]
+
+    def _write_checkpoint(self, segment: _Segment) -> None:
+        """Save the read offset of a segment, replacing the previous one."""
+        temporary = segment.checkpoint_path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(CHECKPOINT.pack(segment.start))
+        os.replace(temporary, segment.checkpoint_path)
+
+    def _remove(self, segment: _Segment) -> None:
+        """Delete a segment and its checkpoint."""
+        os.remove(segment.path)
+        try:
+            os.remove(segment.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    def _writable_segment(self) -> _Segment:
+        """Get the segment to append to, starting a new one if needed."""
+        if self._writer is not None:
+            segment = self._segments[-1]
+            if segment.size < self.segment_bytes:
+                return segment
+            self._writer.close()
+            self._writer = None
+
+        number = 0
+        if self._segments:
+            last = os.path.basename(self._segments[-1].path)
+            number = int(last[: -len(SEGMENT_SUFFIX)]) + 1
+        segment = _Segment(
+            os.path.join(self.directory, f"{number:012d}{SEGMENT_SUFFIX}")
+        )
+        self._writer = open(segment.path, "ab")
+        self._segments.append(segment)
+        return segment
+
+    def _read(self, advance: bool) -> Optional[Tuple[bytes, int]]:
+        """Read the next record of the oldest segment."""
+        if not self._segments:
+            return None
+
+        segment = self._segments[0]
+        if self._reader is None:
+            if self._writer is not None and len(self._segments) == 1:
+                # Finish the segment being written so it can be mapped
+                self._writer.close()
+                self._writer = None
+            with open(segment.path, "rb") as f:
+                self._reader = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_offset = segment.start
+
+        offset = self._read_offset
+        length, doc_count = RECORD_HEADER.unpack_from(self._reader, offset)
+        start = offset + RECORD_HEADER.size
+        body = self._reader[start : start + length]
+        if not advance:
+            return body, doc_count
+
+        self._read_offset = segment.start = start + length
+        segment.size -= RECORD_HEADER.size + length
+        segment.records -= 1
+        segment.documents -= doc_count
+        if segment.records == 0:
+            self._close_reader()
+            self._segments.pop(0)
+            self._remove(segment)
+        else:
+            self._write_checkpoint(segment)
+        return body, doc_count
+
+    def _close_reader(self) -> None:
+        """Unmap the segment being read."""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def _evict(self) -> None:
+        """Delete the oldest segments while the spool is over its size limit."""
+        total = sum(segment.size for segment in self._segments)
+        while total > self.max_bytes and len(self._segments) > 1:
+            segment = self._segments.pop(0)
+            if self._reader is not None:
+                self._close_reader()
+            self._remove(segment)
+            total -= segment.size
+            self.stats["documents_evicted"] += segment.documents
+            logger.warning(
+                f"Spool is over {self.max_bytes} bytes; dropped "
+                f"{segment.documents} documents from {segment.path}"
+            )
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Target health tracking for the SNMP Bridge.
+This module keeps the recent scrape latencies and failures of each target.
+It shortens a target's timeout to what its devices actually need, and opens
+a circuit breaker for targets that keep failing, so dead devices are probed
+now and then instead of holding a scrape slot for the full timeout on every
+interval.
+"""
+
+import logging
+import time
+from collections import deque
+from enum import Enum
+from typing import Callable, Dict, Iterable, Optional
+
+from runtime_schema import HealthConfig, RuntimeConfig
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+def get_health_config(config: RuntimeConfig) -> HealthConfig:
+    """Get the target health settings, or the defaults."""
+    if config.global_ and config.global_.health:
+        return config.global_.health
+    return HealthConfig()
+
+
+class BreakerState(str, Enum):
+    """State of a target's circuit breaker."""
+
+    CLOSED = "closed"  # Scraped on every interval
+    OPEN = "open"  # Only probed every probe interval
+    HALF_OPEN = "half_open"  # A probe is running
+
+
+class TargetHealth:
+    """Recent latencies, failures and breaker state of one target."""
+
+    __slots__ = (
+        "latencies",
+        "consecutive_failures",
+        "state",
+        "next_probe",
+        "trips",
+        "timeout",
+    )
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.state = BreakerState.CLOSED
+        self.next_probe = 0.0
+        self.trips = 0
+        self.timeout: Optional[float] = None
+
+    def latency_percentile(self, fraction: float) -> float:
+        """Nearest-rank percentile of the recent latencies."""
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class HealthTracker:
+    """
+    Track the health of every target from the outcome of its scrapes.
+
+    The adaptive timeout of a target is a multiple of a high percentile of
+    its recent latencies, between `min_timeout` and the configured timeout.
+    It only applies while the last scrape succeeded, so a target that slowed
+    down gets the full timeout on its next scrape.
+
+    After `failure_threshold` consecutive failures the target's breaker
+    opens: its scheduled scrapes are skipped, except for one probe every
+    `probe_interval` seconds. A successful probe closes the breaker, and a
+    failed one keeps it open until the next probe.
+    """
+
+    def __init__(
+        self,
+        health: Optional[HealthConfig] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the tracker.
+
+        Args:
+            health: Timeout and breaker settings; the defaults if None
+            clock: Monotonic clock in seconds
+        """
+        self.health = health or HealthConfig()
+        self.targets: Dict[str, TargetHealth] = {}
+        self._clock = clock
+
+    def update_config(self, health: HealthConfig) -> None:
+        """Switch to new settings, keeping the recorded latencies."""
+        if health.latency_window != self.health.latency_window:
+            for target in self.targets.values():
+                target.latencies = deque(target.latencies, maxlen=health.latency_window)
+        self.health = health
+
+    def get(self, target_name: str) -> TargetHealth:
+        """Get the health of a target."""
+        target = self.targets.get(target_name)
+        if target is None:
+            target = self.targets[target_name] = TargetHealth(
+                self.health.latency_window
+            )
+        return target
+
+    def timeout(self, target_name: str, configured: float) -> float:
+        """Get the timeout for the next scrape of a target."""
+        target = self.get(target_name)
+        health = self.health
+        timeout = configured
+        latency = self.latency(target_name, health.timeout_percentile)
+        if (
+            health.adaptive_timeout
+            and target.consecutive_failures == 0
+            and latency is not None
+        ):
+            adaptive = latency * health.timeout_multiplier
+            timeout = min(configured, max(health.min_timeout, adaptive))
+        target.timeout = timeout
+        return timeout
+
+    def latency(self, target_name: str, fraction: float) -> Optional[float]:
+        """A percentile of a target's recent latencies, or None if too few are known."""
+        target = self.get(target_name)
+        if len(target.latencies) < self.health.min_samples:
+            return None
+        return target.latency_percentile(fraction)
+
+    def hedge_delay(self, target_name: str) -> Optional[float]:
+        """Seconds after which to send a hedged request, or None to only fail over."""
+        return self.latency(target_name, self.health.hedge_percentile)
+
+    def allow(self, target_name: str) -> bool:
+        """
+        Whether a scheduled scrape of a target should run.
+
+        A probe that has not ended after `probe_interval` is given up, and
+        the next scheduled scrape is let through as a new probe.
+        """
+        target = self.get(target_name)
+        if target.state == BreakerState.CLOSED:
+            return True
+        now = self._clock()
+        if now < target.next_probe:
+            return False
+        if target.state == BreakerState.HALF_OPEN:
+            logger.warning(f"Probe of target {target_name} did not end, probing again")
+        else:
+            logger.info(f"Probing unresponsive target {target_name}")
+        target.state = BreakerState.HALF_OPEN
+        target.next_probe = now + self.health.probe_interval
+        return True
+
+    def record_success(self, target_name: str, seconds: Optional[float]) -> None:
+        """
+        Record a scrape that received a response in `seconds`.
+
+        `seconds` is None for responses that did not come from the exporter
+        for this scrape, such as cache hits, which close the breaker but
+        are not latency samples.
+        """
+        target = self.get(target_name)
+        if seconds is not None:
+            target.latencies.append(seconds)
+        target.consecutive_failures = 0
+        if target.state != BreakerState.CLOSED:
+            logger.info(f"Target {target_name} responded, resuming its schedule")
+            target.state = BreakerState.CLOSED
+
+    def record_failure(self, target_name: str) -> None:
+        """Record a scrape that received no response."""
+        target = self.get(target_name)
+        target.consecutive_failures += 1
+        if target.state == BreakerState.CLOSED:
+            if target.consecutive_failures < self.health.failure_threshold:
+                return
+            target.trips += 1
+            logger.warning(
+                f"Target {target_name} failed {target.consecutive_failures} "
+                f"scrapes in a row, probing it every {self.health.probe_interval}s"
+            )
+        target.state = BreakerState.OPEN
+        target.next_probe = self._clock() + self.health.probe_interval
+
+    def abandon_probe(self, target_name: str) -> None:
+        """
+        Count a probe as failed if its scrape ended without an outcome.
+
+        Scrapes that fail outside the fetch, or are not finished, record
+        neither a success nor a failure. A probe must still be resolved, or
+        its breaker would stay half-open and the target never be scraped.
+        """
+        target = self.targets.get(target_name)
+        if target is not None and target.state == BreakerState.HALF_OPEN:
+            self.record_failure(target_name)
+
+    def retain(self, target_names: Iterable[str]) -> None:
+        """Forget the targets that are no longer scraped."""
+        for target_name in set(self.targets) - set(target_names):
+            del self.targets[target_name]
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for the bulk request body builder.
+"""
+
+import json
+import unittest
+
+from elasticsearch import Elasticsearch
+
+from bulk_body import BulkBodyBuilder, compress_body, encode_document, send_bulk_body
+from bulk_indexer import BulkIndexer
+from fake_elasticsearch import FakeElasticsearch as FakeElasticsearchServer
+from test_bulk_indexer import FakeElasticsearch
+
+
+def parse_body(body):
+    """Parse a bulk body into its lines."""
+    return [json.loads(line) for line in body.splitlines()]
+
+
+class TestBulkBodyBuilder(unittest.TestCase):
+    """Test cases for BulkBodyBuilder."""
+
+    def test_body_lines(self):
+        """Each document is written after an action line for its index."""
+        builder = BulkBodyBuilder()
+        builder.add("metrics", {"value": 1})
+        builder.add("other", {"value": 2})
+        self.assertEqual(builder.doc_count, 2)
+
+        body = builder.take()
+        self.assertTrue(body.endswith(b"\n"))
+        self.assertEqual(
+            parse_body(body),
+            [
+                {"index": {"_index": "metrics"}},
+                {"value": 1},
+                {"index": {"_index": "other"}},
+                {"value": 2},
+            ],
+        )
+        self.assertEqual(builder.doc_count, 0)
+        self.assertEqual(len(builder), 0)
+
+    def test_action_lines_are_cached(self):
+        """The action line of an index is encoded once."""
+        builder = BulkBodyBuilder()
+        self.assertIs(builder.action_line("metrics"), builder.action_line("metrics"))
+
+    def test_max_bytes(self):
+        """A document that would not fit is refused until the body is taken."""
+        line = encode_document({"payload": "x" * 60})
+        size = len(BulkBodyBuilder().action_line("metrics")) + len(line)
+        builder = BulkBodyBuilder(max_bytes=2 * size)
+
+        self.assertTrue(builder.add_line("metrics", line))
+        self.assertTrue(builder.add_line("metrics", line))
+        self.assertFalse(builder.add_line("metrics", line))
+        self.assertEqual(builder.doc_count, 2)
+
+        builder.take()
+        self.assertTrue(builder.add_line("metrics", line))
+
+    def test_oversized_document_is_sent_alone(self):
+        """A document larger than max_bytes is accepted into an empty body."""
+        builder = BulkBodyBuilder(max_bytes=10)
+        self.assertTrue(builder.add("metrics", {"payload": "x" * 60}))
+        self.assertFalse(builder.add("metrics", {"value": 1}))
+
+    def test_raw_body(self):
+        """A pre-serialized body is added without another action line."""
+        builder = BulkBodyBuilder()
+        builder.add("metrics", {"value": 1})
+        raw = builder.take()
+        builder.add_line(None, raw, 1)
+        self.assertEqual(builder.take(), raw)
+
+
+class TestBulkIndexerRequestSize(unittest.TestCase):
+    """Test cases for splitting batches by request size."""
+
+    def test_batch_is_split(self):
+        """A batch over max_request_bytes is sent in several requests."""
+        client = FakeElasticsearch()
+        indexer = BulkIndexer(
+            client, max_documents=4, flush_interval=60, max_request_bytes=250
+        )
+        indexer.start()
+        indexer.add_documents("metrics", [{"payload": "x" * 60} for _ in range(4)])
+        indexer.close()
+
+        self.assertEqual([len(lines) // 2 for lines, _ in client.requests], [2, 2])
+        self.assertEqual(indexer.stats["documents_indexed"], 4)
+
+
+class TestCompression(unittest.TestCase):
+    """Test cases for gzip-compressed bulk requests."""
+
+    def test_compressed_flush(self):
+        """Compressed bodies hold the same documents and are counted."""
+        client = FakeElasticsearch()
+        indexer = BulkIndexer(client, flush_interval=60, compression_level=6)
+        indexer.start()
+        indexer.add_documents("metrics", [{"value": i, "unit": "x"} for i in range(50)])
+        indexer.close()
+
+        lines, _ = client.requests[0]
+        self.assertEqual(lines[1], {"value": 0, "unit": "x"})
+        self.assertEqual(indexer.stats["documents_indexed"], 50)
+        self.assertLess(
+            indexer.stats["bytes_sent"], indexer.stats["bytes_uncompressed"]
+        )
+
+    def test_uncompressed_by_default(self):
+        """Bodies are sent as they are unless a level is set."""
+        client = FakeElasticsearch()
+        indexer = BulkIndexer(client, flush_interval=60)
+        indexer.start()
+        indexer.add("metrics", {"value": 1})
+        indexer.close()
+
+        self.assertEqual(
+            indexer.stats["bytes_sent"], indexer.stats["bytes_uncompressed"]
+        )
+
+    def test_content_encoding_header(self):
+        """The client sends a compressed body that the server can decode."""
+        builder = BulkBodyBuilder()
+        for i in range(10):
+            builder.add("metrics", {"value": i})
+        body = builder.take()
+
+        with FakeElasticsearchServer(keep_documents=True) as server:
+            client = Elasticsearch(server.url)
+            response = send_bulk_body(
+                client, compress_body(body, 1), False, compressed=True
+            )
+            self.assertFalse(response["errors"])
+            self.assertEqual(server.documents, [{"value": i} for i in range(10)])
+            self.assertEqual(server.stats["bytes"], len(body))
+
+
+if __name__ == "__main__":
+    unittest.main()
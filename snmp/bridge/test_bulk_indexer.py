@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for the buffered bulk indexer.
+"""
+
+import gzip
+import json
+import threading
+import time
+import unittest
+
+from bulk_indexer import BulkIndexer, create_bulk_indexer
+from runtime_schema import RuntimeConfig
+
+
+def make_config(elasticsearch=None):
+    """Build a runtime configuration with the given Elasticsearch settings."""
+    data = {"version": "1.0.0", "exporters": {}, "targets": {}}
+    if elasticsearch is not None:
+        data["global"] = {"elasticsearch": elasticsearch}
+    return RuntimeConfig.model_validate(data)
+
+
+class FakeElasticsearch:
+    """Elasticsearch stand-in that records bulk requests."""
+
+    def __init__(self, fail_every=0):
+        self.requests = []
+        self.fail_every = fail_every
+        self.release = threading.Event()
+        self.release.set()
+
+    def perform_request(self, method, path, params, headers, body, **kwargs):
+        """Handle a compressed bulk request, as sent by send_bulk_body."""
+        assert path == "/_bulk" and headers["content-encoding"] == "gzip"
+        return self.bulk(gzip.decompress(body), **params)
+
+    def bulk(self, operations, **kwargs):
+        self.release.wait()
+        lines = [json.loads(line) for line in operations.splitlines()]
+        self.requests.append((lines, kwargs))
+        items = []
+        for i in range(len(lines) // 2):
+            if self.fail_every and i % self.fail_every == 0:
+                items.append({"index": {"status": 400, "error": {"type": "mapper"}}})
+            else:
+                items.append({"index": {"status": 201}})
+        return {
+            "errors": any("error" in item["index"] for item in items),
+            "items": items,
+        }
+
+
+class TestBulkIndexer(unittest.TestCase):
+    """Test cases for the bulk indexer."""
+
+    def test_flush_on_document_count(self):
+        """A batch is sent once it reaches max_documents."""
+        client = FakeElasticsearch()
+        indexer = BulkIndexer(client, max_documents=3, flush_interval=60)
+        indexer.start()
+        indexer.add_documents("metrics", [{"value": i} for i in range(7)])
+        indexer.close()
+
+        sizes = [len(lines) // 2 for lines, _ in client.requests]
+        self.assertEqual(sizes, [3, 3, 1])
+        lines = client.requests[0][0]
+        self.assertEqual(lines[0], {"index": {"_index": "metrics"}})
+        self.assertEqual(lines[1], {"value": 0})
+        self.assertEqual(indexer.stats["documents_indexed"], 7)
+
+    def test_flush_on_byte_size(self):
+        """A batch is sent once its body reaches max_bytes."""
+        client = FakeElasticsearch()
+        indexer = BulkIndexer(
+            client, max_documents=1000, max_bytes=100, flush_interval=60
+        )
+        indexer.start()
+        indexer.add_documents("metrics", [{"payload": "x" * 60} for _ in range(4)])
+        indexer.close()
+
+        self.assertEqual([len(lines) // 2 for lines, _ in client.requests], [2, 2])
+
+    def test_flush_on_interval(self):
+        """A partial batch is sent once the flush interval passes."""
+        client = FakeElasticsearch()
+        indexer = BulkIndexer(client, max_documents=1000, flush_interval=0.1)
+        indexer.start()
+        indexer.add("metrics", {"value": 1})
+        time.sleep(0.5)
+        self.assertEqual(len(client.requests), 1)
+        indexer.close()
+
+    def test_queue_is_bounded(self):
+        """Adding documents blocks while the queue is full."""
+        client = FakeElasticsearch()
+        client.release.clear()
+        indexer = BulkIndexer(
+            client, max_documents=1, flush_interval=60, max_queue_documents=2
+        )
+        indexer.start()
+
+        added = []
+
+        def producer():
+            for i in range(10):
+                indexer.add("metrics", {"value": i})
+                added.append(i)
+
+        thread = threading.Thread(target=producer)
+        thread.start()
+        time.sleep(0.3)
+        # One document is held by the blocked flush, two are queued
+        self.assertLessEqual(len(added), 4)
+        self.assertLessEqual(indexer.queue_depth, 2)
+
+        client.release.set()
+        thread.join(5)
+        indexer.close()
+        self.assertEqual(len(added), 10)
+        self.assertEqual(indexer.stats["documents_indexed"], 10)
+
+    def test_failed_documents_are_counted(self):
+        """Per-document errors are counted as failures."""
+        client = FakeElasticsearch(fail_every=2)
+        indexer = BulkIndexer(client, max_documents=4, flush_interval=60)
+        indexer.start()
+        indexer.add_documents("metrics", [{"value": i} for i in range(4)])
+        indexer.close()
+
+        self.assertEqual(indexer.stats["documents_indexed"], 2)
+        self.assertEqual(indexer.stats["documents_failed"], 2)
+
+    def test_no_refresh_by_default(self):
+        """Bulk requests do not force a refresh unless configured to."""
+        client = FakeElasticsearch()
+        indexer = create_bulk_indexer(client, make_config())
+        indexer.start()
+        indexer.add("metrics", {"value": 1})
+        indexer.close()
+
+        self.assertEqual(client.requests[0][1]["refresh"], False)
+
+    def test_refresh_policy_from_config(self):
+        """The configured refresh policy is passed to the bulk API."""
+        auth = {"username": "user", "password": "secret"}
+        for policy, expected in (
+            ("none", False),
+            ("wait_for", "wait_for"),
+            ("true", True),
+        ):
+            client = FakeElasticsearch()
+            config = make_config({"auth": auth, "refresh": policy})
+            indexer = create_bulk_indexer(client, config)
+            indexer.start()
+            indexer.add("metrics", {"value": 1})
+            indexer.close()
+
+            self.assertEqual(client.requests[0][1]["refresh"], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
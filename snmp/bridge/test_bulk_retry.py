@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Tests for retrying bulk requests.
+"""
+
+import json
+import random
+import unittest
+
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import ApiError
+from elasticsearch import ConnectionError as ESConnectionError
+
+from bulk_body import BulkBodyBuilder
+from bulk_indexer import BulkIndexer
+from bulk_retry import (
+    RetryPolicy,
+    SendRateLimiter,
+    get_retry_policy,
+    send_with_retries,
+    split_bulk_body,
+)
+from runtime_schema import RuntimeConfig
+
+
+def make_body(count):
+    """Build a bulk body of `count` documents."""
+    builder = BulkBodyBuilder()
+    for i in range(count):
+        builder.add("metrics", {"value": i})
+    return builder.take()
+
+
+def body_values(body):
+    """Get the document values in a bulk body."""
+    return [json.loads(line)["value"] for line in body.splitlines()[1::2]]
+
+
+def outcome(result):
+    """Get the indexed, failed, unsent and retry counts of a result."""
+    return result.indexed, result.failed, result.unsent_count, result.retries
+
+
+def make_api_error(status):
+    """Build an ApiError with the given status."""
+    meta = ApiResponseMeta(
+        status=status,
+        http_version="1.1",
+        headers=HttpHeaders(),
+        duration=0.0,
+        node=NodeConfig("http", "localhost", 9200),
+    )
+    return ApiError(message=str(status), meta=meta, body={})
+
+
+class ScriptedSend:
+    """Bulk sender that answers with a scripted status per document."""
+
+    def __init__(self, *rounds):
+        self.rounds = list(rounds)
+        self.bodies = []
+
+    def __call__(self, body):
+        self.bodies.append(body)
+        statuses = self.rounds.pop(0)
+        if isinstance(statuses, Exception):
+            raise statuses
+        items = []
+        for status in statuses:
+            result = {"status": status}
+            if status >= 300:
+                result["error"] = {"type": "rejected"}
+            items.append({"index": result})
+        return {"errors": any(status >= 300 for status in statuses), "items": items}
+
+
+class TestSendWithRetries(unittest.TestCase):
+    """Test cases for send_with_retries."""
+
+    def setUp(self):
+        self.policy = RetryPolicy(retries=2, retry_interval=0.001)
+
+    def test_only_retryable_documents_are_resent(self):
+        """Throttled documents are resent; rejected ones are not."""
+        send = ScriptedSend([201, 429, 400, 503], [201, 201])
+        result = send_with_retries(send, make_body(4), 4, self.policy)
+
+        self.assertEqual(outcome(result), (3, 1, 0, 1))
+        self.assertEqual(body_values(send.bodies[1]), [1, 3])
+
+    def test_retries_run_out(self):
+        """Documents still throttled after the last retry are returned."""
+        send = ScriptedSend([429, 201], [429], [429])
+        result = send_with_retries(send, make_body(2), 2, self.policy)
+        self.assertEqual(outcome(result), (1, 0, 1, 2))
+        self.assertEqual(body_values(result.unsent), [0])
+
+    def test_connection_error_resends_body(self):
+        """A connection error resends the whole body."""
+        body = make_body(2)
+        send = ScriptedSend(ESConnectionError("refused"), [201, 201])
+        result = send_with_retries(send, body, 2, self.policy)
+        self.assertEqual(outcome(result), (2, 0, 0, 1))
+        self.assertEqual(send.bodies, [body, body])
+
+    def test_status_errors(self):
+        """A request error is retried only for a retryable status."""
+        send = ScriptedSend(make_api_error(503), [201])
+        result = send_with_retries(send, make_body(1), 1, self.policy)
+        self.assertEqual(outcome(result), (1, 0, 0, 1))
+
+        send = ScriptedSend(make_api_error(400))
+        result = send_with_retries(send, make_body(1), 1, self.policy)
+        self.assertEqual(outcome(result), (0, 1, 0, 0))
+
+    def test_split_bulk_body(self):
+        """A body splits into one line pair per document."""
+        docs = split_bulk_body(make_body(3))
+        self.assertEqual(len(docs), 3)
+        self.assertEqual(b"".join(docs), make_body(3))
+
+
+class TestBackoff(unittest.TestCase):
+    """Test cases for the retry policy and the rate limiter."""
+
+    def test_delay_is_jittered_and_capped(self):
+        """Delays grow exponentially under the cap and are never negative."""
+        policy = RetryPolicy(retry_interval=1.0, max_interval=5.0, rng=random.Random(1))
+        for attempt in range(6):
+            ceiling = min(5.0, 2.0**attempt)
+            delays = [policy.delay(attempt) for _ in range(50)]
+            self.assertTrue(all(0 <= delay <= ceiling for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_policy_from_config(self):
+        """The policy comes from the global retry settings."""
+        config = RuntimeConfig.model_validate(
+            {
+                "version": "1.0.0",
+                "exporters": {},
+                "targets": {},
+                "global": {"retries": 5, "retry_interval": 2},
+            }
+        )
+        policy = get_retry_policy(config)
+        self.assertEqual((policy.retries, policy.retry_interval), (5, 2))
+
+    def test_rate_limiter(self):
+        """The interval doubles when throttled and shrinks on success."""
+        limiter = SendRateLimiter(
+            initial_interval=0.1, max_interval=0.3, recovery_step=0.05
+        )
+        limiter.throttled()
+        self.assertAlmostEqual(limiter.interval, 0.1)
+        limiter.throttled()
+        limiter.throttled()
+        self.assertAlmostEqual(limiter.interval, 0.3)
+        limiter.succeeded()
+        self.assertAlmostEqual(limiter.interval, 0.25)
+        for _ in range(10):
+            limiter.succeeded()
+        self.assertEqual(limiter.interval, 0.0)
+
+
+class ThrottlingElasticsearch:
+    """Elasticsearch stand-in that throttles every document once."""
+
+    def __init__(self):
+        self.seen = set()
+        self.requests = 0
+
+    def bulk(self, operations, **kwargs):
+        self.requests += 1
+        items = []
+        for value in body_values(operations):
+            if value in self.seen:
+                items.append({"index": {"status": 201}})
+            else:
+                self.seen.add(value)
+                items.append(
+                    {"index": {"status": 429, "error": {"type": "es_rejected"}}}
+                )
+        return {"errors": True, "items": items}
+
+
+class TestBulkIndexerRetries(unittest.TestCase):
+    """Test cases for retries in the bulk indexer."""
+
+    def test_throttled_documents_are_indexed(self):
+        """Throttled documents are indexed on retry and slow the indexer down."""
+        client = ThrottlingElasticsearch()
+        indexer = BulkIndexer(
+            client,
+            flush_interval=60,
+            retry_policy=RetryPolicy(retries=1, retry_interval=0.001),
+        )
+        indexer.start()
+        indexer.add_documents("metrics", [{"value": i} for i in range(5)])
+        indexer.close()
+
+        self.assertEqual(client.requests, 2)
+        self.assertEqual(indexer.stats["documents_indexed"], 5)
+        self.assertEqual(indexer.stats["retries"], 1)
+        self.assertGreater(indexer.rate_limiter.interval, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Tests for runtime configuration change detection.
+"""
+
+import copy
+import unittest
+
+from config_watcher import (
+    RuntimeConfigWatcher,
+    carry_over_unchanged,
+    diff_runtime_config,
+)
+from runtime_schema import RuntimeConfig
+
+CONFIG_DATA = {
+    "version": "1.0.0",
+    "exporters": {"snmp_exporter": {"type": "snmp", "url": "http://localhost:9116"}},
+    "targets": {
+        "router": {
+            "exporter": "snmp_exporter",
+            "interval": 60,
+            "metrics": [{"name": "sysUpTime", "path": "sysUpTime"}],
+        },
+        "switch": {
+            "exporter": "snmp_exporter",
+            "interval": 60,
+            "metrics": [{"name": "sysUpTime", "path": "sysUpTime"}],
+        },
+    },
+}
+
+
+class FakeIndices:
+    """Indices API stand-in."""
+
+    def __init__(self):
+        self.exists_calls = 0
+        self.index_exists = True
+
+    def exists(self, index):
+        self.exists_calls += 1
+        return self.index_exists
+
+
+class FakeConfigClient:
+    """Elasticsearch stand-in holding configuration documents."""
+
+    def __init__(self):
+        self.indices = FakeIndices()
+        self.documents = []
+        self.get_calls = 0
+
+    def upload(self, config_data, seq_no=None):
+        """Add a configuration document, as upload_config.py does."""
+        doc_id = f"doc-{len(self.documents)}"
+        seq_no = len(self.documents) if seq_no is None else seq_no
+        self.documents.append((doc_id, seq_no, {"config": copy.deepcopy(config_data)}))
+
+    def search(self, index, size, sort, source, seq_no_primary_term):
+        assert source is False and seq_no_primary_term
+        hits = [
+            {"_id": doc_id, "_seq_no": seq_no, "_primary_term": 1}
+            for doc_id, seq_no, _ in self.documents[-1:]
+        ]
+        return {"hits": {"hits": hits}}
+
+    def get(self, index, id):
+        self.get_calls += 1
+        for doc_id, _, source in self.documents:
+            if doc_id == id:
+                return {"_id": doc_id, "_source": source}
+        raise KeyError(id)
+
+
+class TestRuntimeConfigWatcher(unittest.TestCase):
+    """Test cases for RuntimeConfigWatcher."""
+
+    def setUp(self):
+        self.client = FakeConfigClient()
+        self.client.upload(CONFIG_DATA)
+        self.watcher = RuntimeConfigWatcher(self.client)
+
+    def test_unchanged_document_is_not_fetched(self):
+        """Only the first poll fetches and parses the configuration."""
+        config = self.watcher.poll()
+        self.assertEqual(set(config.targets), {"router", "switch"})
+
+        self.assertIsNone(self.watcher.poll())
+        self.assertIsNone(self.watcher.poll())
+        self.assertEqual(self.client.get_calls, 1)
+        self.assertEqual(self.client.indices.exists_calls, 1)
+
+    def test_identical_contents_are_not_a_change(self):
+        """A new document with the same contents is fetched but not returned."""
+        self.watcher.poll()
+        self.client.upload(CONFIG_DATA)
+
+        self.assertIsNone(self.watcher.poll())
+        self.assertEqual(self.client.get_calls, 2)
+        self.assertEqual(self.watcher.stats["changes"], 1)
+
+    def test_changed_contents_are_returned(self):
+        """A new document with different contents is returned."""
+        self.watcher.poll()
+        data = copy.deepcopy(CONFIG_DATA)
+        data["targets"]["router"]["interval"] = 30
+        self.client.upload(data)
+
+        config = self.watcher.poll()
+        self.assertEqual(config.targets["router"].interval, 30)
+
+    def test_missing_index(self):
+        """A missing index is reported as no configuration."""
+        self.client.indices.index_exists = False
+        watcher = RuntimeConfigWatcher(self.client)
+        self.assertIsNone(watcher.poll())
+        self.assertIsNone(watcher.poll())
+        self.assertEqual(self.client.indices.exists_calls, 2)
+
+
+class TestConfigDiff(unittest.TestCase):
+    """Test cases for diff_runtime_config."""
+
+    def test_diff_targets(self):
+        """Targets are reported as added, removed, changed or unchanged."""
+        old = RuntimeConfig.model_validate(CONFIG_DATA)
+        data = copy.deepcopy(CONFIG_DATA)
+        data["targets"]["router"]["interval"] = 30
+        data["targets"]["firewall"] = data["targets"].pop("switch")
+        data["targets"]["core"] = copy.deepcopy(CONFIG_DATA["targets"]["switch"])
+        new = RuntimeConfig.model_validate(data)
+
+        diff = diff_runtime_config(old, new)
+        self.assertEqual(diff.added_targets, {"firewall", "core"})
+        self.assertEqual(diff.removed_targets, {"switch"})
+        self.assertEqual(diff.changed_targets, {"router"})
+        self.assertEqual(diff.unchanged_targets, set())
+        self.assertFalse(diff.global_changed)
+        self.assertFalse(diff.empty)
+
+    def test_equal_configs(self):
+        """Equal configurations give an empty diff."""
+        old = RuntimeConfig.model_validate(CONFIG_DATA)
+        new = RuntimeConfig.model_validate(copy.deepcopy(CONFIG_DATA))
+        diff = diff_runtime_config(old, new)
+        self.assertTrue(diff.empty)
+        self.assertEqual(diff.unchanged_targets, {"router", "switch"})
+
+    def test_sharding_changes(self):
+        """Changed sharding settings are reported on their own."""
+        old = RuntimeConfig.model_validate(CONFIG_DATA)
+        data = copy.deepcopy(CONFIG_DATA)
+        data["global"] = {"sharding": {"enabled": True}}
+        new = RuntimeConfig.model_validate(data)
+
+        diff = diff_runtime_config(old, new)
+        self.assertTrue(diff.global_changed)
+        self.assertTrue(diff.sharding_changed)
+
+    def test_carry_over_unchanged(self):
+        """Unchanged targets and exporters keep their objects."""
+        old = RuntimeConfig.model_validate(CONFIG_DATA)
+        data = copy.deepcopy(CONFIG_DATA)
+        data["targets"]["router"]["interval"] = 30
+        data["global"] = {"concurrency": 4}
+        new = RuntimeConfig.model_validate(data)
+
+        diff = diff_runtime_config(old, new)
+        self.assertTrue(diff.global_changed)
+        self.assertFalse(diff.elasticsearch_changed)
+        self.assertFalse(diff.sharding_changed)
+
+        new = carry_over_unchanged(old, new, diff)
+        self.assertIs(new.targets["switch"], old.targets["switch"])
+        self.assertIsNot(new.targets["router"], old.targets["router"])
+        self.assertIs(new.exporters["snmp_exporter"], old.exporters["snmp_exporter"])
+
+
+if __name__ == "__main__":
+    unittest.main()
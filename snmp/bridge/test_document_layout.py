@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for the document layouts.
+"""
+
+import unittest
+
+from elasticsearch_writer import build_metric_documents, get_document_layout
+from prometheus_stream import StreamingPrometheusParser
+from runtime_schema import DocumentLayout
+from test_mapping_plan import TIMESTAMP, make_config
+from test_prometheus_stream import PAYLOAD
+
+SUMMARY_PAYLOAD = """\
+# TYPE snmp_request_seconds summary
+snmp_request_seconds{quantile="0.5"} 0.2
+snmp_request_seconds{quantile="0.99"} 0.9
+snmp_request_seconds_sum 3.5
+snmp_request_seconds_count 10
+"""
+
+
+def parse_batch(payload=PAYLOAD):
+    """Parse a payload into a sample batch."""
+    parser = StreamingPrometheusParser(timestamp=TIMESTAMP)
+    parser.feed(payload)
+    return parser.close_batch()
+
+
+def series_documents(metrics, metadata=None):
+    """Build series layout documents for the router target."""
+    target_config = make_config().targets["router"]
+    return build_metric_documents(
+        metrics, target_config, metadata or {}, layout=DocumentLayout.SERIES
+    )
+
+
+class TestSeriesLayout(unittest.TestCase):
+    """Test cases for the series document layout."""
+
+    def test_one_document_per_label_set(self):
+        """Each interface gets its own document with its own labels."""
+        docs = series_documents(parse_batch())
+        by_index = {doc["labels"].get("ifIndex"): doc for doc in docs}
+
+        self.assertEqual(by_index["1"]["labels"], {"ifDescr": "eth0", "ifIndex": "1"})
+        self.assertEqual(
+            by_index["1"]["metrics"],
+            {"ifHCInOctets": 1.5e6, "ifOperStatus": 1.0},
+        )
+        self.assertEqual(by_index["2"]["metrics"], {"ifHCInOctets": 42.0})
+        self.assertEqual(by_index[None]["@timestamp"], TIMESTAMP)
+
+    def test_no_values_are_lost(self):
+        """Every sample value appears in exactly one document."""
+        batch = parse_batch()
+        docs = series_documents(batch)
+
+        def count_leaves(value):
+            if isinstance(value, dict):
+                return sum(count_leaves(v) for v in value.values())
+            return 1
+
+        self.assertEqual(sum(count_leaves(doc["metrics"]) for doc in docs), len(batch))
+
+    def test_histogram_samples_use_sub_fields(self):
+        """_count and _sum samples are stored next to each other."""
+        docs = series_documents(parse_batch())
+        unlabelled = [doc for doc in docs if not doc["labels"]][0]
+        self.assertEqual(
+            unlabelled["metrics"]["scrape"]["seconds"], {"count": 2.0, "sum": 0.7}
+        )
+        buckets = [doc for doc in docs if "le" in doc["labels"]]
+        self.assertEqual(
+            [doc["metrics"]["scrape"]["seconds"]["bucket"] for doc in buckets],
+            [1.0, 2.0],
+        )
+
+    def test_summary_quantiles_use_value_field(self):
+        """Quantiles go in a value sub-field, next to _count and _sum."""
+        batch = parse_batch(SUMMARY_PAYLOAD)
+        docs = series_documents(batch)
+        fields = {
+            doc["labels"].get("quantile"): doc["metrics"]["snmp"]["request"]["seconds"]
+            for doc in docs
+        }
+        self.assertEqual(
+            fields,
+            {
+                "0.5": {"value": 0.2},
+                "0.99": {"value": 0.9},
+                None: {"count": 10.0, "sum": 3.5},
+            },
+        )
+        self.assertEqual(docs, series_documents(batch.to_metrics()))
+
+    def test_batch_matches_dict_layout(self):
+        """A batch and the equivalent sample dicts give the same documents."""
+        batch = parse_batch()
+        self.assertEqual(
+            series_documents(batch, {"a": 1}),
+            series_documents(batch.to_metrics(), {"a": 1}),
+        )
+
+    def test_shared_fields_are_reused(self):
+        """Documents of one scrape share their common nested fields."""
+        docs = series_documents(parse_batch(), {"observer": {"name": "bridge"}})
+        self.assertIs(docs[0]["event"], docs[1]["event"])
+        self.assertIs(docs[0]["observer"], docs[1]["observer"])
+        self.assertIsNot(docs[0]["metrics"], docs[1]["metrics"])
+
+    def test_layout_setting(self):
+        """The target layout overrides the Elasticsearch layout."""
+        config = make_config()
+        target_config = config.targets["router"]
+        self.assertEqual(
+            get_document_layout(config, target_config), DocumentLayout.MERGED
+        )
+
+        target_config = target_config.model_copy(
+            update={"layout": DocumentLayout.SERIES}
+        )
+        self.assertEqual(
+            get_document_layout(config, target_config), DocumentLayout.SERIES
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
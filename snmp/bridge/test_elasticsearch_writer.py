@@ -59,7 +59,11 @@ def main() -> None:
 
     # Fetch metrics
     logger.info(f"Fetching metrics from target: {args.target}")
-    metrics = fetch_metrics(config, args.target)
+    try:
+        metrics = fetch_metrics(config, args.target)
+    except Exception as e:
+        logger.error(f"Failed to fetch metrics: {str(e)}")
+        sys.exit(1)
 
     # Print fetched metrics
     logger.info(f"Fetched metrics: {json.dumps(metrics, indent=2)}")
@@ -123,11 +123,10 @@ class TestExporterAuthentication(unittest.TestCase):
         # Set up mock response for auth failure
         mock_get.side_effect = requests.exceptions.HTTPError("HTTP Error: 401")
 
-        # Call fetch_metrics and expect sys.exit to be called
-        fetch_metrics(self.config, "network_devices")
-
-        # Check that sys.exit was called with the correct code
-        self.mock_exit.assert_called_once_with(1)
+        # The error is raised to the caller rather than exiting the process
+        with self.assertRaises(requests.exceptions.HTTPError):
+            fetch_metrics(self.config, "network_devices")
+        self.mock_exit.assert_not_called()
 
     @patch("test_snmp_fetch.requests.get")
     def test_tls_verification(self, mock_get):
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Tests for the asynchronous exporter client.
+"""
+
+import asyncio
+import base64
+import unittest
+
+import aiohttp
+from aiohttp import web
+
+from exporter_client import ExporterClientPool, prepare_exporter_request
+from prometheus_stream import StreamingPrometheusParser, build_allow_list
+from runtime_schema import RuntimeConfig
+from test_self_metrics import RecordingParser
+
+METRICS_TEXT = "# HELP sysUpTime Uptime\n# TYPE sysUpTime gauge\nsysUpTime 42.0\n"
+
+
+def make_config(url, auth=None, headers=None):
+    """Build a runtime configuration with a single exporter and target."""
+    exporter = {"type": "snmp", "url": url}
+    if auth:
+        exporter["auth"] = auth
+    if headers:
+        exporter["headers"] = headers
+    return RuntimeConfig.model_validate(
+        {
+            "version": "1.0.0",
+            "exporters": {"snmp_exporter": exporter},
+            "targets": {
+                "router": {
+                    "exporter": "snmp_exporter",
+                    "module": "system",
+                    "target": "127.0.0.1:1613",
+                    "auth": "linux",
+                    "interval": 60,
+                    "metrics": [{"name": "sysUpTime", "path": "sysUpTime"}],
+                }
+            },
+        }
+    )
+
+
+class TestPrepareExporterRequest(unittest.TestCase):
+    """Test cases for request preparation."""
+
+    def test_basic_auth(self):
+        """Basic authentication is returned as a username/password pair."""
+        config = make_config(
+            "http://localhost:9116", auth={"username": "user", "password": "secret"}
+        )
+        request = prepare_exporter_request(config, "router")
+        self.assertEqual(request.auth, ("user", "secret"))
+        self.assertEqual(
+            request.url,
+            "http://localhost:9116/snmp?module=system&target=127.0.0.1%3A1613&auth=linux",
+        )
+
+    def test_bearer_token_does_not_modify_config(self):
+        """Authorization headers are added to a copy of the exporter headers."""
+        config = make_config(
+            "http://localhost:9116",
+            auth={"bearer_token": "token"},
+            headers={"X-Team": "network"},
+        )
+        request = prepare_exporter_request(config, "router")
+        self.assertEqual(request.headers["Authorization"], "Bearer token")
+        self.assertNotIn("Authorization", config.exporters["snmp_exporter"].headers)
+
+    def test_unknown_target(self):
+        """Unknown targets raise ValueError instead of exiting."""
+        config = make_config("http://localhost:9116")
+        with self.assertRaises(ValueError):
+            prepare_exporter_request(config, "missing")
+
+
+class TestExporterClientPool(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the pooled exporter client."""
+
+    async def asyncSetUp(self):
+        self.requests = []
+        self.connections = set()
+
+        async def handle(request):
+            self.requests.append(request)
+            self.connections.add(request.transport.get_extra_info("peername"))
+            return web.Response(text=METRICS_TEXT)
+
+        app = web.Application()
+        app.router.add_get("/snmp", handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+
+    async def test_fetch_reuses_connection(self):
+        """Repeated scrapes of an exporter share one keep-alive connection."""
+        config = make_config(self.url, auth={"username": "user", "password": "secret"})
+        pool = ExporterClientPool()
+        try:
+            for _ in range(5):
+                text = await pool.fetch(config, "router")
+                self.assertEqual(text, METRICS_TEXT)
+        finally:
+            await pool.close()
+
+        self.assertEqual(len(self.requests), 5)
+        self.assertEqual(len(self.connections), 1)
+        expected = "Basic " + base64.b64encode(b"user:secret").decode()
+        self.assertEqual(self.requests[0].headers["Authorization"], expected)
+        self.assertEqual(self.requests[0].query["module"], "system")
+
+    async def test_fetch_into_streaming_parser(self):
+        """A streamed response is fed to the parser as it arrives."""
+        config = make_config(self.url)
+        target_config = config.targets["router"]
+        parser = StreamingPrometheusParser(build_allow_list(target_config.metrics))
+        pool = ExporterClientPool()
+        try:
+            await pool.fetch_into(config, "router", parser)
+        finally:
+            await pool.close()
+
+        metrics = parser.close()
+        self.assertEqual(metrics["sysUpTime"][0]["value"], 42.0)
+
+    async def test_config_change_replaces_session(self):
+        """A changed exporter configuration gets a new session."""
+        pool = ExporterClientPool()
+        try:
+            config = make_config(self.url)
+            first = pool.get_session("snmp_exporter", config.exporters["snmp_exporter"])
+            self.assertIs(
+                pool.get_session("snmp_exporter", config.exporters["snmp_exporter"]),
+                first,
+            )
+
+            changed = make_config(self.url, headers={"X-Team": "network"})
+            second = pool.get_session(
+                "snmp_exporter", changed.exporters["snmp_exporter"]
+            )
+            self.assertIsNot(second, first)
+        finally:
+            await pool.close()
+        self.assertTrue(first.closed)
+        self.assertTrue(second.closed)
+
+
+class TestHedgedRequests(unittest.IsolatedAsyncioTestCase):
+    """Test cases for hedged requests to a secondary exporter."""
+
+    async def asyncSetUp(self):
+        self.delays = {"primary": 0.0, "secondary": 0.0}
+        self.statuses = {"primary": 200, "secondary": 200}
+        self.served = []
+        self.runners = []
+        urls = {}
+        for name in ("primary", "secondary"):
+
+            async def handle(request, name=name):
+                await asyncio.sleep(self.delays[name])
+                self.served.append(name)
+                return web.Response(text=name, status=self.statuses[name])
+
+            app = web.Application()
+            app.router.add_get("/snmp", handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            self.runners.append(runner)
+            urls[name] = f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+        self.config = make_config(urls["primary"])
+        self.config.targets["router"].secondary_exporter_url = urls["secondary"]
+        self.pool = ExporterClientPool()
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        for runner in self.runners:
+            await runner.cleanup()
+
+    async def test_fast_primary_is_not_hedged(self):
+        """The secondary is not asked when the primary answers in time."""
+        text = await self.pool.fetch(self.config, "router", hedge_after=1.0)
+        self.assertEqual(text, "primary")
+        self.assertEqual(self.served, ["primary"])
+        self.assertEqual(self.pool.hedge_stats["hedged"], 0)
+
+    async def test_slow_primary_is_hedged(self):
+        """A primary slower than the hedge delay loses to the secondary."""
+        self.delays["primary"] = 1.0
+        text = await self.pool.fetch(self.config, "router", hedge_after=0.05)
+        self.assertEqual(text, "secondary")
+        self.assertEqual(self.pool.hedge_stats["hedged"], 1)
+        self.assertEqual(self.pool.hedge_stats["secondary_won"], 1)
+
+    async def test_failed_primary_fails_over(self):
+        """Without a hedge delay the secondary is asked when the primary fails."""
+        self.statuses["primary"] = 500
+        text = await self.pool.fetch(self.config, "router")
+        self.assertEqual(text, "secondary")
+        self.assertEqual(self.pool.hedge_stats["failed_over"], 1)
+
+    async def test_both_failing_raises_primary_error(self):
+        """If both exporters fail the primary's error is raised."""
+        self.statuses = {"primary": 503, "secondary": 500}
+        with self.assertRaises(aiohttp.ClientResponseError) as raised:
+            await self.pool.fetch(self.config, "router")
+        self.assertEqual(raised.exception.status, 503)
+
+    async def test_streaming_fetch_is_hedged(self):
+        """fetch_into receives the whole body of the winning response."""
+        self.delays["primary"] = 1.0
+        parser = RecordingParser()
+        await self.pool.fetch_into(self.config, "router", parser, hedge_after=0.05)
+        self.assertEqual(parser.text, "secondary")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for label interning.
+"""
+
+import unittest
+
+from elasticsearch_writer import MappingPlanCache, build_metric_documents
+from label_intern import LabelInterner
+from prometheus_stream import StreamingPrometheusParser
+from test_mapping_plan import TIMESTAMP, make_config
+from test_prometheus_stream import PAYLOAD
+
+
+def parse_scrape(interner):
+    """Parse the test payload as one scrape."""
+    parser = StreamingPrometheusParser(timestamp=TIMESTAMP, label_interner=interner)
+    parser.feed(PAYLOAD)
+    return parser.close_batch()
+
+
+class TestLabelInterner(unittest.TestCase):
+    """Test cases for LabelInterner."""
+
+    def test_label_set_is_reused(self):
+        """The same label text gives the same label set object."""
+        interner = LabelInterner()
+        first = interner.label_set('ifDescr="eth0",ifIndex="1"')
+        second = interner.label_set('ifDescr="eth0",ifIndex="1"')
+
+        self.assertEqual(first, {"ifDescr": "eth0", "ifIndex": "1"})
+        self.assertIs(first, second)
+        self.assertEqual(interner.stats["hits"], 1)
+        self.assertEqual(interner.stats["misses"], 1)
+
+    def test_values_are_shared(self):
+        """Equal label values in different label sets are one string."""
+        interner = LabelInterner()
+        a = interner.label_set('ifName="Gi0/1",ifIndex="1"')
+        b = interner.label_set('ifName="Gi0/1",ifIndex="2"')
+        self.assertIs(a["ifName"], b["ifName"])
+
+    def test_least_recently_used_is_evicted(self):
+        """The bound evicts the label set that was used longest ago."""
+        interner = LabelInterner(max_label_sets=2)
+        first = interner.label_set('a="1"')
+        interner.label_set('a="2"')
+        interner.label_set('a="1"')
+        interner.label_set('a="3"')
+
+        self.assertEqual(len(interner), 2)
+        self.assertEqual(interner.stats["evictions"], 1)
+        self.assertIs(interner.label_set('a="1"'), first)
+
+        interner.resize(1)
+        self.assertEqual(len(interner), 1)
+
+    def test_merged_labels_are_reused(self):
+        """Merging the same label set objects again returns the previous result."""
+        interner = LabelInterner()
+        label_sets = [interner.label_set('a="1"'), interner.label_set('a="2",b="3"')]
+
+        merged = interner.merged_labels(label_sets)
+        self.assertEqual(merged, {"a": "1", "b": "3"})
+        self.assertIs(interner.merged_labels(list(label_sets)), merged)
+
+        changed = interner.merged_labels([{"a": "1"}, {"b": "3"}])
+        self.assertIsNot(changed, merged)
+        self.assertEqual(changed, merged)
+
+    def test_shared_between_scrapes(self):
+        """Consecutive scrapes of a target share label sets and document labels."""
+        config = make_config()
+        plans = MappingPlanCache()
+        plan = plans.get("router", config.targets["router"])
+
+        first = parse_scrape(plan.labels)
+        second = parse_scrape(plan.labels)
+        for a, b in zip(first.label_sets, second.label_sets):
+            self.assertIs(a, b)
+
+        target_config = config.targets["router"]
+        doc_a = build_metric_documents(first, target_config, {}, plan)[0]
+        doc_b = build_metric_documents(second, target_config, {}, plan)[0]
+        self.assertIs(doc_a["labels"], doc_b["labels"])
+
+
+class TestMappingPlanCacheLabels(unittest.TestCase):
+    """Test cases for label interners held by mapping plans."""
+
+    def test_interner_survives_plan_rebuild(self):
+        """A target keeps its interner when its mapping plan is rebuilt."""
+        plans = MappingPlanCache()
+        plans.update(make_config())
+        interner = plans.get("router", make_config().targets["router"]).labels
+
+        changed = make_config(uptime_field="system.uptime")
+        changed.global_ = None
+        plans.update(changed)
+        self.assertIs(plans.get("router", changed.targets["router"]).labels, interner)
+
+    def test_cache_size_from_config(self):
+        """The label cache size is read from the global settings."""
+        config = make_config()
+        config = config.model_validate(
+            {**config.model_dump(by_alias=True), "global": {"label_cache_size": 5}}
+        )
+        plans = MappingPlanCache()
+        plans.update(config)
+        plan = plans.get("router", config.targets["router"])
+        self.assertEqual(plan.labels.max_label_sets, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for compiled metric mapping plans.
+"""
+
+import unittest
+
+from elasticsearch_writer import (
+    MappingPlanCache,
+    TargetMappingPlan,
+    build_metric_documents,
+)
+from runtime_schema import RuntimeConfig
+
+TIMESTAMP = "2025-03-05T10:45:00+00:00"
+
+
+def make_config(uptime_field="host.uptime"):
+    """Build a runtime configuration with two targets."""
+    metrics = [
+        {
+            "name": "sysUpTime",
+            "path": "sysUpTime",
+            "ecs_mapping": {"field": uptime_field, "type": "float"},
+        },
+        {"name": "ifHCInOctets", "path": "ifHCInOctets"},
+    ]
+    return RuntimeConfig.model_validate(
+        {
+            "version": "1.0.0",
+            "exporters": {
+                "snmp_exporter": {"type": "snmp", "url": "http://localhost:9116"}
+            },
+            "targets": {
+                "router": {
+                    "exporter": "snmp_exporter",
+                    "interval": 60,
+                    "metrics": metrics,
+                },
+                "switch": {
+                    "exporter": "snmp_exporter",
+                    "interval": 60,
+                    "metrics": metrics,
+                },
+            },
+        }
+    )
+
+
+def sample(name, value, labels=None):
+    """Build a parsed sample."""
+    return {
+        "name": name,
+        "labels": labels or {},
+        "value": value,
+        "timestamp": TIMESTAMP,
+    }
+
+
+class TestTargetMappingPlan(unittest.TestCase):
+    """Test cases for a target's mapping plan."""
+
+    def test_configured_and_automatic_paths(self):
+        """Configured metrics use their ECS field, others are mapped by name."""
+        plan = TargetMappingPlan(make_config().targets["router"])
+
+        self.assertEqual(plan.get("sysUpTime").parents, ("host",))
+        self.assertEqual(plan.get("sysUpTime").leaf, "uptime")
+        self.assertEqual(plan.get("ifHCInOctets").parents, ())
+        self.assertEqual(
+            plan.get("node_memory_MemFree_bytes").parents, ("node", "memory", "MemFree")
+        )
+        self.assertIs(
+            plan.get("node_memory_MemFree_bytes"), plan.get("node_memory_MemFree_bytes")
+        )
+        self.assertEqual(plan.index_name, "hedgehog-snmp-metrics")
+
+    def test_documents_use_plan(self):
+        """Documents built from a plan nest values under their field path."""
+        target_config = make_config().targets["router"]
+        plan = TargetMappingPlan(target_config)
+        metrics = {
+            "sysUpTime": [sample("sysUpTime", 12.0)],
+            "ifHCInOctets": [sample("ifHCInOctets", 5.0, {"ifIndex": "1"})],
+            "custom_value": [sample("custom_value", "true")],
+        }
+        docs = build_metric_documents(
+            metrics, target_config, {"collector": "bridge"}, plan
+        )
+
+        self.assertEqual(len(docs), 1)
+        self.assertEqual(
+            docs[0]["metrics"],
+            {"host": {"uptime": 12.0}, "ifHCInOctets": 5.0, "custom": {"value": True}},
+        )
+        self.assertEqual(docs[0]["labels"], {"ifIndex": "1"})
+        self.assertEqual(docs[0]["collector"], "bridge")
+        self.assertEqual(
+            docs,
+            build_metric_documents(metrics, target_config, {"collector": "bridge"}),
+        )
+
+
+class TestMappingPlanCache(unittest.TestCase):
+    """Test cases for the mapping plan cache."""
+
+    def test_unchanged_targets_keep_plan(self):
+        """A reload with the same target settings keeps the compiled plan."""
+        cache = MappingPlanCache()
+        config = make_config()
+        cache.update(config)
+        plan = cache.get("router", config.targets["router"])
+
+        reloaded = make_config()
+        cache.update(reloaded)
+        self.assertIs(cache.get("router", reloaded.targets["router"]), plan)
+
+    def test_changed_target_is_rebuilt(self):
+        """A reload that changes a target rebuilds only that target's plan."""
+        cache = MappingPlanCache()
+        config = make_config()
+        cache.update(config)
+        router_plan = cache.get("router", config.targets["router"])
+
+        changed = make_config(uptime_field="system.uptime")
+        del changed.targets["switch"]
+        cache.update(changed)
+        new_plan = cache.get("router", changed.targets["router"])
+
+        self.assertIsNot(new_plan, router_plan)
+        self.assertEqual(new_plan.get("sysUpTime").parents, ("system",))
+        self.assertNotIn("switch", cache._plans)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Tests for module batching.
+"""
+
+import asyncio
+import unittest
+
+from aiohttp import web
+
+from exporter_client import ExporterClientPool
+from module_batching import plan_module_batches
+from runtime_schema import RuntimeConfig
+from scrape_pipeline import ScrapePipeline
+from test_scrape_pipeline import RecordingIndexer
+
+MODULE_TEXT = {
+    "system": "# TYPE sysUpTime gauge\nsysUpTime 42\n",
+    "if_mib": (
+        "# TYPE ifOperStatus gauge\n"
+        'ifOperStatus{ifIndex="1"} 1\n'
+        'ifOperStatus{ifIndex="2"} 2\n'
+    ),
+}
+
+METRICS = {"system": "sysUpTime", "if_mib": "ifOperStatus"}
+
+
+def make_target(module, target="10.0.0.1", interval=60, **extra):
+    """Build a target scraping one module of a device."""
+    return {
+        "exporter": "snmp_exporter",
+        "module": module,
+        "target": target,
+        "auth": "public_v2",
+        "interval": interval,
+        "layout": "series",
+        "metrics": [{"name": METRICS[module], "path": METRICS[module]}],
+        **extra,
+    }
+
+
+def make_config(targets, url="http://localhost:9116", batch_modules=True):
+    """Build a runtime configuration with the given targets."""
+    return RuntimeConfig.model_validate(
+        {
+            "version": "1.0.0",
+            "exporters": {"snmp_exporter": {"type": "snmp", "url": url}},
+            "targets": targets,
+            "global": {"batch_modules": batch_modules},
+        }
+    )
+
+
+class TestPlanModuleBatches(unittest.TestCase):
+    """Test cases for grouping targets into batches."""
+
+    def test_modules_of_a_device_are_batched(self):
+        """Targets on one device with different modules share a batch."""
+        config = make_config(
+            {
+                "router-system": make_target("system"),
+                "router-if": make_target("if_mib"),
+                "switch-system": make_target("system", target="10.0.0.2"),
+            }
+        )
+        batches = plan_module_batches(config)
+        self.assertEqual(set(batches), {"router-system", "router-if"})
+        batch = batches["router-if"]
+        self.assertIs(batches["router-system"], batch)
+        self.assertEqual(batch.module, "if_mib,system")
+        self.assertEqual(batch.target_names, ["router-if", "router-system"])
+
+    def test_different_requests_are_not_batched(self):
+        """Targets differing in interval or SNMP authentication are not batched."""
+        config = make_config(
+            {
+                "a-system": make_target("system"),
+                "a-if": make_target("if_mib", interval=30),
+                "b-system": make_target("system", target="10.0.0.2"),
+                "b-if": make_target("if_mib", target="10.0.0.2", auth="private_v3"),
+            }
+        )
+        self.assertEqual(plan_module_batches(config), {})
+
+    def test_batch_names_are_unique(self):
+        """Batches on one device with different intervals have their own names."""
+        config = make_config(
+            {
+                "fast-system": make_target("system", interval=30),
+                "fast-if": make_target("if_mib", interval=30),
+                "slow-system": make_target("system"),
+                "slow-if": make_target("if_mib"),
+            }
+        )
+        batches = plan_module_batches(config)
+        self.assertNotEqual(batches["fast-if"].name, batches["slow-if"].name)
+        # Names are stable, as they decide scheduling offsets and shard owners
+        self.assertEqual(
+            batches["slow-if"].name, plan_module_batches(config)["slow-if"].name
+        )
+
+    def test_legacy_params_are_not_batched(self):
+        """Targets using the params dictionary are scraped alone."""
+        config = make_config(
+            {
+                "router-system": make_target("system"),
+                "router-if": make_target("if_mib", params={"module": "if_mib"}),
+            }
+        )
+        self.assertEqual(plan_module_batches(config), {})
+
+
+class TestBatchedScrapes(unittest.IsolatedAsyncioTestCase):
+    """Test cases for scraping a batch through the pipeline."""
+
+    async def asyncSetUp(self):
+        self.modules_requested = []
+
+        async def handle(request):
+            modules = request.query["module"].split(",")
+            self.modules_requested.append(modules)
+            await asyncio.sleep(0.05)
+            return web.Response(text="".join(MODULE_TEXT[m] for m in modules))
+
+        app = web.Application()
+        app.router.add_get("/snmp", handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", 0).start()
+        self.url = f"http://127.0.0.1:{self.runner.addresses[0][1]}"
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+
+    async def scrape_all(self, batch_modules):
+        """Scrape both targets of a device at once and return the documents."""
+        config = make_config(
+            {
+                "router-system": make_target("system"),
+                "router-if": make_target("if_mib"),
+            },
+            url=self.url,
+            batch_modules=batch_modules,
+        )
+        exporter_pool = ExporterClientPool()
+        indexer = RecordingIndexer()
+        try:
+            pipeline = ScrapePipeline(config, exporter_pool, indexer)
+            traces = await asyncio.gather(
+                pipeline.scrape("router-system"), pipeline.scrape("router-if")
+            )
+        finally:
+            await exporter_pool.close()
+        for trace in traces:
+            self.assertIsNone(trace.error)
+        return indexer.documents
+
+    def metric_names(self, documents):
+        """Metric names of the documents, one entry per document."""
+        return sorted(name for _, doc in documents for name in doc["metrics"])
+
+    async def test_one_request_per_device(self):
+        """Both targets share one request and keep their own metrics."""
+        documents = await self.scrape_all(batch_modules=True)
+        self.assertEqual(self.modules_requested, [["if_mib", "system"]])
+        # Each target kept only its own families from the shared response
+        self.assertEqual(
+            self.metric_names(documents),
+            ["ifOperStatus", "ifOperStatus", "sysUpTime"],
+        )
+
+    async def test_without_batching(self):
+        """Without batching each target sends its own request."""
+        documents = await self.scrape_all(batch_modules=False)
+        self.assertEqual(sorted(self.modules_requested), [["if_mib"], ["system"]])
+        self.assertEqual(
+            self.metric_names(documents),
+            ["ifOperStatus", "ifOperStatus", "sysUpTime"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
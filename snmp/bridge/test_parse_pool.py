@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Tests for the process-pool parsing stage.
+"""
+
+import json
+import unittest
+
+import parse_pool
+from bulk_indexer import BulkIndexer
+from elasticsearch_writer import TargetMappingPlan, build_metric_documents
+from parse_pool import ParsePool, parse_to_bulk_body
+from prometheus_stream import StreamingPrometheusParser
+from runtime_schema import DocumentLayout, ParserMode
+from test_bulk_indexer import FakeElasticsearch
+from test_mapping_plan import make_config
+from test_prometheus_stream import PAYLOAD
+
+
+def worker_label_cache_size():
+    """Label cache size of the worker process this runs in."""
+    return parse_pool._worker_plans.label_cache_size
+
+
+def split_body(body):
+    """Split a bulk body into its action and document lines."""
+    lines = [json.loads(line) for line in body.splitlines()]
+    return lines[0::2], lines[1::2]
+
+
+class TestParseToBulkBody(unittest.TestCase):
+    """Test cases for parse_to_bulk_body."""
+
+    def test_body_matches_documents(self):
+        """The body holds the same documents the writer builds."""
+        target_config = make_config().targets["router"]
+        body, count = parse_to_bulk_body(
+            "router",
+            target_config,
+            PAYLOAD,
+            {"a": 1},
+            ParserMode.STREAMING,
+            DocumentLayout.SERIES,
+        )
+        actions, docs = split_body(body)
+
+        plan = TargetMappingPlan(target_config)
+        parser = StreamingPrometheusParser(plan.allow_list, plan.configured_names)
+        parser.feed(PAYLOAD)
+        expected = build_metric_documents(
+            parser.close_batch(), target_config, {"a": 1}, plan, DocumentLayout.SERIES
+        )
+
+        self.assertEqual(count, len(expected))
+        self.assertEqual(actions[0], {"index": {"_index": "hedgehog-snmp-metrics"}})
+        expected = json.loads(json.dumps(expected))
+        for doc in docs + expected:
+            doc.pop("@timestamp")
+        self.assertEqual(docs, expected)
+
+    def test_full_parser(self):
+        """The full parser gives one merged document per scrape."""
+        target_config = make_config().targets["router"]
+        body, count = parse_to_bulk_body("router", target_config, PAYLOAD, {})
+        _, docs = split_body(body)
+        self.assertEqual(count, 1)
+        self.assertEqual(docs[0]["metrics"]["host"]["uptime"], 123456.0)
+
+    def test_empty_response(self):
+        """An empty response gives an empty body."""
+        target_config = make_config().targets["router"]
+        self.assertEqual(parse_to_bulk_body("router", target_config, "", {}), (b"", 0))
+
+
+class TestParsePool(unittest.TestCase):
+    """Test cases for ParsePool."""
+
+    def test_worker_result_is_indexed(self):
+        """A body built in a worker process is sent as it is."""
+        target_config = make_config().targets["router"]
+        pool = ParsePool(1)
+        try:
+            body, count = pool.submit(
+                "router", target_config, PAYLOAD, {}, ParserMode.STREAMING
+            ).result(timeout=30)
+        finally:
+            pool.close()
+
+        client = FakeElasticsearch()
+        indexer = BulkIndexer(client, flush_interval=60)
+        indexer.start()
+        indexer.add("other", {"value": 1})
+        indexer.add_raw(body, count)
+        indexer.close()
+
+        lines, _ = client.requests[0]
+        self.assertEqual(len(lines), 2 + 2 * count)
+        self.assertEqual(lines[0], {"index": {"_index": "other"}})
+        self.assertEqual(indexer.stats["documents_indexed"], 1 + count)
+
+    def test_workers_are_configured(self):
+        """Workers come from a fork server and use the label cache size."""
+        pool = ParsePool(1, label_cache_size=7)
+        try:
+            size = pool._executor.submit(worker_label_cache_size).result(timeout=30)
+            start_method = pool._executor._mp_context.get_start_method()
+        finally:
+            pool.close()
+        self.assertEqual(size, 7)
+        self.assertEqual(start_method, "forkserver")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming Prometheus parser.
+"""
+
+import unittest
+
+from prometheus_stream import (
+    StreamingPrometheusParser,
+    get_parser_mode,
+    parse_labels,
+    parse_prometheus_stream,
+)
+from runtime_schema import MetricConfig, ParserMode, RuntimeConfig
+from test_snmp_fetch import parse_prometheus_metrics
+
+PAYLOAD = """# HELP ifHCInOctets The total number of octets received on the interface.
+# TYPE ifHCInOctets counter
+ifHCInOctets{ifDescr="eth0",ifIndex="1"} 1.5e+06
+ifHCInOctets{ifDescr="eth1",ifIndex="2"} 42
+# HELP ifOperStatus The current operational state of the interface.
+# TYPE ifOperStatus gauge
+ifOperStatus{ifDescr="eth0",ifIndex="1"} 1
+# HELP sysUpTime The time since the system was last re-initialized.
+# TYPE sysUpTime gauge
+sysUpTime 123456
+# TYPE requests_total counter
+requests_total 7
+# TYPE scrape_seconds histogram
+scrape_seconds_bucket{le="0.5"} 1
+scrape_seconds_bucket{le="+Inf"} 2
+scrape_seconds_count 2
+scrape_seconds_sum 0.7
+untyped_metric{path="/a"} 3
+"""
+
+
+def metric_configs(*paths):
+    """Build metric configurations for the given paths."""
+    return [MetricConfig(name=path, path=path) for path in paths]
+
+
+def strip_timestamps(metrics):
+    """Drop sample timestamps so that parser outputs can be compared."""
+    return {
+        name: [
+            {k: v for k, v in sample.items() if k != "timestamp"} for sample in samples
+        ]
+        for name, samples in metrics.items()
+    }
+
+
+class TestStreamingParser(unittest.TestCase):
+    """Test cases for the streaming parser."""
+
+    def test_matches_prometheus_client(self):
+        """Without an allow-list the output matches parse_prometheus_metrics."""
+        configs = metric_configs("sysUpTime")
+        expected = parse_prometheus_metrics(PAYLOAD, configs)
+
+        parser = StreamingPrometheusParser(None, ["sysUpTime"])
+        parser.feed(PAYLOAD)
+        self.assertEqual(strip_timestamps(parser.close()), strip_timestamps(expected))
+
+    def test_chunks_split_mid_line(self):
+        """Lines split across chunks are reassembled."""
+        chunks = [PAYLOAD[i : i + 5] for i in range(0, len(PAYLOAD), 5)]
+        whole = StreamingPrometheusParser(timestamp="now")
+        whole.feed(PAYLOAD)
+        self.assertEqual(self._parse_chunks(chunks), whole.close())
+
+    def test_allow_list_drops_families(self):
+        """Families outside the allow-list are skipped."""
+        metrics = parse_prometheus_stream(
+            [PAYLOAD], metric_configs("ifHCInOctets", "sysUpTime")
+        )
+
+        self.assertEqual(set(metrics), {"ifHCInOctets", "sysUpTime"})
+        self.assertEqual(metrics["ifHCInOctets"][0]["name"], "ifHCInOctets_total")
+        self.assertEqual(metrics["ifHCInOctets"][1]["value"], 42.0)
+        self.assertTrue(metrics["sysUpTime"][0]["is_configured"])
+
+    def test_allow_list_patterns(self):
+        """Paths with wildcards match several families."""
+        metrics = parse_prometheus_stream([PAYLOAD], metric_configs("if*"))
+        self.assertEqual(set(metrics), {"ifHCInOctets", "ifOperStatus"})
+        self.assertFalse(metrics["ifOperStatus"][0]["is_configured"])
+
+    def test_counter_and_histogram_names(self):
+        """Counter and histogram families are named as by prometheus_client."""
+        metrics = parse_prometheus_stream(
+            [PAYLOAD], metric_configs("requests", "scrape_seconds")
+        )
+        self.assertEqual([s["name"] for s in metrics["requests"]], ["requests_total"])
+        self.assertEqual(len(metrics["scrape_seconds"]), 4)
+
+    def test_counter_paths_with_total(self):
+        """Counter paths written with `_total` keep their family."""
+        payload = (
+            "# TYPE node_cpu_seconds_total counter\n"
+            'node_cpu_seconds_total{cpu="0"} 12.5\n'
+            "# TYPE ifHCInOctets counter\n"
+            "ifHCInOctets 42\n"
+            "# TYPE sysUpTime gauge\n"
+            "sysUpTime 1\n"
+        )
+        paths = ("node_cpu_seconds_total", "ifHCInOctets_total")
+        metrics = parse_prometheus_stream([payload], metric_configs(*paths))
+        self.assertEqual(set(metrics), {"node_cpu_seconds", "ifHCInOctets"})
+        self.assertEqual(
+            set(metrics),
+            set(parse_prometheus_metrics(payload, metric_configs(*paths)))
+            - {"sysUpTime"},
+        )
+
+    def test_label_escapes(self):
+        """Escaped quotes, backslashes and newlines in label values are decoded."""
+        labels = parse_labels(r'a="x \"y\" z",b="c\\d",c="line\nbreak",d=""')
+        self.assertEqual(
+            labels, {"a": 'x "y" z', "b": "c\\d", "c": "line\nbreak", "d": ""}
+        )
+
+    def _parse_chunks(self, chunks):
+        parser = StreamingPrometheusParser(timestamp="now")
+        for chunk in chunks:
+            parser.feed(chunk)
+        return parser.close()
+
+
+class TestParserMode(unittest.TestCase):
+    """Test cases for choosing the parser mode."""
+
+    def test_target_overrides_global(self):
+        """A target's parser setting overrides the global one."""
+        config = RuntimeConfig.model_validate(
+            {
+                "version": "1.0.0",
+                "global": {"parser": "streaming"},
+                "exporters": {"snmp": {"type": "snmp", "url": "http://localhost:9116"}},
+                "targets": {
+                    "a": {"exporter": "snmp", "interval": 60, "metrics": []},
+                    "b": {
+                        "exporter": "snmp",
+                        "interval": 60,
+                        "metrics": [],
+                        "parser": "full",
+                    },
+                },
+            }
+        )
+        self.assertEqual(
+            get_parser_mode(config, config.targets["a"]), ParserMode.STREAMING
+        )
+        self.assertEqual(get_parser_mode(config, config.targets["b"]), ParserMode.FULL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for the exporter response cache.
+"""
+
+import asyncio
+import unittest
+
+import pytest
+from aiohttp import web
+
+from exporter_client import ExporterClientPool
+from response_cache import CachedResponse, ResponseCache
+from test_exporter_client import METRICS_TEXT, make_config
+
+
+@pytest.mark.usefixtures("fake_clock")
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    """Test cases for ResponseCache."""
+
+    def setUp(self):
+        self.start = self.clock.now
+        self.cache = ResponseCache(ttl=10, clock=self.clock)
+        self.calls = []
+
+    async def fetch(self, validators, response=None):
+        self.calls.append(validators)
+        await asyncio.sleep(0)
+        return response or CachedResponse(f"body {len(self.calls)}")
+
+    async def not_modified(self, validators):
+        self.calls.append(validators)
+        return None
+
+    async def test_concurrent_requests_share_one_fetch(self):
+        """Identical requests in flight at the same time are fetched once."""
+        texts = await asyncio.gather(
+            *(self.cache.get("key", self.fetch) for _ in range(5))
+        )
+        self.assertEqual(texts, ["body 1"] * 5)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.cache.stats["coalesced"], 4)
+
+    async def test_ttl(self):
+        """A response is reused until it is `ttl` seconds old."""
+        self.assertEqual(await self.cache.get("key", self.fetch), "body 1")
+        self.clock.now = self.start + 9.9
+        self.assertEqual(await self.cache.get("key", self.fetch), "body 1")
+        self.assertEqual(await self.cache.get("other", self.fetch), "body 2")
+        self.clock.now = self.start + 10.0
+        self.assertEqual(await self.cache.get("key", self.fetch), "body 3")
+
+    async def test_not_modified_reuses_body(self):
+        """An expired response with validators is revalidated."""
+        first = CachedResponse("body", etag='"v1"', last_modified="yesterday")
+        await self.cache.get("key", lambda v: self.fetch(v, first))
+
+        self.clock.now = self.start + 20
+        text = await self.cache.get("key", self.not_modified)
+        self.assertEqual(text, "body")
+        self.assertEqual(
+            self.calls[-1],
+            {"If-None-Match": '"v1"', "If-Modified-Since": "yesterday"},
+        )
+        self.assertEqual(self.cache.stats["revalidated"], 1)
+
+        # The revalidated response is fresh again
+        self.clock.now = self.start + 25
+        self.assertEqual(await self.cache.get("key", self.fetch), "body")
+
+    async def test_errors_reach_all_waiters_and_are_not_cached(self):
+        """A failed fetch fails every waiting request, and the next one retries."""
+
+        async def failing(validators):
+            await asyncio.sleep(0)
+            raise ConnectionError("exporter down")
+
+        results = await asyncio.gather(
+            *(self.cache.get("key", failing) for _ in range(3)),
+            return_exceptions=True,
+        )
+        self.assertTrue(all(isinstance(r, ConnectionError) for r in results))
+        self.assertEqual(await self.cache.get("key", self.fetch), "body 1")
+
+    async def test_max_entries(self):
+        """The oldest responses are dropped over `max_entries`."""
+        self.cache.max_entries = 2
+        for key in ("a", "b", "c"):
+            await self.cache.get(key, self.fetch)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(await self.cache.get("a", self.fetch), "body 4")
+
+
+class TestExporterClientPoolCache(unittest.IsolatedAsyncioTestCase):
+    """Test cases for response sharing in the exporter client pool."""
+
+    async def asyncSetUp(self):
+        self.requests = []
+
+        async def handle(request):
+            self.requests.append(request)
+            if request.headers.get("If-None-Match") == '"v1"':
+                return web.Response(status=304)
+            await asyncio.sleep(0.05)
+            return web.Response(text=METRICS_TEXT, headers={"ETag": '"v1"'})
+
+        app = web.Application()
+        app.router.add_get("/snmp", handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+
+    async def test_targets_share_one_scrape(self):
+        """Concurrent scrapes of the same request reach the exporter once."""
+        config = make_config(self.url)
+        pool = ExporterClientPool(cache_ttl=60)
+        try:
+            texts = await asyncio.gather(
+                *(pool.fetch(config, "router") for _ in range(4))
+            )
+        finally:
+            await pool.close()
+        self.assertEqual(texts, [METRICS_TEXT] * 4)
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_expired_response_is_revalidated(self):
+        """An expired response is fetched with If-None-Match and reused on 304."""
+        config = make_config(self.url)
+        pool = ExporterClientPool(cache_ttl=60)
+        try:
+            await pool.fetch(config, "router")
+            pool.response_cache.ttl = 1e-9
+            text = await pool.fetch(config, "router")
+        finally:
+            await pool.close()
+        self.assertEqual(text, METRICS_TEXT)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.requests[1].headers["If-None-Match"], '"v1"')
+
+    async def test_disabled_by_default(self):
+        """Without a TTL every scrape is sent to the exporter."""
+        config = make_config(self.url)
+        pool = ExporterClientPool()
+        try:
+            await asyncio.gather(*(pool.fetch(config, "router") for _ in range(3)))
+        finally:
+            await pool.close()
+        self.assertEqual(len(self.requests), 3)
+        self.assertNotIn("If-None-Match", self.requests[0].headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the columnar sample batch.
+"""
+
+import unittest
+
+from elasticsearch_writer import build_metric_documents
+from prometheus_stream import StreamingPrometheusParser
+from sample_batch import SampleBatch
+from test_mapping_plan import TIMESTAMP, make_config
+from test_prometheus_stream import PAYLOAD
+
+
+class TestSampleBatch(unittest.TestCase):
+    """Test cases for SampleBatch."""
+
+    def test_add_and_iterate(self):
+        """Samples come back in the order they were added."""
+        batch = SampleBatch(TIMESTAMP)
+        batch.add("ifHCInOctets", "ifHCInOctets_total", {"ifIndex": "1"}, 10)
+        batch.add("ifHCInOctets", "ifHCInOctets_total", {"ifIndex": "2"}, 20)
+        batch.add("sysUpTime", "sysUpTime", {}, 5)
+
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(
+            list(batch),
+            [
+                ("ifHCInOctets", "ifHCInOctets_total", {"ifIndex": "1"}, 10.0),
+                ("ifHCInOctets", "ifHCInOctets_total", {"ifIndex": "2"}, 20.0),
+                ("sysUpTime", "sysUpTime", {}, 5.0),
+            ],
+        )
+        self.assertEqual(batch.families, ["ifHCInOctets", "sysUpTime"])
+
+    def test_label_sets_are_shared(self):
+        """Samples with the same labels refer to one label set."""
+        batch = SampleBatch(TIMESTAMP)
+        batch.add("ifHCInOctets", "ifHCInOctets_total", {"ifIndex": "1"}, 10)
+        batch.add("ifOperStatus", "ifOperStatus", {"ifIndex": "1"}, 1)
+
+        self.assertEqual(len(batch.label_sets), 1)
+        self.assertEqual(list(batch.label_set_ids), [0, 0])
+        self.assertEqual(batch.used_label_sets(), [{"ifIndex": "1"}])
+
+    def test_to_metrics(self):
+        """The dict layout groups samples by family and flags configured ones."""
+        batch = SampleBatch(TIMESTAMP)
+        batch.add("sysUpTime", "sysUpTime", {}, 5)
+        batch.add("ifMtu", "ifMtu", {"ifIndex": "1"}, 1500)
+
+        metrics = batch.to_metrics(["sysUpTime"])
+        self.assertEqual(
+            metrics["sysUpTime"],
+            [
+                {
+                    "name": "sysUpTime",
+                    "labels": {},
+                    "value": 5.0,
+                    "timestamp": TIMESTAMP,
+                    "is_configured": True,
+                }
+            ],
+        )
+        self.assertFalse(metrics["ifMtu"][0]["is_configured"])
+
+    def test_parser_reuses_label_sets(self):
+        """The streaming parser parses each distinct label text once."""
+        parser = StreamingPrometheusParser(timestamp=TIMESTAMP)
+        parser.feed(PAYLOAD)
+        batch = parser.close_batch()
+
+        # eth0 labels are used by both ifHCInOctets and ifOperStatus
+        eth0 = [labels for _, _, labels, _ in batch if labels.get("ifDescr") == "eth0"]
+        self.assertEqual(len(eth0), 2)
+        self.assertIs(eth0[0], eth0[1])
+
+    def test_documents_match_dict_layout(self):
+        """Documents built from a batch match those built from sample dicts."""
+        config = make_config()
+        target_config = config.targets["router"]
+        parser = StreamingPrometheusParser(timestamp=TIMESTAMP)
+        parser.feed(PAYLOAD)
+        batch = parser.close_batch()
+
+        from_batch = build_metric_documents(batch, target_config, {"a": 1})
+        from_dicts = build_metric_documents(batch.to_metrics(), target_config, {"a": 1})
+        self.assertEqual(from_batch, from_dicts)
+        self.assertEqual(from_batch[0]["metrics"]["host"]["uptime"], 123456.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
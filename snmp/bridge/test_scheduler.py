@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Tests for the scrape scheduler.
+"""
+
+import asyncio
+import unittest
+
+from runtime_schema import RuntimeConfig
+from scheduler import ScrapeScheduler, get_initial_offset
+
+
+def make_config(target_names, interval=1, concurrency=10):
+    """Build a runtime configuration with one target per name."""
+    return RuntimeConfig.model_validate(
+        {
+            "version": "1.0.0",
+            "global": {"concurrency": concurrency},
+            "exporters": {
+                "snmp_exporter": {"type": "snmp", "url": "http://localhost:9116"}
+            },
+            "targets": {
+                name: {
+                    "exporter": "snmp_exporter",
+                    "interval": interval,
+                    "metrics": [{"name": "sysUpTime", "path": "sysUpTime"}],
+                }
+                for name in target_names
+            },
+        }
+    )
+
+
+class TestInitialOffset(unittest.TestCase):
+    """Test cases for scrape start offsets."""
+
+    def test_offset_is_within_interval(self):
+        """Offsets fall inside the target interval."""
+        for i in range(100):
+            offset = get_initial_offset(f"device-{i}", 60)
+            self.assertGreaterEqual(offset, 0)
+            self.assertLess(offset, 60)
+
+    def test_offset_is_stable(self):
+        """The same target always gets the same offset."""
+        self.assertEqual(
+            get_initial_offset("router-1", 30), get_initial_offset("router-1", 30)
+        )
+
+    def test_offsets_are_spread(self):
+        """Different targets are spread across the interval."""
+        offsets = {int(get_initial_offset(f"device-{i}", 60)) for i in range(100)}
+        self.assertGreater(len(offsets), 30)
+
+
+class TestScrapeScheduler(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the scrape scheduler."""
+
+    async def test_concurrency_limit(self):
+        """No more scrapes run at once than the configured concurrency."""
+        config = make_config([f"device-{i}" for i in range(8)], concurrency=3)
+        running = 0
+        max_running = 0
+        scraped = set()
+
+        async def scrape(target_name):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.1)
+            scraped.add(target_name)
+            running -= 1
+
+        scheduler = ScrapeScheduler(config, scrape)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(1.5)
+        scheduler.stop()
+        await task
+
+        self.assertEqual(scraped, set(config.targets))
+        self.assertLessEqual(max_running, 3)
+
+    async def test_targets_use_own_interval(self):
+        """Each target is scraped on its own interval."""
+        config = make_config(["fast", "slow"], interval=1)
+        config.targets["slow"].interval = 10
+        counts = {"fast": 0, "slow": 0}
+
+        async def scrape(target_name):
+            counts[target_name] += 1
+
+        scheduler = ScrapeScheduler(config, scrape)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(2.5)
+        scheduler.stop()
+        await task
+
+        self.assertGreaterEqual(counts["fast"], 2)
+        self.assertLessEqual(counts["slow"], 1)
+
+    async def test_failed_scrape_keeps_schedule(self):
+        """A scrape that raises does not stop the target schedule."""
+        config = make_config(["flaky"])
+        calls = 0
+
+        async def scrape(target_name):
+            nonlocal calls
+            calls += 1
+            raise RuntimeError("exporter unavailable")
+
+        scheduler = ScrapeScheduler(config, scrape)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(2.5)
+        scheduler.stop()
+        await task
+
+        self.assertGreaterEqual(calls, 2)
+
+    async def test_deadline(self):
+        """With a scrape deadline each scrape gets the time it must finish by."""
+        config = make_config(["router"], interval=2)
+        config.global_.scrape_deadline = 0.5
+        deadlines = []
+
+        async def scrape(target_name, deadline):
+            deadlines.append(deadline - asyncio.get_running_loop().time())
+
+        scheduler = ScrapeScheduler(config, scrape)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(2.5)
+        scheduler.stop()
+        await task
+
+        self.assertGreaterEqual(len(deadlines), 1)
+        for remaining in deadlines:
+            self.assertAlmostEqual(remaining, 1.0, delta=0.1)
+
+    async def test_group_shares_offset(self):
+        """Targets in one group are first scraped at the same time."""
+        config = make_config(["router-system", "router-if"], interval=2)
+        started = {}
+
+        async def scrape(target_name):
+            started.setdefault(target_name, asyncio.get_running_loop().time())
+
+        scheduler = ScrapeScheduler(config, scrape, group=lambda name: "router")
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(2.2)
+        scheduler.stop()
+        await task
+
+        self.assertEqual(len(started), 2)
+        self.assertAlmostEqual(
+            started["router-system"], started["router-if"], delta=0.05
+        )
+
+    async def test_update_config(self):
+        """Targets are added and removed when the configuration changes."""
+        scheduler = ScrapeScheduler(make_config(["a", "b"]), self._noop)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.target_names, {"a", "b"})
+
+        scheduler.update_config(make_config(["b", "c"], concurrency=5))
+        self.assertEqual(scheduler.target_names, {"b", "c"})
+
+        scheduler.stop()
+        await task
+        self.assertEqual(scheduler.target_names, set())
+
+    async def _noop(self, target_name):
+        pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Tests for the scrape pipeline.
+"""
+
+import asyncio
+import time
+import unittest
+
+from exporter_client import ExporterClientPool
+from fake_exporter import FakeExporter
+from runtime_schema import HealthConfig, RuntimeConfig
+from scrape_pipeline import ScrapePipeline
+from target_health import BreakerState, HealthTracker
+
+
+class RecordingIndexer:
+    """Bulk indexer stand-in that keeps the queued documents."""
+
+    def __init__(self):
+        self.documents = []
+
+    def add_documents(self, index_name, docs):
+        docs = list(docs)
+        self.documents.extend((index_name, doc) for doc in docs)
+        return len(docs)
+
+
+class FailingIndexer:
+    """Bulk indexer stand-in that fails to queue documents."""
+
+    def add_documents(self, index_name, docs):
+        raise RuntimeError("queue is broken")
+
+
+class SlowWritePipeline(ScrapePipeline):
+    """Pipeline whose build stage, run in a thread, outlasts the deadline."""
+
+    def _write(self, *args):
+        time.sleep(0.3)
+        super()._write(*args)
+
+
+def make_probing_health():
+    """Build a health tracker whose `router` target is due a probe."""
+    health = HealthTracker(HealthConfig(failure_threshold=1, probe_interval=60))
+    health.record_failure("router")
+    health.get("router").next_probe = 0.0
+    assert health.allow("router")
+    return health
+
+
+def make_config(url, parser="full"):
+    """Build a runtime configuration with one target on a fake exporter."""
+    return RuntimeConfig.model_validate(
+        {
+            "version": "1.0.0",
+            "exporters": {"snmp_exporter": {"type": "snmp", "url": url}},
+            "targets": {
+                "router": {
+                    "exporter": "snmp_exporter",
+                    "module": "if_mib",
+                    "target": "10.0.0.1",
+                    "interval": 60,
+                    "layout": "series",
+                    "metrics": [
+                        {"name": "sysUpTime", "path": "sysUpTime"},
+                        {"name": "ifOperStatus", "path": "ifOperStatus"},
+                    ],
+                }
+            },
+            "global": {"parser": parser},
+        }
+    )
+
+
+class TestScrapePipeline(unittest.IsolatedAsyncioTestCase):
+    """Test cases for ScrapePipeline."""
+
+    def setUp(self):
+        self.exporter = FakeExporter(interfaces=4).start()
+        self.addCleanup(self.exporter.stop)
+
+    async def scrape(
+        self, config, target_name="router", health=None, deadline=None, indexer=None
+    ):
+        """Scrape a target once and return the trace and queued documents."""
+        exporter_pool = ExporterClientPool()
+        indexer = indexer or RecordingIndexer()
+        try:
+            pipeline = ScrapePipeline(config, exporter_pool, indexer, health=health)
+            trace = await pipeline.scrape(target_name, deadline)
+        finally:
+            await exporter_pool.close()
+        return trace, getattr(indexer, "documents", [])
+
+    async def test_parsers_queue_documents(self):
+        """Both parsers queue documents; only the full parser keeps every family."""
+        counts = {}
+        for parser in ("full", "streaming"):
+            trace, documents = await self.scrape(make_config(self.exporter.url, parser))
+            self.assertIsNone(trace.error)
+            self.assertGreater(trace.stage_seconds("fetch"), 0)
+            counts[parser] = len(documents)
+        # One document for sysUpTime and one per interface for ifOperStatus,
+        # plus the unconfigured snmp_scrape_duration_seconds with the full parser
+        self.assertEqual(counts, {"full": 6, "streaming": 5})
+        self.assertEqual(self.exporter.stats["requests"], 2)
+
+    async def test_errors_are_recorded_not_raised(self):
+        """A failing scrape returns a trace with the error."""
+        trace, documents = await self.scrape(
+            make_config(self.exporter.url), target_name="missing"
+        )
+        self.assertEqual(trace.error, "KeyError: 'missing'")
+        self.assertEqual(documents, [])
+
+    async def test_health_is_recorded(self):
+        """Fetch latencies and failures are reported to the health tracker."""
+        health = HealthTracker()
+        await self.scrape(make_config(self.exporter.url), health=health)
+        self.assertEqual(len(health.get("router").latencies), 1)
+
+        # Nothing listens on port 1, so the connection is refused
+        trace, _ = await self.scrape(make_config("http://127.0.0.1:1"), health=health)
+        self.assertIsNotNone(trace.error)
+        self.assertEqual(health.get("router").consecutive_failures, 1)
+
+    async def test_cache_hits_are_not_latency_samples(self):
+        """Responses reused from the cache leave the timeout and hedge delay alone."""
+        self.exporter.delay = 0.2
+        config = make_config(self.exporter.url)
+        health = HealthTracker(HealthConfig(min_samples=1))
+        exporter_pool = ExporterClientPool(cache_ttl=60)
+        try:
+            pipeline = ScrapePipeline(
+                config, exporter_pool, RecordingIndexer(), health=health
+            )
+            trace = await pipeline.scrape("router")
+            self.assertTrue(trace.attributes["round_trip"])
+            timeout = health.timeout("router", 10)
+            hedge_delay = health.hedge_delay("router")
+            for _ in range(5):
+                trace = await pipeline.scrape("router")
+                self.assertFalse(trace.attributes["round_trip"])
+        finally:
+            await exporter_pool.close()
+        self.assertEqual(self.exporter.stats["requests"], 1)
+        self.assertEqual(len(health.get("router").latencies), 1)
+        self.assertEqual(health.timeout("router", 10), timeout)
+        self.assertEqual(health.hedge_delay("router"), hedge_delay)
+        self.assertGreaterEqual(hedge_delay, 0.2)
+
+    async def test_passed_deadline_skips_scrape(self):
+        """A scrape whose deadline has passed is late without a request."""
+        now = asyncio.get_running_loop().time()
+        trace, documents = await self.scrape(
+            make_config(self.exporter.url), deadline=now - 1
+        )
+        self.assertTrue(trace.attributes["late"])
+        self.assertEqual(self.exporter.stats["requests"], 0)
+        self.assertEqual(documents, [])
+
+    async def test_deadline_cancels_slow_scrape(self):
+        """A scrape still running at its deadline is cancelled as late."""
+        self.exporter.delay = 1.0
+        health = HealthTracker()
+        now = asyncio.get_running_loop().time()
+        trace, _ = await self.scrape(
+            make_config(self.exporter.url), health=health, deadline=now + 0.1
+        )
+        self.assertEqual(trace.error, "ScrapeLate: cancelled at its deadline")
+        self.assertLess(trace.duration, 0.5)
+        # No response before the deadline is held against the target's health
+        self.assertEqual(health.get("router").consecutive_failures, 1)
+
+    async def test_late_thread_does_not_queue(self):
+        """A write thread still running at the deadline queues nothing."""
+        exporter_pool = ExporterClientPool()
+        indexer = RecordingIndexer()
+        try:
+            pipeline = SlowWritePipeline(
+                make_config(self.exporter.url), exporter_pool, indexer
+            )
+            deadline = asyncio.get_running_loop().time() + 0.15
+            trace = await pipeline.scrape("router", deadline)
+        finally:
+            await exporter_pool.close()
+        self.assertEqual(trace.error, "ScrapeLate: cancelled at its deadline")
+        # Let the abandoned thread finish
+        await asyncio.sleep(0.5)
+        self.assertEqual(indexer.documents, [])
+
+    async def test_skipped_scrape_is_not_a_failure(self):
+        """A scrape skipped before its fetch does not count against the target."""
+        health = HealthTracker()
+        now = asyncio.get_running_loop().time()
+        await self.scrape(make_config(self.exporter.url), health=health, deadline=now)
+        self.assertEqual(health.get("router").consecutive_failures, 0)
+
+    async def test_late_probe_is_resolved(self):
+        """A probe skipped at its deadline reopens the breaker for the next probe."""
+        health = make_probing_health()
+        now = asyncio.get_running_loop().time()
+        trace, _ = await self.scrape(
+            make_config(self.exporter.url), health=health, deadline=now - 1
+        )
+        self.assertTrue(trace.attributes["late"])
+        self.assertEqual(health.get("router").state, BreakerState.OPEN)
+
+    async def test_probe_failing_after_fetch_is_resolved(self):
+        """A probe failing outside the fetch still reopens the breaker."""
+        health = make_probing_health()
+        trace, _ = await self.scrape(
+            make_config(self.exporter.url), health=health, indexer=FailingIndexer()
+        )
+        self.assertEqual(trace.error, "RuntimeError: queue is broken")
+        self.assertEqual(health.get("router").state, BreakerState.OPEN)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for the self-monitoring metrics.
+"""
+
+import unittest
+
+from prometheus_client import generate_latest
+
+from bulk_indexer import BulkIndexer
+from response_cache import ResponseCache
+from self_metrics import BridgeMetrics, TimedParser
+from target_health import HealthTracker
+from test_bulk_indexer import FakeElasticsearch
+
+
+class RecordingParser:
+    """Parser stand-in that keeps the text it is fed."""
+
+    def __init__(self):
+        self.text = ""
+
+    def feed(self, text):
+        self.text += text
+
+
+class TestBridgeMetrics(unittest.TestCase):
+    """Test cases for BridgeMetrics."""
+
+    def setUp(self):
+        self.metrics = BridgeMetrics()
+
+    def value(self, name, **labels):
+        return self.metrics.registry.get_sample_value(name, labels or None)
+
+    def test_target_metrics(self):
+        """Per-target metrics are labelled with the target and exporter."""
+        target = self.metrics.target("router", "snmp_exporter")
+        self.assertIs(self.metrics.target("router", "snmp_exporter"), target)
+        target.scrape_seconds.observe(0.2)
+        target.fetched_bytes.inc(1000)
+        target.samples_parsed.inc(50)
+
+        labels = {"target": "router", "exporter": "snmp_exporter"}
+        self.assertEqual(
+            self.value("snmp_bridge_scrape_duration_seconds_count", **labels), 1
+        )
+        self.assertEqual(self.value("snmp_bridge_fetched_bytes_total", **labels), 1000)
+        self.assertEqual(self.value("snmp_bridge_samples_parsed_total", **labels), 50)
+
+    def test_retain(self):
+        """Removed targets no longer appear."""
+        self.metrics.target("router", "snmp_exporter").scrape_errors.inc()
+        self.metrics.target("switch", "snmp_exporter").scrape_errors.inc()
+        self.metrics.retain([("switch", "snmp_exporter")])
+
+        output = generate_latest(self.metrics.registry).decode()
+        self.assertNotIn('target="router"', output)
+        self.assertIn('target="switch"', output)
+
+    def test_bulk_indexer(self):
+        """Bulk indexer statistics and flush times are exposed."""
+        indexer = BulkIndexer(FakeElasticsearch(), flush_interval=60)
+        self.metrics.watch_bulk_indexer(indexer)
+        indexer.start()
+        indexer.add_documents("metrics", [{"value": i} for i in range(3)])
+        indexer.close()
+
+        self.assertEqual(self.value("snmp_bridge_bulk_documents_indexed_total"), 3)
+        self.assertEqual(self.value("snmp_bridge_bulk_queue_depth"), 0)
+        self.assertEqual(self.value("snmp_bridge_spool_depth_documents"), 0)
+        self.assertEqual(self.value("snmp_bridge_bulk_flush_duration_seconds_count"), 1)
+
+    def test_response_cache(self):
+        """Response cache counts are exposed by result."""
+        cache = ResponseCache(ttl=10)
+        cache.stats["hits"] = 4
+        self.metrics.watch_response_cache(cache)
+        self.assertEqual(
+            self.value("snmp_bridge_response_cache_requests_total", result="hits"), 4
+        )
+
+    def test_target_health(self):
+        """Breaker state, failures and timeouts are exposed per target."""
+        tracker = HealthTracker()
+        tracker.timeout("router", 30)
+        for _ in range(3):
+            tracker.record_failure("router")
+        self.metrics.watch_target_health(tracker)
+
+        labels = {"target": "router"}
+        self.assertEqual(
+            self.value("snmp_bridge_target_breaker_state", state="open", **labels), 1
+        )
+        self.assertEqual(
+            self.value("snmp_bridge_target_breaker_state", state="closed", **labels), 0
+        )
+        self.assertEqual(
+            self.value("snmp_bridge_target_consecutive_failures", **labels), 3
+        )
+        self.assertEqual(
+            self.value("snmp_bridge_target_breaker_trips_total", **labels), 1
+        )
+        self.assertEqual(self.value("snmp_bridge_target_timeout_seconds", **labels), 30)
+
+    def test_timed_parser(self):
+        """The wrapped parser gets every chunk and its time is added up."""
+        parser = RecordingParser()
+        timed = TimedParser(parser)
+        timed.feed("a ")
+        timed.feed("1\n")
+        self.assertEqual(parser.text, "a 1\n")
+        self.assertGreater(timed.seconds, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
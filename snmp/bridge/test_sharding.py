@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Tests for sharding targets between bridge instances.
+"""
+
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+import pytest
+from elasticsearch import NotFoundError
+
+from scheduler import ScrapeScheduler
+from sharding import (
+    ElasticsearchLeaseRegistry,
+    HashRing,
+    InMemoryLeaseRegistry,
+    TargetSharder,
+    get_instance_id,
+)
+from test_scheduler import make_config
+
+TARGETS = [f"device-{i}" for i in range(2000)]
+
+
+def assignment(ring):
+    """Map every target to its owner on a ring."""
+    return {target: ring.owner(target) for target in TARGETS}
+
+
+class TestHashRing(unittest.TestCase):
+    """Test cases for HashRing."""
+
+    def test_targets_are_spread_evenly(self):
+        """Each member gets a similar share of the targets."""
+        ring = HashRing(["a", "b", "c", "d"])
+        counts = {}
+        for owner in assignment(ring).values():
+            counts[owner] = counts.get(owner, 0) + 1
+        self.assertEqual(set(counts), {"a", "b", "c", "d"})
+        for count in counts.values():
+            self.assertLess(abs(count - 500), 150)
+
+    def test_joining_moves_only_its_share(self):
+        """A new member takes about 1/n of the targets, all from other members."""
+        before = assignment(HashRing(["a", "b", "c", "d"]))
+        after = assignment(HashRing(["a", "b", "c", "d", "e"]))
+        moved = [t for t in TARGETS if before[t] != after[t]]
+        self.assertTrue(all(after[t] == "e" for t in moved))
+        self.assertLess(abs(len(moved) - 400), 150)
+
+    def test_leaving_moves_only_its_targets(self):
+        """Only the targets of a departed member change owner."""
+        before = assignment(HashRing(["a", "b", "c"]))
+        after = assignment(HashRing(["a", "c"]))
+        moved = [t for t in TARGETS if before[t] != after[t]]
+        self.assertTrue(all(before[t] == "b" for t in moved))
+
+    def test_empty_ring(self):
+        """An empty ring has no owners."""
+        self.assertIsNone(HashRing().owner("device-1"))
+
+
+@pytest.mark.usefixtures("fake_clock")
+class TestTargetSharder(unittest.TestCase):
+    """Test cases for TargetSharder."""
+
+    def setUp(self):
+        self.registry = InMemoryLeaseRegistry(clock=self.clock)
+
+    def make_sharder(self, instance_id):
+        return TargetSharder(self.registry, instance_id, lease_ttl=30)
+
+    def test_instances_split_targets(self):
+        """Every target is owned by exactly one live instance."""
+        sharders = [self.make_sharder(name) for name in ("a", "b", "c")]
+        for sharder in sharders:
+            sharder.refresh()
+        # Earlier instances see the later ones on their next renewal
+        self.assertEqual([s.refresh() for s in sharders], [True, True, False])
+
+        for target in TARGETS:
+            owners = [s.instance_id for s in sharders if s.owns(target)]
+            self.assertEqual(len(owners), 1)
+
+    def test_expired_lease_hands_over_targets(self):
+        """Targets of an instance that stops renewing are taken over."""
+        a, b = self.make_sharder("a"), self.make_sharder("b")
+        a.refresh()
+        b.refresh()
+        a.refresh()
+        b_targets = [t for t in TARGETS if b.owns(t)]
+        self.assertTrue(b_targets)
+        self.assertFalse(any(a.owns(t) for t in b_targets))
+
+        self.clock.now += 31
+        self.assertTrue(a.refresh())
+        self.assertTrue(all(a.owns(t) for t in TARGETS))
+
+    def test_release(self):
+        """A released lease is gone at once."""
+        a, b = self.make_sharder("a"), self.make_sharder("b")
+        a.refresh()
+        b.refresh()
+        b.release()
+        self.assertEqual(self.registry.live_instances(), ["a"])
+
+    def test_instance_id_from_environment(self):
+        """BRIDGE_INSTANCE_ID overrides the host name."""
+        with mock.patch.dict(os.environ, {"BRIDGE_INSTANCE_ID": "bridge-7"}):
+            self.assertEqual(get_instance_id(), "bridge-7")
+
+
+class RecordingIndices:
+    """Indices API stand-in that keeps the mappings of created indices."""
+
+    def __init__(self):
+        self.mappings = {}
+
+    def exists(self, index):
+        return index in self.mappings
+
+    def create(self, index, mappings):
+        self.mappings[index] = mappings
+
+
+class RecordingElasticsearch:
+    """Elasticsearch stand-in that keeps lease documents in a dict."""
+
+    def __init__(self):
+        self.documents = {}
+        self.indices = RecordingIndices()
+
+    def index(self, index, id, document, **kwargs):
+        self.documents[id] = document
+
+    def search(self, index, query, **kwargs):
+        if not self.documents:
+            raise NotFoundError("index_not_found", None, {})
+        after = query["range"]["expires_at"]["gt"]
+        hits = [
+            {"_id": doc_id}
+            for doc_id, document in self.documents.items()
+            if document["expires_at"] > after
+        ]
+        return {"hits": {"hits": hits}}
+
+    def delete(self, index, id, **kwargs):
+        if id not in self.documents:
+            raise NotFoundError("not_found", None, {})
+        del self.documents[id]
+
+
+@pytest.mark.usefixtures("fake_clock")
+class TestElasticsearchLeaseRegistry(unittest.TestCase):
+    """Test cases for ElasticsearchLeaseRegistry."""
+
+    def test_leases(self):
+        """Leases are stored per instance and expire after their TTL."""
+        clock = self.clock
+        client = RecordingElasticsearch()
+        registry = ElasticsearchLeaseRegistry(client, clock=clock)
+        self.assertEqual(registry.live_instances(), [])
+
+        registry.renew("a", 30)
+        clock.now += 10
+        registry.renew("b", 30)
+        self.assertEqual(sorted(registry.live_instances()), ["a", "b"])
+        clock.now += 25
+        self.assertEqual(registry.live_instances(), ["b"])
+
+        registry.release("b")
+        registry.release("b")
+        self.assertEqual(registry.live_instances(), [])
+
+    def test_lease_times_are_epoch_millis(self):
+        """The index maps lease times as dates and they are stored as integers."""
+        clock = self.clock
+        client = RecordingElasticsearch()
+        registry = ElasticsearchLeaseRegistry(client, clock=clock)
+        registry.renew("a", 30)
+
+        mappings = client.indices.mappings[registry.index_name]
+        expires_at = mappings["properties"]["expires_at"]
+        self.assertEqual(expires_at, {"type": "date", "format": "epoch_millis"})
+        document = client.documents["a"]
+        self.assertIsInstance(document["expires_at"], int)
+        self.assertEqual(document["expires_at"] - document["renewed_at"], 30000)
+
+
+@pytest.mark.usefixtures("fake_clock")
+class TestShardedScheduler(unittest.IsolatedAsyncioTestCase):
+    """Test cases for scheduling only owned targets."""
+
+    async def test_rebalance(self):
+        """Only owned targets run, and rebalancing follows the ring."""
+        clock = self.clock
+        registry = InMemoryLeaseRegistry(clock=clock)
+        a = TargetSharder(registry, "a")
+        b = TargetSharder(registry, "b")
+        b.refresh()
+        a.refresh()
+
+        names = [f"device-{i}" for i in range(20)]
+
+        async def noop(target_name):
+            pass
+
+        scheduler = ScrapeScheduler(make_config(names), noop, owns=a.owns)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0)
+        owned = {name for name in names if a.owns(name)}
+        self.assertEqual(scheduler.target_names, owned)
+        self.assertLess(len(owned), len(names))
+
+        b.release()
+        self.assertTrue(a.refresh())
+        scheduler.rebalance()
+        self.assertEqual(scheduler.target_names, set(names))
+
+        scheduler.stop()
+        await task
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -68,17 +68,20 @@ def build_exporter_url(exporter_url: str, target_config: TargetConfig) -> str:
 
 
 def fetch_metrics(config: RuntimeConfig, target_name: str) -> Dict[str, Any]:
-    """Fetch metrics from the specified target."""
+    """
+    Fetch metrics from the specified target.
+
+    Raises ValueError for unknown targets or exporters, and
+    requests.RequestException if the exporter cannot be reached.
+    """
     if target_name not in config.targets:
-        logger.error(f"Target '{target_name}' not found in configuration")
-        sys.exit(1)
+        raise ValueError(f"Target '{target_name}' not found in configuration")
 
     target_config = config.targets[target_name]
     exporter_name = target_config.exporter
 
     if exporter_name not in config.exporters:
-        logger.error(f"Exporter '{exporter_name}' not found in configuration")
-        sys.exit(1)
+        raise ValueError(f"Exporter '{exporter_name}' not found in configuration")
 
     exporter_config = config.exporters[exporter_name]
 
@@ -142,7 +145,7 @@ def fetch_metrics(config: RuntimeConfig, target_name: str) -> Dict[str, Any]:
         return metrics
     except requests.RequestException as e:
         logger.error(f"Error fetching metrics: {e}")
-        sys.exit(1)
+        raise
 
 
 def parse_prometheus_metrics(content: str, metric_configs: List) -> Dict[str, Any]:
@@ -292,7 +295,11 @@ def main():
         print(f"{key}: {value}")
     print()
 
-    metrics = fetch_metrics(config, args.target)
+    try:
+        metrics = fetch_metrics(config, args.target)
+    except (ValueError, requests.RequestException) as e:
+        logger.error(f"Failed to fetch metrics: {e}")
+        sys.exit(1)
 
     print(format_metrics_for_display(metrics))
 
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Tests for direct SNMP polling.
+
+The polling tests run against a local snmpsim simulator, started with a
+small data file, and are skipped if pysnmp or snmpsim is not installed.
+"""
+
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import unittest
+
+from exporter_client import ExporterClientPool
+from runtime_schema import RuntimeConfig
+from sample_batch import SampleBatch
+from scrape_pipeline import ScrapePipeline
+from snmp_poller import PollColumn, SnmpPollError, SnmpPoller, bulk_cmd, split_address
+from test_scrape_pipeline import RecordingIndexer
+
+try:
+    from pysnmp.proto.rfc1902 import Counter32, Integer, OctetString
+    from pysnmp.proto.rfc1905 import EndOfMibView
+except ImportError:
+    pass
+
+SNMPSIM = shutil.which("snmpsim-command-responder")
+
+# sysUpTime, and ifDescr, ifOperStatus and ifInOctets for two interfaces
+SNMPREC = """\
+1.3.6.1.2.1.1.3.0|67|123456
+1.3.6.1.2.1.2.2.1.2.1|4|eth0
+1.3.6.1.2.1.2.2.1.2.2|4|eth1
+1.3.6.1.2.1.2.2.1.8.1|2|1
+1.3.6.1.2.1.2.2.1.8.2|2|2
+1.3.6.1.2.1.2.2.1.10.1|65|1000
+1.3.6.1.2.1.2.2.1.10.2|65|2000
+"""
+
+METRICS = [
+    {"name": "sysUpTime", "path": "sysUpTime", "oid": "1.3.6.1.2.1.1.3"},
+    {
+        "name": "ifOperStatus",
+        "path": "ifOperStatus",
+        "oid": "1.3.6.1.2.1.2.2.1.8",
+        "index_label": "ifIndex",
+    },
+    {
+        "name": "ifInOctets",
+        "path": "ifInOctets",
+        "oid": "1.3.6.1.2.1.2.2.1.10",
+        "index_label": "ifIndex",
+    },
+    # Strings are not numbers and are skipped
+    {"name": "ifDescr", "path": "ifDescr", "oid": "1.3.6.1.2.1.2.2.1.2"},
+]
+
+
+def make_config(address, community="router", max_repetitions=1):
+    """Build a runtime configuration with one target polled directly."""
+    return RuntimeConfig.model_validate(
+        {
+            "version": "1.0.0",
+            "exporters": {
+                "snmp_exporter": {"type": "snmp", "url": "http://127.0.0.1:1"}
+            },
+            "targets": {
+                "router": {
+                    "exporter": "snmp_exporter",
+                    "target": address,
+                    "interval": 60,
+                    "timeout": 2,
+                    "layout": "series",
+                    "poller": {
+                        "community": community,
+                        "max_repetitions": max_repetitions,
+                        "retries": 0,
+                    },
+                    "metrics": METRICS,
+                }
+            },
+        }
+    )
+
+
+def samples(batch):
+    """Samples of a batch as sorted (name, labels, value) tuples."""
+    return sorted(
+        (name, tuple(labels.items()), value) for _, name, labels, value in batch
+    )
+
+
+class TestSplitAddress(unittest.TestCase):
+    """Test cases for target addresses."""
+
+    def test_port(self):
+        self.assertEqual(split_address("127.0.0.1:1611"), ("127.0.0.1", 1611))
+        self.assertEqual(split_address("router.example"), ("router.example", 161))
+
+
+@unittest.skipIf(bulk_cmd is None, "pysnmp is not installed")
+class TestCollect(unittest.TestCase):
+    """Test cases for adding GETBULK rows to a batch."""
+
+    def test_rows_until_end_of_subtree(self):
+        """Rows are added per subtree until it ends or the MIB view ends."""
+        status = PollColumn("ifOperStatus", (1, 2, 8), "ifIndex")
+        octets = PollColumn("ifInOctets", (1, 2, 10), "ifIndex")
+        batch = SampleBatch("2026-01-01T00:00:00+00:00")
+        var_binds = [
+            ((1, 2, 8, 1), Integer(1)),
+            ((1, 2, 10, 1), Counter32(1000)),
+            # ifOperStatus leaves its subtree, ifInOctets continues
+            ((1, 2, 10, 1), Counter32(1000)),
+            ((1, 2, 10, 2), Counter32(2000)),
+            ((1, 2, 10, 2), Counter32(2000)),
+            ((1, 2, 10, 2), EndOfMibView()),
+        ]
+        pending = SnmpPoller._collect(
+            batch, [(status, status.oid), (octets, octets.oid)], var_binds
+        )
+        self.assertEqual(pending, [])
+        self.assertEqual(
+            samples(batch),
+            [
+                ("ifInOctets", (("ifIndex", "1"),), 1000.0),
+                ("ifInOctets", (("ifIndex", "2"),), 2000.0),
+                ("ifOperStatus", (("ifIndex", "1"),), 1.0),
+            ],
+        )
+
+    def test_continues_after_last_row(self):
+        """A subtree that may have more rows is continued from its last OID."""
+        column = PollColumn("ifDescr", (1, 2, 2), "index")
+        batch = SampleBatch()
+        pending = SnmpPoller._collect(
+            batch, [(column, column.oid)], [((1, 2, 2, 1), OctetString("eth0"))]
+        )
+        self.assertEqual(pending, [(column, (1, 2, 2, 1))])
+        self.assertEqual(len(batch), 0)
+
+
+@unittest.skipIf(bulk_cmd is None or SNMPSIM is None, "pysnmp or snmpsim missing")
+class TestSnmpsim(unittest.IsolatedAsyncioTestCase):
+    """Test cases for polling a simulated device."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp()
+        cache_dir = os.path.join(cls.data_dir, "cache")
+        os.mkdir(cache_dir)
+        with open(os.path.join(cls.data_dir, "router.snmprec"), "w") as f:
+            f.write(SNMPREC)
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            cls.address = "127.0.0.1:%d" % sock.getsockname()[1]
+        command = [
+            SNMPSIM,
+            f"--data-dir={cls.data_dir}",
+            f"--cache-dir={cache_dir}",
+            f"--agent-udpv4-endpoint={cls.address}",
+        ]
+        if os.geteuid() == 0:
+            # snmpsim refuses to run as root
+            os.chmod(cls.data_dir, 0o777)
+            os.chmod(cache_dir, 0o777)
+            command += ["--process-user=nobody", "--process-group=nogroup"]
+        cls.simulator = subprocess.Popen(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if not cls._wait_for_simulator():
+            cls.tearDownClass()
+            raise unittest.SkipTest("snmpsim did not start")
+
+    @classmethod
+    def _wait_for_simulator(cls):
+        """Poll the simulator until it answers, for up to 10 seconds."""
+        target_config = make_config(cls.address).targets["router"]
+
+        async def wait():
+            poller = SnmpPoller()
+            try:
+                deadline = time.monotonic() + 10
+                while time.monotonic() < deadline and cls.simulator.poll() is None:
+                    try:
+                        await poller.poll(target_config, 0.5)
+                        return True
+                    except (SnmpPollError, TimeoutError):
+                        pass
+                return False
+            finally:
+                poller.close()
+
+        return asyncio.run(wait())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.simulator.terminate()
+        cls.simulator.wait()
+        shutil.rmtree(cls.data_dir, ignore_errors=True)
+
+    async def asyncSetUp(self):
+        self.poller = SnmpPoller()
+
+    async def asyncTearDown(self):
+        self.poller.close()
+
+    async def test_walks_scalars_and_tables(self):
+        """Scalars have no labels and table rows are labelled by their index."""
+        # One row per request, so the walk takes several requests
+        config = make_config(self.address, max_repetitions=1)
+        batch = await self.poller.poll(config.targets["router"], 2)
+        self.assertEqual(
+            samples(batch),
+            [
+                ("ifInOctets", (("ifIndex", "1"),), 1000.0),
+                ("ifInOctets", (("ifIndex", "2"),), 2000.0),
+                ("ifOperStatus", (("ifIndex", "1"),), 1.0),
+                ("ifOperStatus", (("ifIndex", "2"),), 2.0),
+                ("sysUpTime", (), 123456.0),
+            ],
+        )
+
+    async def test_wrong_community_times_out(self):
+        """A device that does not answer fails the poll."""
+        config = make_config(self.address, community="wrong")
+        with self.assertRaises((SnmpPollError, TimeoutError)):
+            await self.poller.poll(config.targets["router"], 0.5)
+
+    async def test_pipeline_skips_exporter(self):
+        """The pipeline writes documents from the poller without the exporter."""
+        config = make_config(self.address, max_repetitions=25)
+        exporter_pool = ExporterClientPool()
+        indexer = RecordingIndexer()
+        try:
+            pipeline = ScrapePipeline(
+                config, exporter_pool, indexer, snmp_poller=self.poller
+            )
+            trace = await pipeline.scrape("router")
+        finally:
+            await exporter_pool.close()
+        self.assertIsNone(trace.error)
+        # One document for sysUpTime and one per interface for both tables
+        self.assertEqual(len(indexer.documents), 3)
+        self.assertEqual(
+            indexer.documents[1][1]["metrics"],
+            {"ifOperStatus": 1.0, "ifInOctets": 1000.0},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Tests for the disk spool.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from elasticsearch import ConnectionError as ESConnectionError
+
+from bulk_indexer import BulkIndexer
+from bulk_retry import RetryPolicy
+from spool import DiskSpool
+from test_bulk_indexer import FakeElasticsearch
+from test_bulk_retry import make_body
+
+
+class TestDiskSpool(unittest.TestCase):
+    """Test cases for DiskSpool."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def segment_files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_bodies_come_back_oldest_first(self):
+        """Bodies are read in the order they were added, across segments."""
+        spool = DiskSpool(self.directory, segment_bytes=100)
+        for i in range(5):
+            spool.append(b"body-%d\n" % i, i + 1)
+        self.assertEqual(len(spool), 5)
+        self.assertEqual(spool.depth_documents, 15)
+
+        self.assertEqual(spool.peek(), (b"body-0\n", 1))
+        popped = [spool.pop() for _ in range(5)]
+        self.assertEqual(popped, [(b"body-%d\n" % i, i + 1) for i in range(5)])
+        self.assertIsNone(spool.pop())
+        self.assertEqual(spool.depth_bytes, 0)
+        self.assertEqual(self.segment_files(), [])
+
+    def test_new_segments(self):
+        """A new segment is started once the current one is full."""
+        spool = DiskSpool(self.directory, segment_bytes=80)
+        for _ in range(4):
+            spool.append(b"x" * 30, 1)
+        # Records take 38 bytes with their header, so two fit in a segment
+        self.assertEqual(len(self.segment_files()), 2)
+
+    def test_reopen(self):
+        """Spooled bodies survive a restart; a partly written one is dropped."""
+        spool = DiskSpool(self.directory)
+        spool.append(b"first\n", 1)
+        spool.append(b"second\n", 2)
+        spool.close()
+
+        path = os.path.join(self.directory, self.segment_files()[0])
+        with open(path, "ab") as f:
+            f.write(b"\x10\x00\x00\x00\x01\x00\x00\x00part")
+
+        spool = DiskSpool(self.directory)
+        self.assertEqual(spool.depth_documents, 3)
+        self.assertEqual(spool.pop(), (b"first\n", 1))
+        spool.append(b"third\n", 1)
+        self.assertEqual(spool.pop(), (b"second\n", 2))
+        self.assertEqual(spool.pop(), (b"third\n", 1))
+
+    def test_reopen_after_partial_replay(self):
+        """Bodies popped before a restart are not read again after it."""
+        spool = DiskSpool(self.directory)
+        for i in range(4):
+            spool.append(b"body-%d\n" % i, 1)
+        self.assertEqual(spool.pop(), (b"body-0\n", 1))
+        self.assertEqual(spool.pop(), (b"body-1\n", 1))
+        # Peeked but not popped, as while the body is being indexed
+        self.assertEqual(spool.peek(), (b"body-2\n", 1))
+        spool.close()
+
+        spool = DiskSpool(self.directory)
+        self.assertEqual(spool.depth_documents, 2)
+        self.assertEqual(spool.pop(), (b"body-2\n", 1))
+        self.assertEqual(spool.pop(), (b"body-3\n", 1))
+        self.assertIsNone(spool.pop())
+        self.assertEqual(self.segment_files(), [])
+
+    def test_invalid_checkpoint_is_ignored(self):
+        """A checkpoint that is not at a record boundary replays the segment."""
+        spool = DiskSpool(self.directory)
+        spool.append(b"first\n", 1)
+        spool.append(b"second\n", 1)
+        spool.pop()
+        spool.close()
+
+        checkpoint = [f for f in self.segment_files() if f.endswith(".offset")][0]
+        with open(os.path.join(self.directory, checkpoint), "r+b") as f:
+            f.write(b"\x03")
+
+        spool = DiskSpool(self.directory)
+        self.assertEqual(spool.pop(), (b"first\n", 1))
+
+    def test_oldest_segments_are_evicted(self):
+        """Above max_bytes the oldest segments are dropped."""
+        spool = DiskSpool(self.directory, max_bytes=100, segment_bytes=30)
+        for i in range(6):
+            spool.append(b"%d" % i * 30, 1)
+
+        self.assertLessEqual(spool.depth_bytes, 100)
+        self.assertEqual(spool.stats["documents_evicted"], 4)
+        self.assertEqual(spool.pop(), (b"4" * 30, 1))
+
+
+class UnavailableElasticsearch(FakeElasticsearch):
+    """Elasticsearch stand-in that refuses connections while it is down."""
+
+    def __init__(self):
+        super().__init__()
+        self.down = True
+
+    def bulk(self, operations, **kwargs):
+        if self.down:
+            raise ESConnectionError("connection refused")
+        return super().bulk(operations, **kwargs)
+
+
+class FullDiskSpool(DiskSpool):
+    """Disk spool whose disk is full."""
+
+    def append(self, body, doc_count):
+        raise OSError(28, "No space left on device")
+
+
+class TestBulkIndexerSpool(unittest.TestCase):
+    """Test cases for spooling in the bulk indexer."""
+
+    def test_spooled_documents_are_replayed(self):
+        """Documents are spooled while Elasticsearch is down and replayed later."""
+        with tempfile.TemporaryDirectory() as directory:
+            client = UnavailableElasticsearch()
+            indexer = BulkIndexer(
+                client,
+                max_documents=2,
+                flush_interval=60,
+                retry_policy=RetryPolicy(retries=0, retry_interval=0.05),
+                spool=DiskSpool(directory),
+            )
+            indexer.rate_limiter.max_interval = 0.01
+            indexer.start()
+            indexer.add_raw(make_body(2), 2)
+            indexer.add_raw(make_body(3), 3)
+
+            deadline = time.monotonic() + 5
+            while indexer.spool_depth < 5 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(indexer.spool_depth, 5)
+            self.assertEqual(indexer.stats["documents_failed"], 0)
+
+            client.down = False
+            deadline = time.monotonic() + 5
+            while indexer.spool_depth and time.monotonic() < deadline:
+                time.sleep(0.01)
+            indexer.close()
+
+            self.assertEqual(indexer.spool_depth, 0)
+            self.assertEqual(indexer.stats["documents_indexed"], 5)
+            self.assertEqual(indexer.stats["documents_replayed"], 5)
+            values = [
+                doc["value"] for lines, _ in client.requests for doc in lines[1::2]
+            ]
+            self.assertEqual(values, [0, 1, 0, 1, 2])
+
+    def test_spool_errors_do_not_stop_flushing(self):
+        """Documents that cannot be spooled are dropped and flushing goes on."""
+        with tempfile.TemporaryDirectory() as directory:
+            client = UnavailableElasticsearch()
+            indexer = BulkIndexer(
+                client,
+                max_documents=1,
+                flush_interval=60,
+                max_queue_documents=1,
+                retry_policy=RetryPolicy(retries=0, retry_interval=0.05),
+                spool=FullDiskSpool(directory),
+            )
+            indexer.rate_limiter.max_interval = 0.01
+            indexer.start()
+
+            # More bodies than the queue holds, so a dead flush thread would
+            # block the producer for good
+            producer = threading.Thread(
+                target=lambda: [indexer.add_raw(make_body(2), 2) for _ in range(5)]
+            )
+            producer.start()
+            producer.join(5)
+            self.assertFalse(producer.is_alive())
+            deadline = time.monotonic() + 5
+            while (
+                indexer.stats["documents_dropped"] < 10 and time.monotonic() < deadline
+            ):
+                time.sleep(0.01)
+
+            client.down = False
+            indexer.add_raw(make_body(3), 3)
+            indexer.close(5)
+
+            self.assertEqual(indexer.stats["documents_dropped"], 10)
+            self.assertEqual(indexer.stats["documents_failed"], 0)
+            self.assertEqual(indexer.stats["documents_indexed"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
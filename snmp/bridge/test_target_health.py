@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Tests for target health tracking.
+"""
+
+import asyncio
+import unittest
+
+import pytest
+
+from runtime_schema import HealthConfig, RuntimeConfig
+from scheduler import ScrapeScheduler
+from target_health import BreakerState, HealthTracker, get_health_config
+
+
+class TestAdaptiveTimeout(unittest.TestCase):
+    """Test cases for adaptive timeouts."""
+
+    def setUp(self):
+        self.tracker = HealthTracker(
+            HealthConfig(min_samples=5, timeout_multiplier=2.0, min_timeout=0.5)
+        )
+
+    def test_configured_timeout_until_enough_samples(self):
+        """The configured timeout is used until enough latencies are known."""
+        for _ in range(4):
+            self.tracker.record_success("router", 1.0)
+        self.assertEqual(self.tracker.timeout("router", 30), 30)
+
+    def test_timeout_follows_latency(self):
+        """The timeout is a multiple of the latency percentile."""
+        for latency in (1.0, 1.2, 0.8, 1.5, 1.1):
+            self.tracker.record_success("router", latency)
+        self.assertEqual(self.tracker.timeout("router", 30), 3.0)
+
+    def test_timeout_bounds(self):
+        """The timeout stays between min_timeout and the configured timeout."""
+        for _ in range(5):
+            self.tracker.record_success("fast", 0.01)
+            self.tracker.record_success("slow", 20.0)
+        self.assertEqual(self.tracker.timeout("fast", 30), 0.5)
+        self.assertEqual(self.tracker.timeout("slow", 30), 30)
+
+    def test_full_timeout_after_failure(self):
+        """A target whose last scrape failed gets the configured timeout."""
+        for _ in range(5):
+            self.tracker.record_success("router", 1.0)
+        self.tracker.record_failure("router")
+        self.assertEqual(self.tracker.timeout("router", 30), 30)
+
+    def test_disabled(self):
+        """With adaptive timeouts disabled the configured timeout is used."""
+        tracker = HealthTracker(HealthConfig(adaptive_timeout=False, min_samples=1))
+        tracker.record_success("router", 1.0)
+        self.assertEqual(tracker.timeout("router", 30), 30)
+
+
+@pytest.mark.usefixtures("fake_clock")
+class TestCircuitBreaker(unittest.TestCase):
+    """Test cases for the circuit breaker."""
+
+    def setUp(self):
+        self.tracker = HealthTracker(
+            HealthConfig(failure_threshold=3, probe_interval=300), clock=self.clock
+        )
+
+    def fail(self, times):
+        for _ in range(times):
+            self.tracker.record_failure("router")
+
+    def test_opens_after_threshold(self):
+        """Consecutive failures up to the threshold open the breaker."""
+        self.fail(2)
+        self.assertTrue(self.tracker.allow("router"))
+        self.fail(1)
+        self.assertEqual(self.tracker.get("router").state, BreakerState.OPEN)
+        self.assertFalse(self.tracker.allow("router"))
+        self.assertEqual(self.tracker.get("router").trips, 1)
+
+    def test_success_resets_failures(self):
+        """A success in between keeps the breaker closed."""
+        self.fail(2)
+        self.tracker.record_success("router", 1.0)
+        self.fail(2)
+        self.assertEqual(self.tracker.get("router").state, BreakerState.CLOSED)
+
+    def test_probe_closes_breaker(self):
+        """After the probe interval one scrape is let through as a probe."""
+        self.fail(3)
+        self.clock.now += 300
+        self.assertTrue(self.tracker.allow("router"))
+        self.assertFalse(self.tracker.allow("router"))
+        self.tracker.record_success("router", 1.0)
+        self.assertEqual(self.tracker.get("router").state, BreakerState.CLOSED)
+        self.assertTrue(self.tracker.allow("router"))
+
+    def test_failed_probe_waits_again(self):
+        """A failed probe keeps the breaker open for another probe interval."""
+        self.fail(3)
+        self.clock.now += 300
+        self.assertTrue(self.tracker.allow("router"))
+        self.fail(1)
+        self.assertEqual(self.tracker.get("router").state, BreakerState.OPEN)
+        self.clock.now += 299
+        self.assertFalse(self.tracker.allow("router"))
+        self.clock.now += 1
+        self.assertTrue(self.tracker.allow("router"))
+        self.assertEqual(self.tracker.get("router").trips, 1)
+
+    def test_unfinished_probe_is_given_up(self):
+        """A probe that never ends is replaced after the probe interval."""
+        self.fail(3)
+        self.clock.now += 300
+        self.assertTrue(self.tracker.allow("router"))
+        self.clock.now += 299
+        self.assertFalse(self.tracker.allow("router"))
+        self.clock.now += 1
+        self.assertTrue(self.tracker.allow("router"))
+        self.assertEqual(self.tracker.get("router").state, BreakerState.HALF_OPEN)
+
+    def test_retain(self):
+        """Removed targets are forgotten."""
+        self.fail(3)
+        self.tracker.retain(["switch"])
+        self.assertEqual(self.tracker.targets, {})
+
+    def test_defaults(self):
+        """Without health settings the defaults are used."""
+        config = RuntimeConfig.model_validate(
+            {"version": "1.0.0", "exporters": {}, "targets": {}}
+        )
+        self.assertEqual(get_health_config(config), HealthConfig())
+
+
+class TestSchedulerAdmission(unittest.IsolatedAsyncioTestCase):
+    """Test cases for skipping the slots of unresponsive targets."""
+
+    async def test_open_breaker_skips_slots(self):
+        """A dead target is not scraped while healthy targets keep their slots."""
+        config = RuntimeConfig.model_validate(
+            {
+                "version": "1.0.0",
+                "exporters": {
+                    "snmp_exporter": {"type": "snmp", "url": "http://localhost:9116"}
+                },
+                "targets": {
+                    name: {
+                        "exporter": "snmp_exporter",
+                        "interval": 1,
+                        "metrics": [{"name": "sysUpTime", "path": "sysUpTime"}],
+                    }
+                    for name in ("alive", "dead")
+                },
+            }
+        )
+        tracker = HealthTracker(HealthConfig(failure_threshold=1, probe_interval=60))
+        counts = {"alive": 0, "dead": 0}
+
+        async def scrape(target_name):
+            counts[target_name] += 1
+            if target_name == "dead":
+                tracker.record_failure(target_name)
+            else:
+                tracker.record_success(target_name, 0.01)
+
+        scheduler = ScrapeScheduler(config, scrape, admit=tracker.allow)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(3.5)
+        scheduler.stop()
+        await task
+
+        self.assertGreaterEqual(counts["alive"], 3)
+        self.assertEqual(counts["dead"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Tests for stage tracing and profiling.
+"""
+
+import json
+import os
+import pstats
+import random
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+from bulk_indexer import BulkIndexer
+from runtime_schema import ProfilerKind
+from test_bulk_indexer import FakeElasticsearch
+from tracing import (
+    ElasticsearchTraceExporter,
+    JsonLinesTraceExporter,
+    SignalProfiler,
+    Tracer,
+    pyinstrument,
+)
+
+
+def work_in_thread():
+    """Work done outside the main thread, as in `asyncio.to_thread`."""
+    thread = threading.Thread(target=lambda: sum(i * i for i in range(200000)))
+    thread.start()
+    thread.join()
+
+
+def wait_for(condition, seconds=5.0):
+    """Wait until a condition holds, for up to `seconds`."""
+    deadline = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class ListExporter:
+    """Trace exporter that keeps the documents in a list."""
+
+    def __init__(self):
+        self.documents = []
+
+    def export(self, document):
+        self.documents.append(document)
+
+    def close(self):
+        pass
+
+
+class TestTracer(unittest.TestCase):
+    """Test cases for Tracer."""
+
+    def test_sampled_trace_is_exported(self):
+        """A sampled trace is exported with its spans in order."""
+        exporter = ListExporter()
+        tracer = Tracer(1.0, [exporter])
+        with tracer.trace("scrape", target="router") as trace:
+            with trace.span("fetch"):
+                pass
+            with trace.span("parse"):
+                pass
+            trace.add_span("build", 0.5)
+
+        document = exporter.documents[0]
+        self.assertEqual(document["trace"], "scrape")
+        self.assertEqual(document["attributes"], {"target": "router"})
+        # Spans are ordered by start; an added span ends when it is added
+        self.assertEqual(
+            [span["name"] for span in document["spans"]],
+            ["build", "fetch", "parse"],
+        )
+        self.assertEqual(trace.stage_seconds("build"), 0.5)
+        self.assertGreaterEqual(document["duration_ms"], 0)
+
+    def test_unsampled_traces_are_timed_but_not_exported(self):
+        """With a sample rate of 0 traces still time their stages."""
+        exporter = ListExporter()
+        tracer = Tracer(0.0, [exporter])
+        with tracer.trace("scrape") as trace:
+            with trace.span("fetch") as span:
+                pass
+        self.assertEqual(exporter.documents, [])
+        self.assertEqual(trace.stage_seconds("fetch"), span.duration)
+
+    def test_sample_rate(self):
+        """About `sample_rate` of the traces are exported."""
+        exporter = ListExporter()
+        tracer = Tracer(0.1, [exporter], rng=random.Random(3))
+        for _ in range(2000):
+            with tracer.trace("scrape"):
+                pass
+        self.assertLess(abs(len(exporter.documents) - 200), 60)
+
+    def test_errors_are_recorded(self):
+        """A trace ended by an exception records the error."""
+        exporter = ListExporter()
+        tracer = Tracer(1.0, [exporter])
+        with self.assertRaises(ValueError):
+            with tracer.trace("scrape"):
+                raise ValueError("bad response")
+        self.assertEqual(exporter.documents[0]["error"], "ValueError: bad response")
+
+    def test_record(self):
+        """Operations timed elsewhere become single-span traces."""
+        exporter = ListExporter()
+        Tracer(1.0, [exporter]).record("bulk_flush", 0.25, documents=10)
+        document = exporter.documents[0]
+        self.assertEqual(document["duration_ms"], 250.0)
+        self.assertEqual(document["attributes"], {"documents": 10})
+        self.assertEqual(document["spans"][0]["name"], "bulk_flush")
+
+
+class TestTraceExporters(unittest.TestCase):
+    """Test cases for the trace exporters."""
+
+    def test_json_lines(self):
+        """Traces are appended to the file as JSON lines."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.jsonl")
+            tracer = Tracer(1.0, [JsonLinesTraceExporter(path)])
+            for target in ("a", "b"):
+                with tracer.trace("scrape", target=target):
+                    pass
+            tracer.close()
+
+            with open(path) as f:
+                documents = [json.loads(line) for line in f]
+        self.assertEqual([d["attributes"]["target"] for d in documents], ["a", "b"])
+
+    def test_elasticsearch_drops_when_queue_is_full(self):
+        """Traces are queued for indexing and dropped when the queue is full."""
+        indexer = BulkIndexer(FakeElasticsearch(), max_queue_documents=1)
+        exporter = ElasticsearchTraceExporter(indexer, "snmp-bridge-traces")
+        exporter.export({"trace": "scrape"})
+        exporter.export({"trace": "scrape"})
+        self.assertEqual(indexer.queue_depth, 1)
+        self.assertEqual(exporter.dropped, 1)
+
+
+class TestSignalProfiler(unittest.TestCase):
+    """Test cases for SignalProfiler."""
+
+    def test_capture(self):
+        """Toggling twice writes a cProfile capture."""
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = SignalProfiler(directory, ProfilerKind.CPROFILE)
+            self.assertIsNone(profiler.toggle())
+            self.assertTrue(profiler.active)
+            sum(i * i for i in range(10000))
+            path = profiler.toggle()
+            self.assertFalse(profiler.active)
+            self.assertTrue(path.endswith(".pstats"))
+            self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+    def test_capture_stops_by_itself(self):
+        """A capture stops after `max_seconds`."""
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = SignalProfiler(directory, max_seconds=0.01)
+            profiler.start()
+            profiler._timer.join()
+            self.assertFalse(profiler.active)
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_capture_covers_other_threads(self):
+        """Work in other threads is in a cProfile capture."""
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = SignalProfiler(directory, ProfilerKind.CPROFILE)
+            profiler.start()
+            work_in_thread()
+            stats = pstats.Stats(profiler.stop())
+            functions = {function for _, _, function in stats.stats}
+            self.assertIn("<lambda>", functions)
+
+    @unittest.skipIf(pyinstrument is None, "pyinstrument is not installed")
+    def test_pyinstrument_covers_other_threads(self):
+        """A pyinstrument report samples the stacks of other threads."""
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = SignalProfiler(directory, ProfilerKind.PYINSTRUMENT)
+            profiler.start()
+            work_in_thread()
+            path = profiler.stop()
+            self.assertTrue(path.endswith(".html"))
+            with open(path, encoding="utf-8") as f:
+                self.assertIn("work_in_thread", f.read())
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR2"), "signals are unavailable")
+    def test_signal_toggles_capture(self):
+        """The control thread starts and stops captures on signals."""
+        previous = signal.getsignal(signal.SIGUSR2)
+        self.addCleanup(signal.signal, signal.SIGUSR2, previous)
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = SignalProfiler(directory)
+            self.assertTrue(profiler.install(signal.SIGUSR2))
+            os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertTrue(wait_for(lambda: profiler.active))
+            os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertTrue(wait_for(lambda: os.listdir(directory)))
+            self.assertFalse(profiler.active)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Stage tracing and profiling for the SNMP Bridge.
+This module times the stages of each scrape (fetch, parse, document build,
+queueing) and of each bulk flush, writes a sample of these traces as JSON
+lines or to Elasticsearch, and captures a profile of the running bridge on
+demand when it receives a signal.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from runtime_schema import ProfilerKind, RuntimeConfig, TracingConfig
+
+try:
+    import pyinstrument
+    from pyinstrument.renderers import HTMLRenderer
+    from pyinstrument.session import Session
+except ImportError:
+    pyinstrument = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+def get_tracing_config(config: RuntimeConfig) -> TracingConfig:
+    """Get the tracing settings, or the defaults (no sampling)."""
+    if config.global_ and config.global_.tracing:
+        return config.global_.tracing
+    return TracingConfig()
+
+
+class Span:
+    """Timer for one stage of a trace, used as a context manager."""
+
+    __slots__ = ("trace", "name", "start", "duration")
+
+    def __init__(self, trace: "Trace", name: str):
+        self.trace = trace
+        self.name = name
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.duration = time.perf_counter() - self.start
+        self.trace.spans.append(self)
+        return False
+
+
+class Trace:
+    """
+    Stage timings of one scrape or flush, used as a context manager.
+
+    Every trace is timed, so its stage durations can feed metrics; only
+    sampled traces are exported when they end. Spans may be recorded from
+    other threads, such as stages run with `asyncio.to_thread`.
+    """
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        sampled: bool,
+        attributes: Dict[str, Any],
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.sampled = sampled
+        self.attributes = attributes
+        self.spans: List[Span] = []
+        self.start = 0.0
+        self.duration = 0.0
+        self.error: Optional[str] = None
+        self._started_at = 0.0
+
+    def __enter__(self) -> "Trace":
+        self._started_at = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.duration = time.perf_counter() - self.start
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        if self.sampled:
+            self.tracer.export(self)
+        return False
+
+    def span(self, name: str) -> Span:
+        """Time a stage: `with trace.span("parse"): ...`."""
+        return Span(self, name)
+
+    def add_span(self, name: str, seconds: float) -> None:
+        """Record a stage timed elsewhere, as ending now."""
+        span = Span(self, name)
+        span.duration = seconds
+        span.start = time.perf_counter() - seconds
+        self.spans.append(span)
+
+    def stage_seconds(self, name: str) -> float:
+        """Total time of the spans with a name."""
+        return sum(span.duration for span in self.spans if span.name == name)
+
+    def to_document(self) -> Dict[str, Any]:
+        """Convert the trace to a JSON-serializable document."""
+        document = {
+            "@timestamp": datetime.fromtimestamp(
+                self._started_at, tz=timezone.utc
+            ).isoformat(),
+            "trace": self.name,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": round((span.start - self.start) * 1000, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                }
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ],
+        }
+        if self.error:
+            document["error"] = self.error
+        return document
+
+
+class JsonLinesTraceExporter:
+    """Append traces to a file, one JSON document per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, document: Dict[str, Any]) -> None:
+        line = json.dumps(document, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class ElasticsearchTraceExporter:
+    """
+    Index traces through the bulk indexer.
+
+    Traces are offered to the bulk queue without blocking and dropped while
+    it is full, so tracing never holds up scrapes or flushes.
+    """
+
+    def __init__(self, bulk_indexer, index_name: str):
+        self.bulk_indexer = bulk_indexer
+        self.index_name = index_name
+        self.dropped = 0
+
+    def export(self, document: Dict[str, Any]) -> None:
+        if not self.bulk_indexer.offer(self.index_name, document):
+            self.dropped += 1
+
+    def close(self) -> None:
+        pass
+
+
+class Tracer:
+    """
+    Start traces and export a sample of them.
+
+    Each trace is sampled with probability `sample_rate` when it starts, and
+    sampled traces are passed to every exporter as a document. With a sample
+    rate of 0 or no exporters, nothing is exported.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        exporters: Iterable = (),
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Initialize the tracer.
+
+        Args:
+            sample_rate: Fraction of traces to export, from 0 to 1
+            exporters: Objects with `export(document)` and `close()` methods
+            rng: Random number generator for sampling
+        """
+        self.exporters = list(exporters)
+        self.sample_rate = sample_rate if self.exporters else 0.0
+        self._rng = rng or random.Random()
+
+    def trace(self, name: str, **attributes) -> Trace:
+        """Start a trace, such as `with tracer.trace("scrape", target=name):`."""
+        sampled = self.sample_rate > 0 and self._rng.random() < self.sample_rate
+        return Trace(self, name, sampled, attributes)
+
+    def record(self, name: str, seconds: float, **attributes) -> None:
+        """Record an operation timed elsewhere as a trace with one span."""
+        if not (self.sample_rate > 0 and self._rng.random() < self.sample_rate):
+            return
+        trace = Trace(self, name, True, attributes)
+        trace._started_at = time.time() - seconds
+        trace.start = time.perf_counter() - seconds
+        trace.duration = seconds
+        trace.add_span(name, seconds)
+        self.export(trace)
+
+    def export(self, trace: Trace) -> None:
+        """Pass a finished trace to the exporters."""
+        document = trace.to_document()
+        for exporter in self.exporters:
+            try:
+                exporter.export(document)
+            except Exception as e:
+                logger.warning(f"Failed to export trace: {str(e)}")
+
+    def close(self) -> None:
+        """Close the exporters."""
+        for exporter in self.exporters:
+            exporter.close()
+
+
+def create_tracer(tracing: TracingConfig, bulk_indexer=None) -> Tracer:
+    """Create a tracer with the exporters in the tracing settings."""
+    exporters = []
+    if tracing.path:
+        exporters.append(JsonLinesTraceExporter(tracing.path))
+    if tracing.index and bulk_indexer is not None:
+        exporters.append(ElasticsearchTraceExporter(bulk_indexer, tracing.index))
+    if exporters and tracing.sample_rate:
+        logger.info(f"Tracing {tracing.sample_rate:.1%} of scrapes and flushes")
+    return Tracer(tracing.sample_rate, exporters)
+
+
+class ThreadSampler:
+    """
+    Sample the stacks of every thread with `sys._current_frames()`.
+
+    pyinstrument only samples the thread that starts it, so its report would
+    miss the stages run with `asyncio.to_thread` and the bulk flushes. This
+    sampler runs in its own thread and records the stacks of all other
+    threads, in the session format pyinstrument saves and renders.
+    """
+
+    def __init__(self, interval: float = 0.001):
+        """
+        Initialize the sampler.
+
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        self._frame_records: List[Tuple[List[str], float]] = []
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_call_stack: List[str] = []
+        self._start_time = 0.0
+        self._start_cpu = 0.0
+
+    def start(self) -> None:
+        """Start sampling."""
+        thread = threading.current_thread()
+        self._start_call_stack = self._call_stack(
+            thread.name, thread.ident, sys._getframe(1)
+        )
+        self._start_time = time.time()
+        self._start_cpu = time.process_time()
+        self._thread = threading.Thread(
+            target=self._run, name="thread-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> Dict[str, Any]:
+        """Stop sampling and return the samples as a pyinstrument session."""
+        self._stopping.set()
+        self._thread.join()
+        duration = time.time() - self._start_time
+        return {
+            "frame_records": self._frame_records,
+            "start_time": self._start_time,
+            "duration": duration,
+            "min_interval": self.interval,
+            "max_interval": self.interval,
+            "sample_count": len(self._frame_records),
+            "start_call_stack": self._start_call_stack,
+            "target_description": f"SNMP Bridge process {os.getpid()}",
+            "cpu_time": time.process_time() - self._start_cpu,
+        }
+
+    def _run(self) -> None:
+        """Record the stack of every other thread until stopped."""
+        own_ident = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stopping.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    self._frame_records.append(
+                        (self._call_stack(names.get(ident, "?"), ident, frame), elapsed)
+                    )
+
+    @staticmethod
+    def _call_stack(thread_name: str, ident: int, frame) -> List[str]:
+        """Frames of a stack from the root, each as `function\\0file\\0line`."""
+        call_stack = []
+        while frame is not None:
+            code = frame.f_code
+            call_stack.append(
+                f"{code.co_qualname}\x00{code.co_filename}\x00{code.co_firstlineno}"
+            )
+            frame = frame.f_back
+        # pyinstrument groups the stacks of each thread under a thread frame
+        call_stack.append(f"{thread_name}\x00<thread>\x00{ident}")
+        call_stack.reverse()
+        return call_stack
+
+
+class SignalProfiler:
+    """
+    Capture a profile of the bridge when a signal arrives.
+
+    The first signal starts a profiler and the next one stops it and writes
+    the result to `output_dir`: a `.pstats` file from cProfile, readable
+    with `python -m pstats`, or an HTML report from pyinstrument. A capture
+    stops by itself after `max_seconds`. pyinstrument is optional; cProfile
+    is used if it is not installed.
+
+    Both profilers cover every thread, not only the event loop: cProfile is
+    process-wide since Python 3.12, and the pyinstrument report is built
+    from a `ThreadSampler`. The signal handler only writes a byte to a pipe;
+    a control thread reads it and starts or stops the capture, so the
+    handler never waits on a lock held by the code it interrupted.
+    """
+
+    def __init__(
+        self,
+        output_dir: Optional[str] = None,
+        profiler: ProfilerKind = ProfilerKind.CPROFILE,
+        max_seconds: float = 60.0,
+    ):
+        """
+        Initialize the profiler.
+
+        Args:
+            output_dir: Directory for captures; the temporary directory if None
+            profiler: Profiler to use
+            max_seconds: Seconds after which a capture stops by itself
+        """
+        self.output_dir = output_dir or tempfile.gettempdir()
+        if profiler == ProfilerKind.PYINSTRUMENT and pyinstrument is None:
+            logger.warning("pyinstrument is not installed, profiling with cProfile")
+            profiler = ProfilerKind.CPROFILE
+        self.profiler = profiler
+        self.max_seconds = max_seconds
+        self._active = None
+        self._timer: Optional[threading.Timer] = None
+        self._wakeup: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """Whether a capture is running."""
+        return self._active is not None
+
+    def install(self, signum: int = getattr(signal, "SIGUSR2", 0)) -> bool:
+        """Toggle captures on a signal. Returns False if signals are unavailable."""
+        if not signum:
+            return False
+        read_fd, self._wakeup = os.pipe()
+        threading.Thread(
+            target=self._control, args=(read_fd,), name="signal-profiler", daemon=True
+        ).start()
+        signal.signal(signum, self._on_signal)
+        logger.info(
+            f"Send signal {signal.Signals(signum).name} to process {os.getpid()} "
+            f"to start or stop a {self.profiler.value} capture"
+        )
+        return True
+
+    def _on_signal(self, signum, frame) -> None:
+        """Wake the control thread; writing to a pipe is safe in a handler."""
+        try:
+            os.write(self._wakeup, b"\0")
+        except BlockingIOError:
+            # The control thread has toggles pending already
+            pass
+
+    def _control(self, read_fd: int) -> None:
+        """Toggle a capture for each signal, outside the signal handler."""
+        while os.read(read_fd, 1):
+            try:
+                self.toggle()
+            except Exception as e:
+                logger.error(
+                    f"Failed to toggle {self.profiler.value} capture: {str(e)}"
+                )
+
+    def toggle(self) -> Optional[str]:
+        """Start a capture, or stop the running one and return its file."""
+        if self._active is None:
+            self.start()
+            return None
+        return self.stop()
+
+    def start(self) -> None:
+        """Start a capture."""
+        with self._lock:
+            if self._active is not None:
+                return
+            if self.profiler == ProfilerKind.PYINSTRUMENT:
+                self._active = ThreadSampler()
+                self._active.start()
+            else:
+                self._active = cProfile.Profile()
+                self._active.enable()
+            self._timer = threading.Timer(self.max_seconds, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+        logger.info(f"Started {self.profiler.value} capture")
+
+    def stop(self) -> Optional[str]:
+        """Stop the running capture and write it out. Returns the file name."""
+        with self._lock:
+            active, self._active = self._active, None
+            if active is None:
+                return None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            base = os.path.join(self.output_dir, f"snmp-bridge-{os.getpid()}-{stamp}")
+            if isinstance(active, cProfile.Profile):
+                active.disable()
+                path = f"{base}.pstats"
+                active.dump_stats(path)
+            else:
+                session = Session.from_json(active.stop())
+                path = f"{base}.html"
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(HTMLRenderer().render(session))
+        logger.info(f"Wrote {self.profiler.value} capture to {path}")
+        return path